@@ -0,0 +1,105 @@
+"""Fixed synthetic datasets for the benchmarks (seeded, so every run sees the same data)."""
+import io
+import random
+from datetime import datetime, timedelta
+from typing import Any, Dict, List
+
+FIRST_NAMES = ["Ana", "Carlos", "María José", "Luis", "Valentina", "Andrés", "Camila", "Juan Pablo"]
+LAST_NAMES = ["Gómez", "Rodríguez", "Martínez", "López", "Hernández", "Pérez", "Ramírez"]
+
+TEMPLATE = {
+    "id": "1",
+    "name": "promo_video",
+    "language": "es_CO",
+    "status": "APPROVED",
+    "components": [
+        {"type": "HEADER", "format": "VIDEO"},
+        {"type": "BODY", "text": "Hola {{nombre}}, {{empresa}} te invita. Tu cargo: {{cargo}}."},
+    ],
+}
+
+TEMPLATE_MAPPING = {"nombre": "name", "empresa": "company", "cargo": "position"}
+
+MESSAGE = "Hola {{primer_nombre}}, tu cita en {{empresa|OWO}} es el {{fecha}}. Escríbenos a {{email}}."
+
+
+def _rng(seed: int) -> random.Random:
+    return random.Random(seed)
+
+
+def recipients(count: int, seed: int = 1) -> List[Dict[str, Any]]:
+    """Recipients with the fields used by message and template variables."""
+    rng = _rng(seed)
+    return [
+        {
+            "name": f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+            "phone": f"+57300{i:07d}",
+            "email": f"contacto{i}@example.com" if i % 5 else None,
+            "company": "OWO" if i % 2 else "",
+            "position": "Asesor" if i % 3 else "",
+            "fecha": f"{1 + i % 28:02d}/10/2026",
+        }
+        for i in range(count)
+    ]
+
+
+def owo_contacts(count: int, seed: int = 2) -> List[Dict[str, Any]]:
+    """Raw OWO API contacts with the value variants transform_owo_contact handles."""
+    rng = _rng(seed)
+    is_customer_values = [True, False, "true", "false", "Sí", 1, 0, None]
+    contacts = []
+    for i in range(count):
+        first = rng.choice(FIRST_NAMES)
+        last = rng.choice(LAST_NAMES)
+        kind = i % 4
+        contacts.append({
+            "name": first,
+            "lastName": last,
+            "fullName": f"{first} {last}" if kind != 1 else "",
+            "customerName": f"{first} {last} S.A.S." if kind == 0 else None,
+            "phoneNumber": f"300{i:07d}" if i % 7 else f"+57310{i:07d}",
+            "email": f"{first.split()[0].lower()}{i}@example.com" if i % 3 else None,
+            "isCustomer": is_customer_values[i % len(is_customer_values)],
+            "state": "N" if i % 13 == 0 else "A",
+        })
+    return contacts
+
+
+def message_logs(count: int, batch_id: str = "bench-batch", seed: int = 3) -> List[Dict[str, Any]]:
+    """MessageLog column values over the last 30 days, across channels and statuses."""
+    rng = _rng(seed)
+    start = datetime(2026, 1, 1)
+    channels = ["whatsapp", "email", "sms", "both"]
+    statuses = ["sent", "sent", "sent", "failed", "pending"]
+    rows = []
+    for i in range(count):
+        channel = channels[i % len(channels)]
+        rows.append({
+            "recipient_name": f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+            "recipient_phone": f"+57300{i:07d}",
+            "recipient_email": f"contacto{i}@example.com",
+            "subject": None if channel == "whatsapp" and i % 2 else "Mensaje",
+            "message_content": "Template: promo_video" if channel == "whatsapp" else "Hola, este es un mensaje",
+            "channel": channel,
+            "status": statuses[i % len(statuses)],
+            "sent_at": start + timedelta(seconds=rng.randint(0, 30 * 86400)),
+            "attachments": [],
+            "batch_id": batch_id,
+        })
+    return rows
+
+
+def excel_contacts(count: int, seed: int = 4) -> bytes:
+    """An .xlsx with the columns upload_excel expects (nombre, telefono, correo)."""
+    from openpyxl import Workbook
+
+    rng = _rng(seed)
+    wb = Workbook()
+    ws = wb.active
+    ws.append(["Nombre", "Teléfono", "Correo"])
+    for i in range(count):
+        phone = f"300{i:07d}" if i % 4 else f"+57 300 {i:07d}"
+        ws.append([f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}", phone, f"contacto{i}@example.com"])
+    stream = io.BytesIO()
+    wb.save(stream)
+    return stream.getvalue()
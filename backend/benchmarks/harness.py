@@ -0,0 +1,119 @@
+"""
+Minimal benchmark harness: timed cases, stored baselines and regression checks.
+
+A case is a (sync or async) function run `repeat` times after an untimed
+`setup`; its median time is compared with the baseline stored in
+baseline.json for the same name and size. Times are machine dependent, so
+the baseline should be refreshed (--update-baseline) on the machine that
+runs the comparison.
+"""
+import contextlib
+import inspect
+import io
+import json
+import os
+import platform
+import statistics
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+
+class Case:
+    """One benchmark: `run` is timed, `setup` (optional) runs before every repetition."""
+
+    def __init__(
+        self,
+        name: str,
+        run: Callable[[], Any],
+        size: int,
+        setup: Optional[Callable[[], Any]] = None,
+        repeat: int = 5
+    ):
+        self.name = name
+        self.run = run
+        self.size = size
+        self.setup = setup
+        self.repeat = repeat
+
+
+async def _call(fn: Callable[[], Any]) -> Any:
+    result = fn()
+    if inspect.isawaitable(result):
+        result = await result
+    return result
+
+
+async def measure(case: Case) -> Dict[str, Any]:
+    """Time a case; output printed by the code under test is discarded."""
+    timings: List[float] = []
+    for _ in range(case.repeat):
+        if case.setup:
+            await _call(case.setup)
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            await _call(case.run)
+            timings.append(time.perf_counter() - start)
+    median = statistics.median(timings)
+    return {
+        "size": case.size,
+        "median_s": round(median, 6),
+        "min_s": round(min(timings), 6),
+        "per_item_us": round(median / max(case.size, 1) * 1e6, 3)
+    }
+
+
+def load_baseline(path: str = BASELINE_PATH) -> Dict[str, Any]:
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_baseline(results: Dict[str, Dict[str, Any]], path: str = BASELINE_PATH):
+    data = load_baseline(path)
+    data.setdefault("results", {}).update(results)
+    data["machine"] = {"python": platform.python_version(), "platform": platform.platform()}
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+async def run_cases(cases: List[Case], tolerance: float, update_baseline: bool = False) -> int:
+    """
+    Run the cases and print them next to the baseline.
+
+    Returns the number of regressions: cases whose median is more than
+    `tolerance` (a fraction) slower than a baseline measured at the same size.
+    """
+    baseline = load_baseline().get("results", {})
+    results: Dict[str, Dict[str, Any]] = {}
+    regressions = 0
+
+    print(f"{'benchmark':38} {'size':>8} {'median':>10} {'per item':>12} {'baseline':>10} {'change':>8}")
+    for case in cases:
+        result = await measure(case)
+        results[case.name] = result
+
+        reference = baseline.get(case.name)
+        change = ""
+        base_text = "-"
+        if reference and reference.get("size") == case.size:
+            base_text = f"{reference['median_s'] * 1000:8.1f}ms"
+            ratio = result["median_s"] / reference["median_s"] - 1 if reference["median_s"] else 0.0
+            change = f"{ratio:+.0%}"
+            if ratio > tolerance:
+                change += " !"
+                regressions += 1
+        print(
+            f"{case.name:38} {case.size:>8} {result['median_s'] * 1000:8.1f}ms "
+            f"{result['per_item_us']:9.2f} us {base_text:>10} {change:>8}"
+        )
+
+    if update_baseline:
+        save_baseline(results)
+        print(f"\nBaseline updated: {BASELINE_PATH}")
+    elif regressions:
+        print(f"\n{regressions} regression(s) above {tolerance:.0%}")
+    return regressions
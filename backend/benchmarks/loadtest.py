@@ -0,0 +1,369 @@
+"""
+End-to-end API load test with throughput and latency reports.
+
+Drives the send, callback, history and contacts endpoints with concurrent
+closed-loop clients and reports, per scenario: requests/sec, p50/p95/p99
+latency per endpoint, event-loop lag of the backend worker (from
+/health/event-loop) and SQLite lock wait. Lock wait is measured by a probe
+that repeatedly takes the database write lock (BEGIN IMMEDIATE) from a
+separate connection, i.e. the time a new writer has to wait.
+
+By default it starts the mock upstreams and one backend worker on a scratch
+database, so nothing real is called. Use --base-url (and --db-path for the
+lock probe) to target an instance that is already running.
+
+Usage:
+    python benchmarks/loadtest.py
+    python benchmarks/loadtest.py --scenario dashboard --concurrency 50 --duration 30
+    python benchmarks/loadtest.py --scenario campaign_plus_dashboard --campaign-size 100000
+    python benchmarks/loadtest.py --base-url http://localhost:8001 --db-path ./messaging.db
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+Request = Callable[[httpx.AsyncClient, "Context"], Awaitable[httpx.Response]]
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, math.ceil(fraction * len(ordered)) - 1))
+    return ordered[index]
+
+
+class Context:
+    """Per-run state shared by the request builders."""
+
+    def __init__(self, recipients: int, campaign_size: int):
+        self.recipients = recipients
+        self.campaign_size = campaign_size
+        self.sequence = 0
+        self.callback_batch: Optional[str] = None
+        self.callback_phones: List[str] = []
+
+    def next_recipients(self, count: int) -> List[Dict[str, Any]]:
+        """Unique phones per request, so idempotency and callbacks see distinct recipients."""
+        start = self.sequence
+        self.sequence += count
+        return [
+            {"name": f"Carga {i}", "phone": f"+57320{i % 10 ** 7:07d}", "email": f"carga{i}@example.com", "company": "OWO"}
+            for i in range(start, start + count)
+        ]
+
+
+async def send_bulk_messages(client: httpx.AsyncClient, ctx: Context) -> httpx.Response:
+    return await client.post("/messages/send-bulk", json={
+        "content": "Hola {{nombre}}, prueba de carga",
+        "channel": "whatsapp",
+        "recipients": ctx.next_recipients(ctx.recipients)
+    })
+
+
+async def whatsapp_send_template(client: httpx.AsyncClient, ctx: Context) -> httpx.Response:
+    return await client.post("/whatsapp/send-template", json={
+        "template_name": "plantilla_0",
+        "recipients": ctx.next_recipients(ctx.recipients)
+    })
+
+
+async def sms_send_bulk(client: httpx.AsyncClient, ctx: Context) -> httpx.Response:
+    return await client.post("/sms/send-bulk", json={
+        "message": "Prueba de carga",
+        "recipients": ctx.next_recipients(ctx.recipients)
+    })
+
+
+async def messages_callback(client: httpx.AsyncClient, ctx: Context) -> httpx.Response:
+    phones = random.sample(ctx.callback_phones, min(50, len(ctx.callback_phones)))
+    return await client.post("/messages/callback", json={
+        "batch_id": ctx.callback_batch,
+        "results": [{"phone": phone, "success": random.random() > 0.1} for phone in phones]
+    })
+
+
+async def history_page(client: httpx.AsyncClient, ctx: Context) -> httpx.Response:
+    return await client.get("/history", params={"limit": 50, "offset": random.choice([0, 50, 500])})
+
+
+async def history_stats(client: httpx.AsyncClient, ctx: Context) -> httpx.Response:
+    return await client.get("/history/stats")
+
+
+async def history_count(client: httpx.AsyncClient, ctx: Context) -> httpx.Response:
+    return await client.get("/history/count")
+
+
+async def contacts_search(client: httpx.AsyncClient, ctx: Context) -> httpx.Response:
+    return await client.get("/contacts", params={"search": random.choice(["cliente", "300", "apellido1"]), "limit": 100})
+
+
+async def prepare_callback_batch(client: httpx.AsyncClient, ctx: Context):
+    """Create a batch whose pending rows the callback scenario reconciles."""
+    recipients = ctx.next_recipients(max(ctx.recipients, 500))
+    response = await client.post("/messages/send-bulk", json={
+        "content": "Lote para callbacks", "channel": "whatsapp", "recipients": recipients
+    })
+    response.raise_for_status()
+    ctx.callback_batch = response.json()["batch_id"]
+    ctx.callback_phones = [r["phone"] for r in recipients]
+
+
+async def send_campaign(client: httpx.AsyncClient, ctx: Context) -> httpx.Response:
+    """One large campaign through n8n; the mock reports it back through /messages/callback."""
+    return await client.post("/messages/send-bulk", json={
+        "content": "Hola {{nombre}}, campana de carga",
+        "channel": "whatsapp",
+        "recipients": ctx.next_recipients(ctx.campaign_size)
+    }, timeout=600)
+
+
+DASHBOARD = [(3, "GET /history", history_page), (1, "GET /history/stats", history_stats),
+             (1, "GET /history/count", history_count), (2, "GET /contacts", contacts_search)]
+
+# name -> (weighted requests, setup, one-off background request)
+SCENARIOS: Dict[str, Tuple[List[Tuple[int, str, Request]], Optional[Callable], Optional[Request]]] = {
+    "messages_send_bulk": ([(1, "POST /messages/send-bulk", send_bulk_messages)], None, None),
+    "whatsapp_send_template": ([(1, "POST /whatsapp/send-template", whatsapp_send_template)], None, None),
+    "sms_send_bulk": ([(1, "POST /sms/send-bulk", sms_send_bulk)], None, None),
+    "callback": ([(1, "POST /messages/callback", messages_callback)], prepare_callback_batch, None),
+    "dashboard": (DASHBOARD, None, None),
+    "mixed": (
+        [(2, "POST /messages/send-bulk", send_bulk_messages), (1, "POST /whatsapp/send-template", whatsapp_send_template),
+         (1, "POST /sms/send-bulk", sms_send_bulk), (2, "POST /messages/callback", messages_callback)] + DASHBOARD,
+        prepare_callback_batch,
+        None
+    ),
+    "campaign_plus_dashboard": (DASHBOARD, None, send_campaign),
+}
+
+
+class LockProbe:
+    """Measures how long a new writer waits for the SQLite write lock."""
+
+    def __init__(self, db_path: str, interval: float = 0.25):
+        self.db_path = db_path
+        self.interval = interval
+        self.waits: List[float] = []
+        self.timeouts = 0
+
+    def _probe(self, conn: sqlite3.Connection):
+        start = time.perf_counter()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+        except sqlite3.OperationalError:
+            self.timeouts += 1
+            return
+        self.waits.append(time.perf_counter() - start)
+        conn.execute("ROLLBACK")
+
+    async def run(self, stop: asyncio.Event):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None, check_same_thread=False)
+        try:
+            while not stop.is_set():
+                await asyncio.to_thread(self._probe, conn)
+                try:
+                    await asyncio.wait_for(stop.wait(), self.interval)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            conn.close()
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "samples": len(self.waits),
+            "p50_ms": round(percentile(self.waits, 0.50) * 1000, 2),
+            "p95_ms": round(percentile(self.waits, 0.95) * 1000, 2),
+            "max_ms": round(max(self.waits, default=0) * 1000, 2),
+            "timeouts": self.timeouts
+        }
+
+
+async def run_scenario(client: httpx.AsyncClient, name: str, args) -> Dict[str, Any]:
+    requests, setup, background = SCENARIOS[name]
+    ctx = Context(args.recipients, args.campaign_size)
+    if setup:
+        await setup(client, ctx)
+
+    latencies: Dict[str, List[float]] = {label: [] for _, label, _ in requests}
+    errors: Dict[str, int] = {label: 0 for _, label, _ in requests}
+    weights = [weight for weight, _, _ in requests]
+
+    async def timed(label: str, request: Request):
+        start = time.perf_counter()
+        try:
+            response = await request(client, ctx)
+            failed = response.status_code >= 400
+        except httpx.HTTPError:
+            failed = True
+        latencies.setdefault(label, []).append(time.perf_counter() - start)
+        if failed:
+            errors[label] = errors.get(label, 0) + 1
+
+    async def worker(deadline: float):
+        while time.monotonic() < deadline:
+            _, label, request = random.choices(requests, weights=weights)[0]
+            await timed(label, request)
+
+    stop = asyncio.Event()
+    probe = LockProbe(args.db_path) if args.db_path else None
+    probe_task = asyncio.create_task(probe.run(stop)) if probe else None
+    since = time.time()
+    started = time.monotonic()
+    deadline = started + args.duration
+
+    tasks = [asyncio.create_task(worker(deadline)) for _ in range(args.concurrency)]
+    if background:
+        tasks.append(asyncio.create_task(timed("campaign", background)))
+    await asyncio.gather(*tasks)
+    elapsed = time.monotonic() - started
+
+    stop.set()
+    if probe_task:
+        await probe_task
+    loop_lag = (await client.get("/health/event-loop", params={"since": since})).json()
+
+    endpoints = {}
+    for label, values in latencies.items():
+        if not values:
+            continue
+        endpoints[label] = {
+            "requests": len(values),
+            "errors": errors.get(label, 0),
+            "req_per_s": round(len(values) / elapsed, 2),
+            "p50_ms": round(percentile(values, 0.50) * 1000, 1),
+            "p95_ms": round(percentile(values, 0.95) * 1000, 1),
+            "p99_ms": round(percentile(values, 0.99) * 1000, 1)
+        }
+    total = sum(len(values) for values in latencies.values())
+    return {
+        "duration_s": round(elapsed, 1),
+        "concurrency": args.concurrency,
+        "requests": total,
+        "req_per_s": round(total / elapsed, 2),
+        "endpoints": endpoints,
+        "event_loop_lag": loop_lag,
+        "sqlite_lock_wait": probe.summary() if probe else None
+    }
+
+
+def print_report(name: str, report: Dict[str, Any]):
+    print(f"\n== {name}: {report['requests']} requests in {report['duration_s']}s "
+          f"({report['req_per_s']} req/s, concurrency {report['concurrency']})")
+    print(f"  {'endpoint':30} {'requests':>9} {'errors':>7} {'req/s':>8} {'p50':>9} {'p95':>9} {'p99':>9}")
+    for label, stats in report["endpoints"].items():
+        print(f"  {label:30} {stats['requests']:>9} {stats['errors']:>7} {stats['req_per_s']:>8} "
+              f"{stats['p50_ms']:>7}ms {stats['p95_ms']:>7}ms {stats['p99_ms']:>7}ms")
+    lag = report["event_loop_lag"]
+    print(f"  event-loop lag: p50 {lag['p50_ms']}ms, p99 {lag['p99_ms']}ms, max {lag['max_ms']}ms ({lag['samples']} samples)")
+    lock = report["sqlite_lock_wait"]
+    if lock:
+        print(f"  sqlite lock wait: p50 {lock['p50_ms']}ms, p95 {lock['p95_ms']}ms, max {lock['max_ms']}ms, timeouts {lock['timeouts']}")
+
+
+def start_local_stack(args) -> List[subprocess.Popen]:
+    """Start the mock upstreams and one backend worker on a scratch database."""
+    scratch = tempfile.mkdtemp(prefix="loadtest-")
+    args.db_path = os.path.join(scratch, "loadtest.db")
+    mock = f"http://127.0.0.1:{args.mock_port}"
+    args.base_url = f"http://127.0.0.1:{args.port}"
+    env = dict(os.environ)
+    env.update({
+        "DATABASE_URL": f"sqlite+aiosqlite:///{args.db_path}",
+        "UPLOAD_DIR": os.path.join(scratch, "uploads"),
+        "CAMPAIGN_SCHEDULER_ENABLED": "false",
+        "WHATSAPP_API_BASE_URL": f"{mock}/graph/v18.0",
+        "WHATSAPP_ACCESS_TOKEN": "mock",
+        "WHATSAPP_BUSINESS_ACCOUNT_ID": "mock-waba",
+        "WHATSAPP_PHONE_NUMBER_ID": "mock-1",
+        "WHATSAPP_PHONE_NUMBER_IDS": "mock-1,mock-2",
+        "LABSMOBILE_API_URL": f"{mock}/labsmobile/json/send",
+        "LABSMOBILE_BALANCE_URL": f"{mock}/labsmobile/json/balance",
+        "LABSMOBILE_USERNAME": "mock",
+        "LABSMOBILE_TOKEN": "mock",
+        "LABSMOBILE_SENDER": "MOCK",
+        "OWO_API_LOGIN_URL": f"{mock}/owo/login",
+        "OWO_API_CONTACTS_URL": f"{mock}/owo/contacts",
+        "OWO_API_EMAIL": "mock@example.com",
+        "OWO_API_PASSWORD": "mock",
+        "WEBHOOK_WHATSAPP": f"{mock}/n8n/whatsapp",
+        "WEBHOOK_EMAIL": f"{mock}/n8n/email",
+    })
+    log = open(os.path.join(scratch, "servers.log"), "w")
+    print(f"[LOADTEST] Base de datos y logs en {scratch}")
+    return [
+        subprocess.Popen(
+            [sys.executable, "-m", "mock_upstreams", "--port", str(args.mock_port),
+             "--callback-url", f"{args.base_url}/messages/callback"],
+            cwd=backend_dir, env=env, stdout=log, stderr=subprocess.STDOUT
+        ),
+        subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(args.port), "--log-level", "warning"],
+            cwd=backend_dir, env=env, stdout=log, stderr=subprocess.STDOUT
+        ),
+    ]
+
+
+async def wait_ready(client: httpx.AsyncClient, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if (await client.get("/health")).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(0.5)
+    raise RuntimeError("El backend no respondio a /health")
+
+
+async def main(args):
+    processes = [] if args.base_url else start_local_stack(args)
+    results = {}
+    try:
+        limits = httpx.Limits(max_connections=args.concurrency + 5)
+        async with httpx.AsyncClient(base_url=args.base_url, timeout=120, limits=limits) as client:
+            await wait_ready(client)
+            names = args.scenario or [name for name in SCENARIOS if name != "campaign_plus_dashboard"]
+            for name in names:
+                results[name] = await run_scenario(client, name, args)
+                print_report(name, results[name])
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"\n[LOADTEST] Resultados guardados en {args.json}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="End-to-end API load test")
+    parser.add_argument("--scenario", action="append", choices=list(SCENARIOS),
+                        help="Scenario to run (repeatable); default: all but campaign_plus_dashboard")
+    parser.add_argument("--duration", type=float, default=20.0, help="Seconds per scenario")
+    parser.add_argument("--concurrency", type=int, default=20, help="Concurrent clients")
+    parser.add_argument("--recipients", type=int, default=100, help="Recipients per bulk request")
+    parser.add_argument("--campaign-size", type=int, default=10000, help="Recipients of the campaign_plus_dashboard campaign")
+    parser.add_argument("--base-url", help="Target a running backend instead of starting one")
+    parser.add_argument("--db-path", help="SQLite file of --base-url, for the lock wait probe")
+    parser.add_argument("--port", type=int, default=8011, help="Port of the backend started by the test")
+    parser.add_argument("--mock-port", type=int, default=9011, help="Port of the mock upstreams started by the test")
+    parser.add_argument("--json", help="Write the results to this file")
+    asyncio.run(main(parser.parse_args()))
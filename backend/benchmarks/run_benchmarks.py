@@ -0,0 +1,204 @@
+"""
+Microbenchmarks for the backend hot paths, compared against stored baselines.
+
+Covers message personalization, OWO contact transformation and search,
+WhatsApp template component building and the bulk send loop (HTTP stubbed),
+the history Excel export, Excel group uploads and n8n callback
+reconciliation. Database cases run against a temporary SQLite file.
+
+Usage:
+    python benchmarks/run_benchmarks.py                    # compare with baseline.json
+    python benchmarks/run_benchmarks.py --update-baseline  # store the current numbers
+    python benchmarks/run_benchmarks.py --quick --only owo
+
+Exits with status 1 when a case is slower than its baseline by more than
+--tolerance.
+"""
+import argparse
+import asyncio
+import io
+import os
+import sys
+import tempfile
+
+# Create backend directory path
+backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(backend_dir)
+
+# Point the app at a scratch database before anything imports config
+_tmp_dir = tempfile.mkdtemp(prefix="bench-")
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{os.path.join(_tmp_dir, 'bench.db')}"
+
+from fastapi import UploadFile
+from sqlalchemy import insert, update
+
+from benchmarks import datasets
+from benchmarks.harness import Case, run_cases
+from database import async_session, init_db
+from models.message_log import MessageLog
+from routers.contacts import filter_contacts, transform_owo_contact
+from routers.groups import upload_excel
+from routers.history import export_history
+from routers.messages import replace_variables, webhook_callback
+from schemas.message import WebhookCallback, WebhookResult
+from services.message_renderer import compile_message
+from services.sender_pool import SenderPool, WhatsAppSender
+from services.whatsapp_service import WhatsAppService
+
+# Sizes at --scale 1
+SIZES = {
+    "recipients": 100000,
+    "owo_contacts": 100000,
+    "bulk_send": 20000,
+    "history_rows": 20000,
+    "excel_rows": 5000,
+    "callback_results": 5000,
+}
+
+CALLBACK_BATCH = "bench-callback"
+
+
+def personalization_cases(size: int):
+    recipients = datasets.recipients(size)
+    compiled = compile_message(datasets.MESSAGE)
+
+    def run_replace_variables():
+        for recipient in recipients:
+            replace_variables(datasets.MESSAGE, recipient)
+
+    def run_compiled_render():
+        for recipient in recipients:
+            compiled.render(recipient)
+
+    return [
+        Case("replace_variables", run_replace_variables, size),
+        Case("compiled_message.render", run_compiled_render, size),
+    ]
+
+
+def contact_cases(size: int):
+    raw = datasets.owo_contacts(size)
+    contacts = [transform_owo_contact(c, i) for i, c in enumerate(raw)]
+
+    def run_transform():
+        for index, contact in enumerate(raw):
+            transform_owo_contact(contact, index)
+
+    return [
+        Case("owo.transform_owo_contact", run_transform, size),
+        Case("owo.filter_contacts.search", lambda: filter_contacts(contacts, "gómez", None), size),
+        Case("owo.filter_contacts.department", lambda: filter_contacts(contacts, None, "apostador"), size),
+        Case("owo.filter_contacts.both", lambda: filter_contacts(contacts, "300", "Operacional"), size),
+    ]
+
+
+def template_cases(size: int, bulk_size: int):
+    service = WhatsAppService()
+    compiled = service.compile_template(datasets.TEMPLATE)
+    recipients = datasets.recipients(size)
+    plan = service.build_send_plan(
+        template_name=datasets.TEMPLATE["name"],
+        language_code="es_CO",
+        compiled=compiled,
+        variable_mapping=datasets.TEMPLATE_MAPPING,
+        header_media_url="https://example.com/media/video promo.mp4",
+    )
+
+    def run_build_components():
+        for recipient in recipients:
+            plan.build_components(recipient)
+
+    # Whole bulk loop with the network call stubbed
+    async def get_compiled_template(template_name, language_code=None):
+        return compiled
+
+    async def send_template_message(to_phone, template_name, language_code="es_CO", components=None, phone_number_id=None):
+        return {"success": True, "message_id": "wamid.bench", "phone": to_phone, "status": "sent"}
+
+    service.get_compiled_template = get_compiled_template
+    service.send_template_message = send_template_message
+    bulk_recipients = recipients[:bulk_size]
+
+    def reset_pool():
+        # Unlimited senders so only the dispatch overhead is measured
+        service.sender_pool = SenderPool([
+            WhatsAppSender(f"sender-{i}", rate_per_second=0, concurrency=4, failure_threshold=5, cooldown_seconds=60)
+            for i in range(3)
+        ])
+
+    async def run_bulk_send():
+        await service.send_bulk_template_messages(
+            recipients=bulk_recipients,
+            template_name=datasets.TEMPLATE["name"],
+            variable_mapping=datasets.TEMPLATE_MAPPING,
+            header_media_url="https://example.com/media/video promo.mp4",
+        )
+
+    return [
+        Case("whatsapp.build_components", run_build_components, size),
+        Case("whatsapp.send_bulk_template_messages", run_bulk_send, bulk_size, setup=reset_pool, repeat=3),
+    ]
+
+
+async def database_cases(history_rows: int, excel_rows: int, callback_results: int):
+    await init_db()
+    async with async_session() as db:
+        await db.execute(insert(MessageLog), datasets.message_logs(history_rows, batch_id="bench-history"))
+        await db.execute(insert(MessageLog), datasets.message_logs(callback_results, batch_id=CALLBACK_BATCH, seed=5))
+        await db.commit()
+
+    async def run_export():
+        async with async_session() as db:
+            await export_history(search=None, channel=None, status=None, date_from=None, date_to=None, db=db)
+
+    excel_data = datasets.excel_contacts(excel_rows)
+
+    async def run_upload():
+        async with async_session() as db:
+            await upload_excel(file=UploadFile(io.BytesIO(excel_data), filename="contactos.xlsx"), group_name="bench", db=db)
+            await db.rollback()
+
+    callback = WebhookCallback(
+        batch_id=CALLBACK_BATCH,
+        results=[
+            WebhookResult(phone=f"+57300{i:07d}", success=i % 10 != 0, error=None if i % 10 else "Número inválido")
+            for i in range(callback_results)
+        ]
+    )
+
+    async def reset_callback_rows():
+        async with async_session() as db:
+            await db.execute(
+                update(MessageLog).where(MessageLog.batch_id == CALLBACK_BATCH).values(status="pending", error_message=None)
+            )
+            await db.commit()
+
+    return [
+        Case("history.export_history", run_export, history_rows + callback_results, repeat=3),
+        Case("groups.upload_excel", run_upload, excel_rows, repeat=3),
+        Case("messages.webhook_callback", lambda: webhook_callback(callback), callback_results, setup=reset_callback_rows, repeat=3),
+    ]
+
+
+async def main(args):
+    sizes = {name: max(1, int(size * args.scale)) for name, size in SIZES.items()}
+    cases = (
+        personalization_cases(sizes["recipients"])
+        + contact_cases(sizes["owo_contacts"])
+        + template_cases(sizes["recipients"], sizes["bulk_send"])
+        + await database_cases(sizes["history_rows"], sizes["excel_rows"], sizes["callback_results"])
+    )
+    if args.only:
+        cases = [case for case in cases if args.only in case.name]
+    regressions = await run_cases(cases, args.tolerance, update_baseline=args.update_baseline)
+    return 1 if regressions and not args.update_baseline else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backend microbenchmarks")
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiply every dataset size")
+    parser.add_argument("--quick", action="store_const", const=0.1, dest="scale", help="Same as --scale 0.1")
+    parser.add_argument("--only", help="Run only the cases whose name contains this text")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown before a case is a regression")
+    parser.add_argument("--update-baseline", action="store_true", help="Store the results in baseline.json")
+    sys.exit(asyncio.run(main(parser.parse_args())))
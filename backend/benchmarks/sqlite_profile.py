@@ -0,0 +1,197 @@
+"""
+Concurrent read/write throughput of SQLite with and without the tuned
+connection profile (WAL, synchronous=NORMAL, busy_timeout, cache and mmap
+sizes, pooled connections; see database.sqlite_pragmas).
+
+The workload mirrors the backend: writers insert message-log batches like
+/messages/send-bulk and apply n8n callbacks (per-recipient status updates),
+while readers page through and count the history like the dashboard. Each
+profile runs on a fresh database seeded with the same rows; the report
+gives operations/sec, p50/p95 latency per operation and 'database is
+locked' errors.
+
+Usage:
+    python benchmarks/sqlite_profile.py
+    python benchmarks/sqlite_profile.py --writers 8 --readers 16 --duration 20 --seed-rows 200000
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+# Create backend directory path
+backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(backend_dir)
+
+# Point the app at a scratch database before anything imports config
+_tmp_dir = tempfile.mkdtemp(prefix="sqlite-profile-")
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{os.path.join(_tmp_dir, 'unused.db')}"
+
+from sqlalchemy import func, insert, select, update
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from benchmarks.loadtest import percentile
+from database import Base, apply_sqlite_profile, engine_options, sqlite_pragmas
+from models.message_log import MessageLog, get_colombia_time
+
+BATCH_SIZE = 100
+
+
+def log_rows(batch_id: str, count: int, start: int) -> List[Dict]:
+    now = get_colombia_time()
+    return [
+        {
+            "recipient_name": f"Contacto {start + i}",
+            "recipient_phone": f"57300{start + i:07d}",
+            "message_content": "Hola, este es un mensaje de prueba",
+            "channel": "whatsapp",
+            "status": "pending",
+            "sent_at": now,
+            "attachments": [],
+            "batch_id": batch_id
+        }
+        for i in range(count)
+    ]
+
+
+class Stats:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = {}
+        self.locked = 0
+
+    def add(self, operation: str, seconds: float):
+        self.latencies.setdefault(operation, []).append(seconds)
+
+
+async def run_profile(name: str, tuned: bool, args) -> Dict:
+    url = f"sqlite+aiosqlite:///{os.path.join(_tmp_dir, name + '.db')}"
+    engine = create_async_engine(url, **(engine_options(url) if tuned else {}))
+    if tuned:
+        apply_sqlite_profile(engine.sync_engine, sqlite_pragmas())
+    sessions = async_sessionmaker(engine, expire_on_commit=False)
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    # Seed in separate batches so the callback writers have rows to update
+    seeded_batches = max(1, args.seed_rows // BATCH_SIZE)
+    async with sessions() as db:
+        for index in range(seeded_batches):
+            await db.execute(insert(MessageLog), log_rows(f"seed-{index}", BATCH_SIZE, index * BATCH_SIZE))
+        await db.commit()
+
+    stats = Stats()
+    rng = random.Random(7)
+    deadline = time.monotonic() + args.duration
+    sequence = 0
+
+    async def timed(operation: str, work):
+        started = time.perf_counter()
+        try:
+            await work()
+        except OperationalError as e:
+            if "locked" not in str(e):
+                raise
+            stats.locked += 1
+            return
+        stats.add(operation, time.perf_counter() - started)
+
+    async def send_bulk():
+        nonlocal sequence
+        sequence += 1
+        async with sessions() as db:
+            await db.execute(insert(MessageLog), log_rows(f"bulk-{sequence}", BATCH_SIZE, sequence * BATCH_SIZE))
+            await db.commit()
+
+    async def callback():
+        index = rng.randrange(seeded_batches)
+        async with sessions() as db:
+            for i in range(0, BATCH_SIZE, 5):
+                await db.execute(
+                    update(MessageLog)
+                    .where(MessageLog.batch_id == f"seed-{index}")
+                    .where(MessageLog.recipient_phone == f"57300{index * BATCH_SIZE + i:07d}")
+                    .values(status="sent")
+                )
+            await db.commit()
+
+    async def history_page():
+        async with sessions() as db:
+            result = await db.execute(
+                select(MessageLog).order_by(MessageLog.sent_at.desc()).offset(rng.randrange(0, 500)).limit(50)
+            )
+            result.scalars().all()
+
+    async def history_count():
+        async with sessions() as db:
+            await db.execute(select(func.count(MessageLog.id)).where(MessageLog.status == "pending"))
+
+    async def writer(number: int):
+        while time.monotonic() < deadline:
+            if number % 2 == 0:
+                await timed("send_bulk", send_bulk)
+            else:
+                await timed("callback", callback)
+
+    async def reader(number: int):
+        while time.monotonic() < deadline:
+            if number % 2 == 0:
+                await timed("history_page", history_page)
+            else:
+                await timed("history_count", history_count)
+
+    started = time.monotonic()
+    await asyncio.gather(
+        *(writer(i) for i in range(args.writers)),
+        *(reader(i) for i in range(args.readers))
+    )
+    elapsed = time.monotonic() - started
+    await engine.dispose()
+
+    operations = {
+        operation: {
+            "ops_per_sec": round(len(values) / elapsed, 1),
+            "p50_ms": round(percentile(values, 0.50) * 1000, 2),
+            "p95_ms": round(percentile(values, 0.95) * 1000, 2),
+        }
+        for operation, values in sorted(stats.latencies.items())
+    }
+    total = sum(len(values) for values in stats.latencies.values())
+    return {"total_ops_per_sec": round(total / elapsed, 1), "locked_errors": stats.locked, "operations": operations}
+
+
+def print_report(results: Dict[str, Dict]):
+    print(f"{'profile':<10}{'operation':<16}{'ops/s':>10}{'p50 ms':>10}{'p95 ms':>10}")
+    for name, result in results.items():
+        for operation, numbers in result["operations"].items():
+            print(f"{name:<10}{operation:<16}{numbers['ops_per_sec']:>10}{numbers['p50_ms']:>10}{numbers['p95_ms']:>10}")
+        print(f"{name:<10}{'TOTAL':<16}{result['total_ops_per_sec']:>10}   locked errors: {result['locked_errors']}")
+    default, tuned = results["default"]["total_ops_per_sec"], results["tuned"]["total_ops_per_sec"]
+    if default:
+        print(f"\nTuned profile: {tuned / default:.2f}x the throughput of the default one")
+
+
+async def main(args):
+    results = {
+        "default": await run_profile("default", False, args),
+        "tuned": await run_profile("tuned", True, args),
+    }
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_report(results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SQLite connection profile benchmark")
+    parser.add_argument("--writers", type=int, default=4, help="Concurrent send/callback writers")
+    parser.add_argument("--readers", type=int, default=8, help="Concurrent history readers")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds per profile")
+    parser.add_argument("--seed-rows", type=int, default=50000, help="Message logs created before the run")
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON")
+    asyncio.run(main(parser.parse_args()))
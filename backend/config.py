@@ -29,18 +29,90 @@ class Settings(BaseSettings):
     frontend_url: str = "http://localhost:3000"
     
     # WhatsApp Business API
+    whatsapp_api_base_url: str = "https://graph.facebook.com/v18.0"
     whatsapp_access_token: str = ""
     whatsapp_business_account_id: str = ""
     whatsapp_phone_number_id: str = ""
+    whatsapp_phone_number_ids: str = ""  # Comma-separated sender pool; defaults to whatsapp_phone_number_id
+    whatsapp_sender_rate_per_second: float = 20.0  # Messages per second allowed per sender
+    whatsapp_sender_concurrency: int = 4  # Requests in flight per sender
+    whatsapp_sender_failure_threshold: int = 5  # Consecutive failures before a sender cools down
+    whatsapp_sender_cooldown_seconds: int = 60
+    whatsapp_priority_concurrency: int = 2  # In-flight slots per sender reserved for single sends
+    priority_reserved_share: float = 0.2  # Share of each upstream rate limit reserved for single sends
+    whatsapp_template_cache_ttl: int = 300  # Seconds before the template catalog is refreshed
+    whatsapp_template_negative_cache_ttl: int = 60  # Seconds a missing template is remembered
     
     # LabsMobile SMS API
     labsmobile_api_url: str = "https://api.labsmobile.com/json/send"
+    labsmobile_balance_url: str = "https://api.labsmobile.com/json/balance"
     labsmobile_username: str = ""
     labsmobile_token: str = ""
     labsmobile_sender: str = ""
+    labsmobile_max_recipients: int = 10000  # Numbers per LabsMobile request (provider maximum)
+    labsmobile_concurrency: int = 10  # LabsMobile bulk requests in flight (shared by all bulk sends)
+    labsmobile_rate_per_second: float = 10.0  # LabsMobile requests per second; 0 disables the limit
+    
+    # Retries of transient upstream errors
+    retry_max_attempts: int = 4  # Total attempts per recipient, including the first
+    retry_base_delay: float = 1.0  # Seconds; doubles on every attempt
+    retry_max_delay: float = 30.0
+    
+    # Campaign scheduler
+    campaign_scheduler_enabled: bool = True
+    campaign_poll_interval: float = 5.0  # Seconds between releases of each running campaign
+    
+    # Circuit breakers per upstream (n8n, Graph API, LabsMobile, OWO)
+    circuit_failure_threshold: int = 5  # Consecutive failures that open the circuit
+    circuit_error_rate: float = 0.5  # Failure ratio over the window that opens the circuit
+    circuit_window_size: int = 20
+    circuit_min_calls: int = 10  # Calls needed before the error rate is considered
+    circuit_recovery_timeout: float = 30.0  # Seconds open before a probe call
+    circuit_max_wait: float = 60.0  # Seconds a bulk send waits on an open circuit before failing the rest
+    
+    # Diagnostics
+    loop_monitor_interval: float = 0.1  # Seconds between event-loop lag samples; 0 disables
+    
+    # Tracing (OpenTelemetry; needs opentelemetry-sdk, and the OTLP exporter package for 'otlp')
+    tracing_exporter: str = ""  # '', 'console', 'file' or 'otlp'
+    tracing_file: str = "./traces.jsonl"
+    tracing_otlp_endpoint: str = "http://localhost:4318/v1/traces"
+    tracing_service_name: str = "masivos-backend"
+    tracing_sample_ratio: float = 1.0
+    
+    # Slow-query log and per-request DB time (Server-Timing)
+    slow_query_ms: float = 200.0  # Log statements slower than this with their plan; 0 disables
+    slow_query_explain: bool = True
+    request_query_warning: int = 100  # Log requests running more statements than this (N+1)
+    
+    # Admin endpoints (/admin); disabled while admin_token is empty
+    admin_token: str = ""
+    profiling_dir: str = "./profiles"
+    profiling_interval: float = 0.001  # Sampling interval in seconds (pyinstrument)
     
     # Database
     database_url: str = "sqlite+aiosqlite:///./messaging.db"
+    database_replica_url: str = ""  # Read replica for analytics and exports; empty uses read-only primary sessions
+    db_pool_size: int = 5  # Connections kept open per engine (writes, reads, replica)
+    db_max_overflow: int = 10  # Not used by SQLite writes, which queue for the pooled connections
+    db_pool_timeout: float = 30.0  # Seconds to wait for a free connection
+    
+    # SQLite connection profile, applied to every new connection
+    sqlite_journal_mode: str = "WAL"  # Readers and the writer no longer block each other
+    sqlite_synchronous: str = "NORMAL"  # Safe with WAL; no fsync on every commit
+    sqlite_busy_timeout_ms: int = 15000  # Wait for the write lock instead of 'database is locked'
+    sqlite_cache_size_kib: int = 65536
+    sqlite_mmap_size_mb: int = 256
+    sqlite_temp_store: str = "MEMORY"
+    
+    # Write-behind buffer for message status changes (n8n callbacks, single sends)
+    status_flush_interval: float = 1.0  # Seconds between flushes; the history lags by at most this
+    status_flush_max_pending: int = 5000  # Flush early once this many changes are waiting
+    status_buffer_max_queued: int = 50000  # Cap while the database is slow or down; callers flush themselves
+    
+    # Idempotency keys
+    idempotency_retention_hours: int = 72  # Keys older than this are purged
+    idempotency_pending_timeout: int = 900  # Seconds before an unfinished claim can be taken again
     
     # SSL
     ssl_verify: bool = True
@@ -1,14 +1,106 @@
 """Database configuration and session management."""
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
+import os
+from typing import List, Optional
+from sqlalchemy import event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine, AsyncSession, async_sessionmaker
 from sqlalchemy.orm import DeclarativeBase
 from config import get_settings
+from services.metrics import instrument_engine
+from services.query_log import track_queries
 
 settings = get_settings()
 
-engine = create_async_engine(
-    settings.database_url,
-    echo=False,
-    future=True
+
+def sqlite_pragmas() -> List[str]:
+    """PRAGMA statements of the SQLite connection profile."""
+    return [
+        f"PRAGMA journal_mode={settings.sqlite_journal_mode}",
+        f"PRAGMA synchronous={settings.sqlite_synchronous}",
+        f"PRAGMA busy_timeout={settings.sqlite_busy_timeout_ms}",
+        f"PRAGMA cache_size=-{settings.sqlite_cache_size_kib}",
+        f"PRAGMA mmap_size={settings.sqlite_mmap_size_mb * 1024 * 1024}",
+        f"PRAGMA temp_store={settings.sqlite_temp_store}",
+    ]
+
+
+def sqlite_read_pragmas() -> List[str]:
+    """PRAGMA statements of read-only SQLite connections (the writers set the journal mode)."""
+    pragmas = [p for p in sqlite_pragmas() if not p.startswith("PRAGMA journal_mode")]
+    return pragmas + ["PRAGMA query_only=ON"]
+
+
+def apply_sqlite_profile(engine: Engine, pragmas: List[str]) -> None:
+    """Run `pragmas` on every new connection of a (sync) SQLite engine."""
+
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for pragma in pragmas:
+                cursor.execute(pragma)
+        finally:
+            cursor.close()
+
+
+def is_memory_sqlite(url: str) -> bool:
+    """True for in-memory SQLite URLs (one shared connection, no pool)."""
+    parsed = make_url(url)
+    return parsed.get_backend_name() == "sqlite" and parsed.database in (None, "", ":memory:")
+
+
+def engine_options(url: str, writer: bool = False) -> dict:
+    """Pool options for the database URL (in-memory SQLite keeps its single shared connection)."""
+    if is_memory_sqlite(url):
+        return {}
+    options = {
+        "pool_size": settings.db_pool_size,
+        "max_overflow": settings.db_max_overflow,
+        "pool_timeout": settings.db_pool_timeout,
+    }
+    if writer and make_url(url).get_backend_name() == "sqlite":
+        # SQLite runs one writer at a time: extra write connections only poll its lock
+        # (unfairly, some past busy_timeout), so writers queue for a pooled one instead
+        options["max_overflow"] = 0
+    return options
+
+
+# Every engine with its own pool, for instrumentation (see services/tracing.py)
+engines: List[AsyncEngine] = []
+
+
+def build_engine(url: str, sqlite_profile: Optional[List[str]] = None, writer: bool = False) -> AsyncEngine:
+    """Async engine with the pool options, SQLite profile and statement instrumentation."""
+    new_engine = create_async_engine(url, echo=False, future=True, **engine_options(url, writer))
+    if new_engine.dialect.name == "sqlite":
+        apply_sqlite_profile(new_engine.sync_engine, sqlite_profile or sqlite_pragmas())
+    instrument_engine(new_engine.sync_engine)
+    track_queries(new_engine.sync_engine, settings.slow_query_ms, settings.slow_query_explain)
+    engines.append(new_engine)
+    return new_engine
+
+
+def build_read_engine(url: str) -> AsyncEngine:
+    """
+    Engine whose transactions cannot write: SQLite connections run with
+    query_only (separate pool, so with WAL they read alongside the writer),
+    PostgreSQL transactions are opened READ ONLY.
+    """
+    if url == settings.database_url and is_memory_sqlite(url):
+        return engine  # An in-memory database only exists on its own connection
+    if make_url(url).get_backend_name() == "sqlite":
+        return build_engine(url, sqlite_read_pragmas())
+    # The primary's pool is shared; the option is reset when a connection returns to it
+    base = engine if url == settings.database_url else build_engine(url)
+    return base.execution_options(postgresql_readonly=True)
+
+
+engine = build_engine(settings.database_url, writer=True)
+# Read-only endpoints; same database as the writes, so they see them right away
+read_engine = build_read_engine(settings.database_url)
+# Heavy analytics and exports; a replica when configured, so they never contend with sends
+replica_engine = (
+    build_read_engine(settings.database_replica_url) if settings.database_replica_url else read_engine
 )
 
 async_session = async_sessionmaker(
@@ -16,6 +108,10 @@ async_session = async_sessionmaker(
     class_=AsyncSession,
     expire_on_commit=False
 )
+async_read_session = async_sessionmaker(read_engine, class_=AsyncSession, expire_on_commit=False, autoflush=False)
+async_replica_session = async_sessionmaker(
+    replica_engine, class_=AsyncSession, expire_on_commit=False, autoflush=False
+)
 
 
 class Base(DeclarativeBase):
@@ -23,10 +119,34 @@ class Base(DeclarativeBase):
     pass
 
 
+def run_migrations(connection, revision: str = "head") -> None:
+    """Upgrade the schema on an open (sync) connection with the Alembic migrations."""
+    from alembic import command
+    from alembic.config import Config
+
+    backend_dir = os.path.dirname(os.path.abspath(__file__))
+    config = Config(os.path.join(backend_dir, "alembic.ini"))
+    config.set_main_option("script_location", os.path.join(backend_dir, "migrations"))
+    config.attributes["connection"] = connection
+    command.upgrade(config, revision)
+
+
 async def init_db():
-    """Initialize the database, creating all tables."""
+    """Initialize the database, applying pending migrations (creates the tables on first run)."""
     async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(run_migrations)
+
+
+async def get_read_db():
+    """Dependency for endpoints that only read: no commit, the transaction is rolled back."""
+    async with async_read_session() as session:
+        yield session
+
+
+async def get_replica_db():
+    """Dependency for heavy reads (analytics, exports); uses the replica when configured."""
+    async with async_replica_session() as session:
+        yield session
 
 
 async def get_db():
@@ -6,13 +6,25 @@ import os
 import logging
 import asyncio
 from contextlib import asynccontextmanager
-from fastapi import FastAPI
+from typing import Optional
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
+from sqlalchemy.engine import make_url
 
 from config import get_settings
-from database import init_db
-from routers import contacts_router, templates_router, messages_router, history_router, whatsapp_router, assistant_router, sms_router, groups_router
+from database import init_db, async_session
+from services.whatsapp_service import get_whatsapp_service
+from services.idempotency_service import purge_expired
+from services.circuit_breaker import circuit_states
+from services.campaign_scheduler import campaign_scheduler
+from services.status_buffer import status_buffer
+from services.loop_monitor import loop_monitor
+from services.metrics import render_metrics
+from services.tracing import setup_tracing, shutdown_tracing
+from services.profiler import ProfilingMiddleware
+from services.query_log import ServerTimingMiddleware
+from routers import contacts_router, templates_router, messages_router, history_router, whatsapp_router, assistant_router, sms_router, groups_router, campaigns_router, admin_router
 
 # Configure logging
 logging.basicConfig(
@@ -36,6 +48,12 @@ async def lifespan(app: FastAPI):
     await init_db()
     print("[OK] Base de datos inicializada")
     
+    # Drop idempotency keys past their retention period
+    async with async_session() as db:
+        purged = await purge_expired(db)
+    if purged:
+        print(f"[CLEANUP] {purged} claves de idempotencia expiradas eliminadas")
+    
     # Ensure upload directory exists
     os.makedirs(settings.upload_dir, exist_ok=True)
     print(f"[DIR] Directorio de uploads: {settings.upload_dir}")
@@ -64,6 +82,9 @@ async def lifespan(app: FastAPI):
     # WhatsApp Direct API
     if settings.whatsapp_access_token and settings.whatsapp_phone_number_id:
         print("[OK] WhatsApp Direct API configurada")
+        if settings.whatsapp_business_account_id:
+            # Warm the template catalog in the background
+            get_whatsapp_service().start_template_sync()
     elif settings.whatsapp_access_token:
         print("[WARN] WhatsApp API: falta PHONE_NUMBER_ID")
     else:
@@ -86,15 +107,33 @@ async def lifespan(app: FastAPI):
                 from cleanup_uploads import cleanup_old_files
                 print("[CLEANUP] Ejecutando limpieza diaria programada...")
                 cleanup_old_files(days=3)
+                async with async_session() as db:
+                    await purge_expired(db)
             except Exception as e:
                 print(f"[ERROR] Fallo en limpieza diaria: {e}")
                 
     asyncio.create_task(periodic_cleanup())
     
+    # Write message status changes in batches (callbacks, failed batches, single sends)
+    status_buffer.start()
+    
+    # Sample event-loop lag for /health/event-loop
+    loop_monitor.start()
+    
+    # Release scheduled campaigns in the background
+    if settings.campaign_scheduler_enabled:
+        campaign_scheduler.start()
+        print("[OK] Programador de campanas iniciado")
+    
     yield
     
     # Shutdown
     print("[STOP] Cerrando aplicacion...")
+    await campaign_scheduler.stop()
+    # Save the status changes still in the buffer
+    await status_buffer.stop()
+    await loop_monitor.stop()
+    shutdown_tracing()
 
 
 app = FastAPI(
@@ -104,6 +143,10 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+# OpenTelemetry spans for requests, DB statements and upstream calls (TRACING_EXPORTER)
+if setup_tracing(app):
+    print(f"[OK] Trazas exportadas a: {settings.tracing_exporter}")
+
 # CORS configuration
 app.add_middleware(
     CORSMiddleware,
@@ -113,6 +156,12 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# On-demand profiling armed through /admin/profiling
+app.add_middleware(ProfilingMiddleware)
+
+# DB time and query count of each request in the Server-Timing header
+app.add_middleware(ServerTimingMiddleware, query_warning=settings.request_query_warning)
+
 # Mount static files for uploads
 if os.path.exists(settings.upload_dir):
     app.mount("/uploads", StaticFiles(directory=settings.upload_dir), name="uploads")
@@ -126,6 +175,8 @@ app.include_router(whatsapp_router)
 app.include_router(assistant_router)
 app.include_router(sms_router)
 app.include_router(groups_router)
+app.include_router(campaigns_router)
+app.include_router(admin_router)
 
 
 @app.get("/")
@@ -147,18 +198,37 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    """Health check endpoint."""
+    """Health check endpoint, including the circuit breaker of each upstream."""
+    circuits = circuit_states()
+    degraded = any(c["state"] != "closed" for c in circuits.values())
     return {
-        "status": "healthy",
+        "status": "degraded" if degraded else "healthy",
         "webhooks": {
             "whatsapp": bool(settings.webhook_whatsapp),
             "email": bool(settings.webhook_email),
             "assistant": bool(settings.webhook_assistant)
         },
-        "contacts_api": bool(settings.owo_api_login_url and settings.owo_api_contacts_url)
+        "contacts_api": bool(settings.owo_api_login_url and settings.owo_api_contacts_url),
+        "circuits": circuits
     }
 
 
+@app.get("/health/event-loop")
+async def event_loop_lag(since: Optional[float] = None):
+    """
+    Event-loop lag percentiles, optionally only for samples taken after
+    `since` (Unix time in seconds), e.g. during one load-test scenario.
+    """
+    return loop_monitor.summary(since)
+
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics: message outcomes, upstream latency, queues, rate limiters, DB and caches."""
+    payload, content_type = render_metrics()
+    return Response(content=payload, media_type=content_type)
+
+
 @app.get("/config")
 async def get_config():
     """
@@ -208,7 +278,8 @@ async def get_config():
             "cors_url": settings.frontend_url
         },
         "database": {
-            "url": settings.database_url
+            # Never expose the credentials of a PostgreSQL URL
+            "url": make_url(settings.database_url).render_as_string(hide_password=True)
         },
         "uploads": {
             "directory": settings.upload_dir,
@@ -0,0 +1,191 @@
+"""Baseline schema
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-19 09:00:00
+
+The schema as it was before migrations were managed with Alembic. It is
+also safe on databases created back then by Base.metadata.create_all:
+missing tables, columns and indexes are added (this replaces the
+add_attachment_column.py, add_group_contact_keys.py and
+add_group_contact_indexes.py scripts) and existing ones are left alone.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "0001"
+down_revision: Union[str, Sequence[str], None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+TABLES = {
+    "templates": lambda: [
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("name", sa.String(255), nullable=False, unique=True),
+        sa.Column("subject", sa.String(500), nullable=True),
+        sa.Column("content", sa.Text(), nullable=False),
+        sa.Column("attachment_path", sa.String(500), nullable=True),
+        sa.Column("channel", sa.String(50), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        sa.Column("updated_at", sa.DateTime(), nullable=True),
+    ],
+    "message_logs": lambda: [
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("recipient_name", sa.String(255), nullable=False),
+        sa.Column("recipient_phone", sa.String(50), nullable=True),
+        sa.Column("recipient_email", sa.String(255), nullable=True),
+        sa.Column("subject", sa.String(500), nullable=True),
+        sa.Column("message_content", sa.Text(), nullable=False),
+        sa.Column("channel", sa.String(50), nullable=False),
+        sa.Column("status", sa.String(50), nullable=True),
+        sa.Column("error_message", sa.Text(), nullable=True),
+        sa.Column("sent_at", sa.DateTime(), nullable=True),
+        sa.Column("attachments", sa.JSON(), nullable=True),
+        sa.Column("batch_id", sa.String(50), nullable=True),
+    ],
+    "groups": lambda: [
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("name", sa.String(255), nullable=False, unique=True),
+        sa.Column("description", sa.Text(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        sa.Column("updated_at", sa.DateTime(), nullable=True),
+    ],
+    "group_contacts": lambda: [
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("group_id", sa.Integer(), sa.ForeignKey("groups.id", ondelete="CASCADE"), nullable=False),
+        sa.Column("name", sa.String(255), nullable=False),
+        sa.Column("phone", sa.String(50), nullable=True),
+        sa.Column("email", sa.String(255), nullable=True),
+        sa.Column("phone_key", sa.String(50), nullable=True),
+        sa.Column("email_key", sa.String(255), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+    ],
+    "idempotency_keys": lambda: [
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("campaign_key", sa.String(255), nullable=False),
+        sa.Column("channel", sa.String(20), nullable=False),
+        sa.Column("recipient", sa.String(255), nullable=False),
+        sa.Column("status", sa.String(20), nullable=False),
+        sa.Column("claim_id", sa.String(50), nullable=True),
+        sa.Column("batch_id", sa.String(50), nullable=True),
+        sa.Column("message_id", sa.String(255), nullable=True),
+        sa.Column("error_message", sa.Text(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        sa.Column("updated_at", sa.DateTime(), nullable=True),
+        sa.UniqueConstraint("campaign_key", "channel", "recipient", name="uq_idempotency_scope"),
+    ],
+    "campaigns": lambda: [
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("name", sa.String(255), nullable=False),
+        sa.Column("channel", sa.String(50), nullable=False),
+        sa.Column("params", sa.JSON(), nullable=True),
+        sa.Column("group_id", sa.Integer(), nullable=True),
+        sa.Column("department", sa.String(50), nullable=True),
+        sa.Column("start_at", sa.DateTime(), nullable=False),
+        sa.Column("send_windows", sa.JSON(), nullable=True),
+        sa.Column("send_days", sa.JSON(), nullable=True),
+        sa.Column("max_rate_per_minute", sa.Integer(), nullable=False),
+        sa.Column("status", sa.String(50), nullable=True),
+        sa.Column("paused_by_user", sa.Boolean(), nullable=True),
+        sa.Column("recipients_loaded", sa.Boolean(), nullable=True),
+        sa.Column("total", sa.Integer(), nullable=True),
+        sa.Column("sent", sa.Integer(), nullable=True),
+        sa.Column("failed", sa.Integer(), nullable=True),
+        sa.Column("last_error", sa.Text(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        sa.Column("updated_at", sa.DateTime(), nullable=True),
+        sa.Column("completed_at", sa.DateTime(), nullable=True),
+    ],
+    "campaign_recipients": lambda: [
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column(
+            "campaign_id", sa.Integer(), sa.ForeignKey("campaigns.id", ondelete="CASCADE"), nullable=False
+        ),
+        sa.Column("name", sa.String(255), nullable=True),
+        sa.Column("phone", sa.String(50), nullable=True),
+        sa.Column("email", sa.String(255), nullable=True),
+        sa.Column("data", sa.JSON(), nullable=True),
+        sa.Column("status", sa.String(50), nullable=True),
+        sa.Column("error_message", sa.Text(), nullable=True),
+        sa.Column("sent_at", sa.DateTime(), nullable=True),
+    ],
+}
+
+# Columns added after their table first shipped (older databases lack them)
+LATE_COLUMNS = {
+    "templates": [("attachment_path", sa.String(500))],
+    "group_contacts": [("phone_key", sa.String(50)), ("email_key", sa.String(255))],
+}
+
+INDEXES = [
+    ("ix_templates_id", "templates", ["id"]),
+    ("ix_message_logs_id", "message_logs", ["id"]),
+    ("ix_message_logs_batch_id", "message_logs", ["batch_id"]),
+    ("ix_groups_id", "groups", ["id"]),
+    ("ix_group_contacts_id", "group_contacts", ["id"]),
+    ("ix_group_contacts_group_id", "group_contacts", ["group_id"]),
+    ("ix_group_contacts_group_phone_key", "group_contacts", ["group_id", "phone_key"]),
+    ("ix_group_contacts_group_email_key", "group_contacts", ["group_id", "email_key"]),
+    ("ix_idempotency_keys_id", "idempotency_keys", ["id"]),
+    ("ix_idempotency_keys_batch_id", "idempotency_keys", ["batch_id"]),
+    ("ix_idempotency_keys_claim", "idempotency_keys", ["claim_id"]),
+    ("ix_idempotency_keys_created_at", "idempotency_keys", ["created_at"]),
+    ("ix_campaigns_id", "campaigns", ["id"]),
+    ("ix_campaigns_status_start_at", "campaigns", ["status", "start_at"]),
+    ("ix_campaign_recipients_id", "campaign_recipients", ["id"]),
+    ("ix_campaign_recipients_campaign_status", "campaign_recipients", ["campaign_id", "status", "id"]),
+]
+
+
+def _backfill_contact_keys(bind) -> None:
+    """Fill phone_key/email_key of contacts created before the columns existed."""
+    from models.group import phone_match_key, email_match_key
+
+    rows = bind.execute(sa.text(
+        "SELECT id, phone, email FROM group_contacts WHERE phone_key IS NULL AND email_key IS NULL"
+    )).fetchall()
+    updates = [
+        {"row_id": row_id, "phone_key": phone_match_key(phone), "email_key": email_match_key(email)}
+        for row_id, phone, email in rows
+    ]
+    updates = [u for u in updates if u["phone_key"] or u["email_key"]]
+    if updates:
+        bind.execute(
+            sa.text("UPDATE group_contacts SET phone_key = :phone_key, email_key = :email_key WHERE id = :row_id"),
+            updates
+        )
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    existing = set(inspector.get_table_names())
+    added = set()
+
+    for table, columns in TABLES.items():
+        if table not in existing:
+            op.create_table(table, *columns())
+            continue
+        present = {c["name"] for c in inspector.get_columns(table)}
+        for name, type_ in LATE_COLUMNS.get(table, []):
+            if name not in present:
+                op.add_column(table, sa.Column(name, type_, nullable=True))
+                added.add(table)
+    if "group_contacts" in added:
+        _backfill_contact_keys(bind)
+
+    for name, table, columns in INDEXES:
+        present = {ix["name"] for ix in sa.inspect(bind).get_indexes(table)}
+        if name not in present:
+            op.create_index(name, table, columns)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for table in reversed(list(TABLES)):
+        op.drop_table(table)
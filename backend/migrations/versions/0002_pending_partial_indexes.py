@@ -0,0 +1,49 @@
+"""Partial indexes on pending rows and message history date
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-19 09:30:00
+
+The pending rows of a batch or campaign are the ones the hot paths look
+up (webhook failures, idempotency releases, campaign releases), and they
+are a small, shrinking share of each table: partial indexes on
+status = 'pending' stay small and hot in cache. Both PostgreSQL and
+SQLite (3.8+) support them.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "0002"
+down_revision: Union[str, Sequence[str], None] = "0001"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+PENDING = sa.text("status = 'pending'")
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index("ix_message_logs_sent_at", "message_logs", ["sent_at"])
+    op.create_index(
+        "ix_message_logs_pending_batch", "message_logs", ["batch_id"],
+        postgresql_where=PENDING, sqlite_where=PENDING
+    )
+    op.create_index(
+        "ix_idempotency_keys_pending_batch", "idempotency_keys", ["batch_id"],
+        postgresql_where=PENDING, sqlite_where=PENDING
+    )
+    op.create_index(
+        "ix_campaign_recipients_pending", "campaign_recipients", ["campaign_id", "id"],
+        postgresql_where=PENDING, sqlite_where=PENDING
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_campaign_recipients_pending", table_name="campaign_recipients")
+    op.drop_index("ix_idempotency_keys_pending_batch", table_name="idempotency_keys")
+    op.drop_index("ix_message_logs_pending_batch", table_name="message_logs")
+    op.drop_index("ix_message_logs_sent_at", table_name="message_logs")
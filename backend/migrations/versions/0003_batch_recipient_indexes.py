@@ -0,0 +1,40 @@
+"""Batch and recipient indexes for status updates
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-19 10:00:00
+
+Callback results are written in bulk by the status buffer, one row per
+recipient matched on (batch_id, address). With only an index on batch_id
+every matched update scanned the whole batch, so a flush grew with the
+square of the batch size. The composite indexes replace the batch_id ones:
+their first column serves the lookups by batch as before.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "0003"
+down_revision: Union[str, Sequence[str], None] = "0002"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index("ix_message_logs_batch_phone", "message_logs", ["batch_id", "recipient_phone"])
+    op.create_index("ix_message_logs_batch_email", "message_logs", ["batch_id", "recipient_email"])
+    op.create_index("ix_idempotency_keys_batch_recipient", "idempotency_keys", ["batch_id", "recipient"])
+    op.drop_index("ix_message_logs_batch_id", table_name="message_logs")
+    op.drop_index("ix_idempotency_keys_batch_id", table_name="idempotency_keys")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.create_index("ix_idempotency_keys_batch_id", "idempotency_keys", ["batch_id"])
+    op.create_index("ix_message_logs_batch_id", "message_logs", ["batch_id"])
+    op.drop_index("ix_idempotency_keys_batch_recipient", table_name="idempotency_keys")
+    op.drop_index("ix_message_logs_batch_email", table_name="message_logs")
+    op.drop_index("ix_message_logs_batch_phone", table_name="message_logs")
@@ -0,0 +1,37 @@
+"""Campaign release pacing and recipient retry time
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-19 11:00:00
+
+campaigns.next_release_at holds back the next release of a campaign whose
+rate is below one recipient per scheduler tick. campaign_recipients.retry_at
+passes over recipients still claimed by an interrupted release until that
+claim can expire, so they do not hold up the recipients after them.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "0004"
+down_revision: Union[str, Sequence[str], None] = "0003"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.batch_alter_table("campaigns") as batch_op:
+        batch_op.add_column(sa.Column("next_release_at", sa.DateTime(), nullable=True))
+    with op.batch_alter_table("campaign_recipients") as batch_op:
+        batch_op.add_column(sa.Column("retry_at", sa.DateTime(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table("campaign_recipients") as batch_op:
+        batch_op.drop_column("retry_at")
+    with op.batch_alter_table("campaigns") as batch_op:
+        batch_op.drop_column("next_release_at")
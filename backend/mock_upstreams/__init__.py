@@ -0,0 +1,37 @@
+"""
+Local stand-ins for the upstream services, for load and throughput tests.
+
+One ASGI app serves the Graph API (/graph/v18.0), LabsMobile
+(/labsmobile/json), the OWO contacts API (/owo) and the n8n webhooks (/n8n),
+with the response shapes the backend parses. Latency, error rate and rate
+limit of each upstream come from MOCK_<NAME>_<FIELD> variables (see
+mock_upstreams.behavior) and can be changed at runtime with
+PUT /mock/behavior/{name}.
+
+Run it with:
+    python -m mock_upstreams --port 9000
+
+and point the backend at it in .env:
+    WHATSAPP_API_BASE_URL=http://localhost:9000/graph/v18.0
+    WHATSAPP_ACCESS_TOKEN=mock
+    WHATSAPP_BUSINESS_ACCOUNT_ID=mock-waba
+    WHATSAPP_PHONE_NUMBER_IDS=mock-1,mock-2
+    LABSMOBILE_API_URL=http://localhost:9000/labsmobile/json/send
+    LABSMOBILE_BALANCE_URL=http://localhost:9000/labsmobile/json/balance
+    LABSMOBILE_USERNAME=mock
+    LABSMOBILE_TOKEN=mock
+    LABSMOBILE_SENDER=MOCK
+    OWO_API_LOGIN_URL=http://localhost:9000/owo/login
+    OWO_API_CONTACTS_URL=http://localhost:9000/owo/contacts
+    OWO_API_EMAIL=mock@example.com
+    OWO_API_PASSWORD=mock
+    WEBHOOK_WHATSAPP=http://localhost:9000/n8n/whatsapp
+    WEBHOOK_EMAIL=http://localhost:9000/n8n/email
+
+The n8n stand-in reports every batch back to MOCK_CALLBACK_URL
+(default http://localhost:8001/messages/callback).
+"""
+from mock_upstreams.app import create_app
+from mock_upstreams.behavior import UpstreamBehavior
+
+__all__ = ["create_app", "UpstreamBehavior"]
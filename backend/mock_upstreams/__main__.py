@@ -0,0 +1,21 @@
+"""Run the mock upstreams: python -m mock_upstreams [--host HOST] [--port PORT]."""
+import argparse
+
+import uvicorn
+
+from mock_upstreams.app import create_app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock Graph API, LabsMobile, OWO and n8n upstreams")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--callback-url", default=None, help="Backend /messages/callback URL for n8n reports")
+    args = parser.parse_args()
+    
+    print(f"[MOCK] Upstreams simulados en http://{args.host}:{args.port}")
+    uvicorn.run(create_app(args.callback_url), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
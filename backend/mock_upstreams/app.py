@@ -0,0 +1,290 @@
+"""ASGI app emulating the Graph API, LabsMobile, OWO and n8n endpoints used by the backend."""
+import asyncio
+import os
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Set
+
+import httpx
+from fastapi import APIRouter, FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
+
+from mock_upstreams.behavior import ERROR, THROTTLED, UpstreamBehavior
+
+DEFAULT_CALLBACK_URL = "http://localhost:8001/messages/callback"
+
+
+def build_behaviors() -> Dict[str, UpstreamBehavior]:
+    """Default behavior of every upstream, overridable with MOCK_<NAME>_<FIELD> variables."""
+    return {
+        "graph": UpstreamBehavior.from_env("graph", latency_ms=120, latency_p99_ms=600, rate_limit=80),
+        "labsmobile": UpstreamBehavior.from_env("labsmobile", latency_ms=150, latency_p99_ms=800, rate_limit=20),
+        "owo": UpstreamBehavior.from_env("owo", latency_ms=300, latency_p99_ms=1500),
+        "n8n": UpstreamBehavior.from_env("n8n", latency_ms=40, latency_p99_ms=150)
+    }
+
+
+def graph_error(status_code: int, code: int, message: str) -> JSONResponse:
+    """Error body in the Graph API format."""
+    return JSONResponse(
+        status_code=status_code,
+        content={"error": {"message": message, "type": "OAuthException", "code": code, "fbtrace_id": uuid.uuid4().hex[:12]}}
+    )
+
+
+def make_templates(count: int) -> List[dict]:
+    """Approved templates with named body variables, like the production catalog."""
+    templates = []
+    for i in range(count):
+        components = [
+            {"type": "BODY", "text": "Hola {{nombre}}, {{empresa}} tiene novedades para ti. Cargo: {{cargo}}."}
+        ]
+        if i % 3 == 1:
+            components.insert(0, {"type": "HEADER", "format": "IMAGE"})
+        templates.append({
+            "id": str(1000 + i),
+            "name": f"plantilla_{i}",
+            "language": "es_CO",
+            "status": "APPROVED",
+            "category": "MARKETING",
+            "components": components
+        })
+    return templates
+
+
+def make_owo_contacts(count: int) -> List[dict]:
+    """Raw OWO contacts mixing customers, staff and inactive records."""
+    contacts = []
+    for i in range(count):
+        is_customer = i % 3 != 0
+        contacts.append({
+            "name": f"Nombre{i}",
+            "lastName": f"Apellido{i}",
+            "fullName": f"Nombre{i} Apellido{i}",
+            "customerName": f"Cliente {i}" if is_customer else None,
+            "phoneNumber": f"300{i:07d}",
+            "email": f"contacto{i}@example.com" if i % 4 else None,
+            "isCustomer": is_customer,
+            "state": "N" if i % 17 == 0 else "A"
+        })
+    return contacts
+
+
+def graph_router(behavior: UpstreamBehavior) -> APIRouter:
+    """Graph API: template catalog and template message sends."""
+    router = APIRouter(prefix="/graph/{version}")
+    templates = make_templates(int(os.getenv("MOCK_GRAPH_TEMPLATES", "25")))
+
+    def check_token(request: Request) -> Optional[JSONResponse]:
+        if not request.headers.get("authorization", "").startswith("Bearer "):
+            return graph_error(401, 190, "Invalid OAuth access token.")
+        return None
+
+    @router.get("/{business_account_id}/message_templates")
+    async def message_templates(request: Request, limit: int = 25, after: Optional[str] = None, name: Optional[str] = None, status: Optional[str] = None):
+        error = check_token(request)
+        if error:
+            return error
+        outcome = await behavior.simulate()
+        if outcome == THROTTLED:
+            return graph_error(429, 80007, "(#80007) Rate limit hit for WhatsApp Business Account.")
+        if outcome == ERROR:
+            return graph_error(503, 2, "Service temporarily unavailable")
+
+        matching = [
+            t for t in templates
+            if (not name or t["name"] == name) and (not status or t["status"] == status)
+        ]
+        start = int(after) if after and after.isdigit() else 0
+        page = matching[start:start + limit]
+        paging = {"cursors": {"before": str(start), "after": str(start + len(page))}}
+        if start + len(page) < len(matching):
+            paging["next"] = str(request.url.include_query_params(after=start + len(page)))
+        return {"data": page, "paging": paging}
+
+    @router.post("/{phone_number_id}/messages")
+    async def send_message(phone_number_id: str, request: Request):
+        error = check_token(request)
+        if error:
+            return error
+        payload = await request.json()
+        outcome = await behavior.simulate()
+        if outcome == THROTTLED:
+            return graph_error(429, 130429, "(#130429) Rate limit hit")
+        if outcome == ERROR:
+            return graph_error(500, 1, "An unknown error occurred")
+        if payload.get("type") != "template" or not payload.get("template", {}).get("name"):
+            return graph_error(400, 100, "(#100) Invalid parameter")
+        if behavior.recipient_fails():
+            return graph_error(400, 131026, "Message undeliverable")
+
+        to = payload.get("to", "")
+        return {
+            "messaging_product": "whatsapp",
+            "contacts": [{"input": to, "wa_id": to}],
+            "messages": [{"id": f"wamid.{uuid.uuid4().hex}", "message_status": "accepted"}]
+        }
+
+    return router
+
+
+def labsmobile_router(behavior: UpstreamBehavior) -> APIRouter:
+    """LabsMobile JSON API: send and balance."""
+    router = APIRouter(prefix="/labsmobile/json")
+
+    @router.post("/send")
+    async def send(request: Request):
+        payload = await request.json()
+        outcome = await behavior.simulate()
+        if outcome == THROTTLED:
+            return JSONResponse(status_code=429, content={"code": "29", "message": "Too many requests"})
+        if outcome == ERROR:
+            # LabsMobile gateways answer outages with HTML
+            return PlainTextResponse("<html><body>502 Bad Gateway</body></html>", status_code=502)
+
+        recipients = payload.get("recipient") or []
+        if not payload.get("message") or not recipients:
+            return {"code": "21", "message": "The message element cannot be empty"}
+        if behavior.recipient_fails():
+            return {"code": "30", "message": "Error sending the message"}
+        return {"code": "0", "message": "Message has been successfully sent", "subid": uuid.uuid4().hex[:13]}
+
+    @router.get("/balance")
+    async def balance():
+        outcome = await behavior.simulate()
+        if outcome == THROTTLED:
+            return JSONResponse(status_code=429, content={"code": "29", "message": "Too many requests"})
+        if outcome == ERROR:
+            return PlainTextResponse("<html><body>502 Bad Gateway</body></html>", status_code=502)
+        return {"code": 0, "credits": "100000.00"}
+
+    return router
+
+
+def owo_router(behavior: UpstreamBehavior) -> APIRouter:
+    """OWO API: login and contacts, with expiring bearer tokens."""
+    router = APIRouter(prefix="/owo")
+    contacts = make_owo_contacts(int(os.getenv("MOCK_OWO_CONTACTS", "1000")))
+    token_ttl = float(os.getenv("MOCK_OWO_TOKEN_TTL", "3600"))
+    tokens: Dict[str, float] = {}
+
+    @router.post("/login")
+    async def login(request: Request):
+        credentials = await request.json()
+        outcome = await behavior.simulate()
+        if outcome == ERROR:
+            raise HTTPException(status_code=500, detail="Internal Server Error")
+        if outcome == THROTTLED:
+            raise HTTPException(status_code=429, detail="Too Many Requests")
+        if not credentials.get("email") or not credentials.get("password"):
+            raise HTTPException(status_code=401, detail="Invalid credentials")
+        token = uuid.uuid4().hex
+        tokens[token] = time.monotonic() + token_ttl
+        return {"token": token}
+
+    @router.get("/contacts")
+    async def get_contacts(request: Request):
+        token = request.headers.get("authorization", "")[len("Bearer "):]
+        if tokens.get(token, 0) < time.monotonic():
+            tokens.pop(token, None)
+            # The real API redirects expired sessions to its login page
+            return PlainTextResponse("", status_code=302, headers={"Location": "/login"})
+        outcome = await behavior.simulate()
+        if outcome == ERROR:
+            raise HTTPException(status_code=500, detail="Internal Server Error")
+        if outcome == THROTTLED:
+            raise HTTPException(status_code=429, detail="Too Many Requests")
+        return {"payload": {"data": contacts}}
+
+    return router
+
+
+def n8n_router(behavior: UpstreamBehavior, callback_url: str) -> APIRouter:
+    """
+    n8n webhooks for WhatsApp and email batches.
+
+    Accepted batches are "delivered" in the background and reported to the
+    backend's /messages/callback in chunks, like the production workflows,
+    echoing the batch's 'traceparent'.
+    """
+    router = APIRouter(prefix="/n8n")
+    callback_delay = float(os.getenv("MOCK_N8N_CALLBACK_DELAY_MS", "500")) / 1000
+    callback_chunk = max(1, int(os.getenv("MOCK_N8N_CALLBACK_CHUNK", "500")))
+    pending: Set[asyncio.Task] = set()
+
+    async def report(batch_id: str, channel: str, recipients: List[Dict[str, Any]], traceparent: Optional[str]):
+        await asyncio.sleep(callback_delay)
+        key = "email" if channel == "email" else "phone"
+        async with httpx.AsyncClient(timeout=60.0) as client:
+            for start in range(0, len(recipients), callback_chunk):
+                results = []
+                for recipient in recipients[start:start + callback_chunk]:
+                    failed = behavior.recipient_fails()
+                    results.append({
+                        key: recipient.get(key),
+                        "success": not failed,
+                        "error": "Mock delivery failure" if failed else None
+                    })
+                try:
+                    await client.post(
+                        callback_url,
+                        json={"batch_id": batch_id, "results": results, "traceparent": traceparent}
+                    )
+                except httpx.HTTPError as e:
+                    print(f"[MOCK N8N] Callback fallido para {batch_id}: {e}")
+
+    @router.post("/{channel}")
+    async def webhook(channel: str, request: Request):
+        if channel not in ("whatsapp", "email"):
+            raise HTTPException(status_code=404, detail="Webhook not registered")
+        payload = await request.json()
+        outcome = await behavior.simulate()
+        if outcome == THROTTLED:
+            raise HTTPException(status_code=429, detail="Too Many Requests")
+        if outcome == ERROR:
+            raise HTTPException(status_code=500, detail="Workflow could not be started")
+
+        recipients = payload.get("recipients") or []
+        if payload.get("batch_id") and callback_url:
+            task = asyncio.create_task(report(payload["batch_id"], channel, recipients, payload.get("traceparent")))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+        return {"message": "Workflow was started"}
+
+    router.pending_callbacks = pending
+    return router
+
+
+def create_app(callback_url: Optional[str] = None) -> FastAPI:
+    """
+    Build the mock upstream app.
+
+    Every upstream has its own prefix (/graph, /labsmobile, /owo, /n8n).
+    GET /mock/status shows the behaviors and request counters and
+    PUT /mock/behavior/{name} changes a behavior while the app runs.
+    """
+    app = FastAPI(title="Mock upstreams")
+    behaviors = build_behaviors()
+    n8n = n8n_router(behaviors["n8n"], callback_url or os.getenv("MOCK_CALLBACK_URL", DEFAULT_CALLBACK_URL))
+
+    app.include_router(graph_router(behaviors["graph"]))
+    app.include_router(labsmobile_router(behaviors["labsmobile"]))
+    app.include_router(owo_router(behaviors["owo"]))
+    app.include_router(n8n)
+    app.state.behaviors = behaviors
+
+    @app.get("/mock/status")
+    async def mock_status():
+        return {
+            "upstreams": {name: behavior.status() for name, behavior in behaviors.items()},
+            "pending_callbacks": len(n8n.pending_callbacks)
+        }
+
+    @app.put("/mock/behavior/{name}")
+    async def update_behavior(name: str, values: Dict[str, float]):
+        if name not in behaviors:
+            raise HTTPException(status_code=404, detail="Upstream desconocido")
+        behaviors[name].update(values)
+        return behaviors[name].status()
+
+    return app
@@ -0,0 +1,111 @@
+"""Latency, error and rate-limit simulation for the mock upstreams."""
+import asyncio
+import math
+import os
+import random
+import time
+from typing import Any, Dict, Optional
+
+# 99th percentile of the standard normal distribution
+Z_99 = 2.326
+
+THROTTLED = "throttled"
+ERROR = "error"
+
+
+class UpstreamBehavior:
+    """
+    How one mock upstream answers.
+
+    Latency is lognormal with the given median and 99th percentile (fixed at
+    the median when both are equal). `error_rate` is the share of requests
+    answered with a server error, `rate_limit` the requests per second
+    accepted before answering with the upstream's throttling error (0 means
+    unlimited), and `recipient_failure_rate` the share of recipients reported
+    as failed in otherwise successful answers.
+    """
+
+    FIELDS = ("latency_ms", "latency_p99_ms", "error_rate", "rate_limit", "recipient_failure_rate")
+
+    def __init__(
+        self,
+        name: str,
+        latency_ms: float = 50.0,
+        latency_p99_ms: float = 200.0,
+        error_rate: float = 0.0,
+        rate_limit: float = 0.0,
+        recipient_failure_rate: float = 0.0
+    ):
+        self.name = name
+        self.latency_ms = latency_ms
+        self.latency_p99_ms = latency_p99_ms
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.recipient_failure_rate = recipient_failure_rate
+        self.requests = 0
+        self.errors = 0
+        self.throttled = 0
+        self._window_start = time.monotonic()
+        self._window_count = 0
+
+    @classmethod
+    def from_env(cls, name: str, **defaults) -> "UpstreamBehavior":
+        """Build from MOCK_<NAME>_<FIELD> environment variables, e.g. MOCK_GRAPH_ERROR_RATE."""
+        values = dict(defaults)
+        for field in cls.FIELDS:
+            raw = os.getenv(f"MOCK_{name.upper()}_{field.upper()}")
+            if raw is not None:
+                values[field] = float(raw)
+        return cls(name, **values)
+
+    def update(self, values: Dict[str, Any]):
+        """Change the behavior at runtime; unknown fields are ignored."""
+        for field in self.FIELDS:
+            if values.get(field) is not None:
+                setattr(self, field, float(values[field]))
+
+    def sample_latency(self) -> float:
+        """Seconds to wait before answering."""
+        median = max(self.latency_ms, 0.0) / 1000
+        if median == 0 or self.latency_p99_ms <= self.latency_ms:
+            return median
+        sigma = math.log(self.latency_p99_ms / self.latency_ms) / Z_99
+        return random.lognormvariate(math.log(median), sigma)
+
+    def _over_rate_limit(self) -> bool:
+        if self.rate_limit <= 0:
+            return False
+        now = time.monotonic()
+        if now - self._window_start >= 1.0:
+            self._window_start = now
+            self._window_count = 0
+        self._window_count += 1
+        return self._window_count > self.rate_limit
+
+    async def simulate(self) -> Optional[str]:
+        """
+        Wait the sampled latency and decide the outcome of one request.
+
+        Returns THROTTLED, ERROR or None for a normal answer. Throttled
+        requests answer right away, like a real rate limiter.
+        """
+        self.requests += 1
+        if self._over_rate_limit():
+            self.throttled += 1
+            return THROTTLED
+        await asyncio.sleep(self.sample_latency())
+        if random.random() < self.error_rate:
+            self.errors += 1
+            return ERROR
+        return None
+
+    def recipient_fails(self) -> bool:
+        return random.random() < self.recipient_failure_rate
+
+    def status(self) -> dict:
+        return {
+            **{field: getattr(self, field) for field in self.FIELDS},
+            "requests": self.requests,
+            "errors": self.errors,
+            "throttled": self.throttled
+        }
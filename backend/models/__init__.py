@@ -2,6 +2,8 @@
 from models.template import Template
 from models.message_log import MessageLog
 from models.group import Group, GroupContact
+from models.idempotency import IdempotencyKey
+from models.campaign import Campaign, CampaignRecipient
 
-__all__ = ["Template", "MessageLog", "Group", "GroupContact"]
+__all__ = ["Template", "MessageLog", "Group", "GroupContact", "IdempotencyKey", "Campaign", "CampaignRecipient"]
 
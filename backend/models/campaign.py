@@ -0,0 +1,83 @@
+"""Campaign models for scheduled, throttled sends."""
+from sqlalchemy import Column, Integer, String, Text, DateTime, JSON, Boolean, ForeignKey, Index
+from sqlalchemy.orm import relationship
+from database import Base
+from models.message_log import get_colombia_time
+
+
+class Campaign(Base):
+    """
+    A send scheduled for later and released gradually.
+    
+    Times are naive datetimes in Colombia time (see get_colombia_time).
+    """
+    
+    __tablename__ = "campaigns"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String(255), nullable=False)
+    channel = Column(String(50), nullable=False)  # whatsapp_template, sms
+    # Channel parameters: template_name, language_code, variable_mapping, header_media_url / message, test
+    params = Column(JSON, default=dict)
+    # Referenced audience, resolved when the campaign starts; inline recipients are stored directly
+    group_id = Column(Integer, nullable=True)
+    department = Column(String(50), nullable=True)
+    start_at = Column(DateTime, nullable=False, default=get_colombia_time)
+    send_windows = Column(JSON, default=list)  # ["08:00-12:00", "14:00-19:00"]; empty means any time
+    send_days = Column(JSON, default=list)  # Weekdays 0 (Monday) to 6; empty means every day
+    max_rate_per_minute = Column(Integer, nullable=False, default=60)
+    status = Column(String(50), default="scheduled")  # scheduled, running, paused, completed, cancelled, failed
+    paused_by_user = Column(Boolean, default=False)
+    recipients_loaded = Column(Boolean, default=False)
+    total = Column(Integer, default=0)
+    sent = Column(Integer, default=0)
+    failed = Column(Integer, default=0)
+    last_error = Column(Text, nullable=True)
+    # Earliest time of the next release; paces rates below one recipient per scheduler tick
+    next_release_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, default=get_colombia_time)
+    updated_at = Column(DateTime, default=get_colombia_time, onupdate=get_colombia_time)
+    completed_at = Column(DateTime, nullable=True)
+    
+    recipients = relationship("CampaignRecipient", back_populates="campaign", cascade="all, delete-orphan")
+    
+    __table_args__ = (
+        Index("ix_campaigns_status_start_at", "status", "start_at"),
+    )
+    
+    def __repr__(self):
+        return f"<Campaign(id={self.id}, name='{self.name}', status='{self.status}')>"
+
+
+class CampaignRecipient(Base):
+    """A recipient of a campaign, released in id order."""
+    
+    __tablename__ = "campaign_recipients"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    campaign_id = Column(Integer, ForeignKey("campaigns.id", ondelete="CASCADE"), nullable=False)
+    name = Column(String(255), nullable=True)
+    phone = Column(String(50), nullable=True)
+    email = Column(String(255), nullable=True)
+    data = Column(JSON, default=dict)  # Extra fields used as template variables
+    status = Column(String(50), default="pending")  # pending, sent, failed, skipped
+    error_message = Column(Text, nullable=True)
+    sent_at = Column(DateTime, nullable=True)
+    # Still claimed by an interrupted release: not released again before this time
+    retry_at = Column(DateTime, nullable=True)
+    
+    campaign = relationship("Campaign", back_populates="recipients")
+    
+    __table_args__ = (
+        # Next pending recipients of a campaign in release order
+        Index("ix_campaign_recipients_campaign_status", "campaign_id", "status", "id"),
+        # Only the pending recipients, which shrink as the campaign advances
+        Index(
+            "ix_campaign_recipients_pending", "campaign_id", "id",
+            postgresql_where=status == "pending",
+            sqlite_where=status == "pending"
+        ),
+    )
+    
+    def __repr__(self):
+        return f"<CampaignRecipient(id={self.id}, campaign_id={self.campaign_id}, status='{self.status}')>"
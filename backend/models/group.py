@@ -1,15 +1,43 @@
 """Group and GroupContact models for managing contact groups."""
+import re
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey
-from sqlalchemy.orm import relationship
+from typing import Optional
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Index
+from sqlalchemy.orm import relationship, validates
 from database import Base
 import pytz
 
 
 def get_colombia_time():
-    """Get current time in Colombia timezone (America/Bogota)."""
+    """Get current time in Colombia timezone (America/Bogota) as naive datetime."""
     colombia_tz = pytz.timezone('America/Bogota')
-    return datetime.now(colombia_tz)
+    # Naive like every other timestamp: PostgreSQL rejects aware values for TIMESTAMP columns
+    return datetime.now(colombia_tz).replace(tzinfo=None)
+
+
+def phone_match_key(phone: Optional[str]) -> Optional[str]:
+    """
+    Normalize a phone number into a comparison key (digits only, with 57 prefix).
+    
+    '+57 300 123 4567', '3001234567' and '573001234567' all map to '573001234567'.
+    """
+    if not phone:
+        return None
+    digits = re.sub(r'\D', '', str(phone))
+    if not digits:
+        return None
+    # Same Colombian rules as the +57 normalization applied on insert
+    if (len(digits) == 10 and digits.startswith('3')) or len(digits) == 7:
+        digits = f"57{digits}"
+    return digits
+
+
+def email_match_key(email: Optional[str]) -> Optional[str]:
+    """Normalize an email into a comparison key (trimmed, lowercase)."""
+    if not email:
+        return None
+    key = str(email).strip().lower()
+    return key or None
 
 
 class Group(Base):
@@ -36,14 +64,32 @@ class GroupContact(Base):
     __tablename__ = "group_contacts"
     
     id = Column(Integer, primary_key=True, index=True)
-    group_id = Column(Integer, ForeignKey("groups.id", ondelete="CASCADE"), nullable=False)
+    group_id = Column(Integer, ForeignKey("groups.id", ondelete="CASCADE"), nullable=False, index=True)
     name = Column(String(255), nullable=False)
     phone = Column(String(50), nullable=True)
     email = Column(String(255), nullable=True)
+    # Normalized keys used to match contacts across groups and segments
+    phone_key = Column(String(50), nullable=True)
+    email_key = Column(String(255), nullable=True)
     created_at = Column(DateTime, default=get_colombia_time)
     
+    __table_args__ = (
+        Index("ix_group_contacts_group_phone_key", "group_id", "phone_key"),
+        Index("ix_group_contacts_group_email_key", "group_id", "email_key"),
+    )
+    
     # Relationship to group
     group = relationship("Group", back_populates="contacts")
     
+    @validates("phone")
+    def _set_phone_key(self, key, value):
+        self.phone_key = phone_match_key(value)
+        return value
+    
+    @validates("email")
+    def _set_email_key(self, key, value):
+        self.email_key = email_match_key(value)
+        return value
+    
     def __repr__(self):
         return f"<GroupContact(id={self.id}, name='{self.name}', group_id={self.group_id})>"
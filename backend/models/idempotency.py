@@ -0,0 +1,44 @@
+"""IdempotencyKey model for deduplicating sends across retries."""
+from sqlalchemy import Column, Integer, String, Text, DateTime, UniqueConstraint, Index
+from database import Base
+from models.message_log import get_colombia_time
+
+
+class IdempotencyKey(Base):
+    """
+    One claimed send per (campaign, channel, recipient).
+    
+    A recipient is claimed as 'pending' before dispatch and marked 'sent' or
+    'failed' afterwards; only failed claims can be taken again.
+    """
+    
+    __tablename__ = "idempotency_keys"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    campaign_key = Column(String(255), nullable=False)  # Idempotency-Key header or internal campaign id
+    channel = Column(String(20), nullable=False)  # whatsapp, email, sms
+    recipient = Column(String(255), nullable=False)  # Normalized phone or email
+    status = Column(String(20), nullable=False, default="pending")  # pending, sent, failed
+    claim_id = Column(String(50), nullable=True)
+    batch_id = Column(String(50), nullable=True)
+    message_id = Column(String(255), nullable=True)
+    error_message = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=get_colombia_time)
+    updated_at = Column(DateTime, default=get_colombia_time, onupdate=get_colombia_time)
+    
+    __table_args__ = (
+        UniqueConstraint("campaign_key", "channel", "recipient", name="uq_idempotency_scope"),
+        Index("ix_idempotency_keys_claim", "claim_id"),
+        Index("ix_idempotency_keys_created_at", "created_at"),
+        # Callback outcomes are matched on (batch, recipient); also serves lookups by batch
+        Index("ix_idempotency_keys_batch_recipient", "batch_id", "recipient"),
+        # Pending claims of a batch, released when its webhook fails
+        Index(
+            "ix_idempotency_keys_pending_batch", "batch_id",
+            postgresql_where=status == "pending",
+            sqlite_where=status == "pending"
+        ),
+    )
+    
+    def __repr__(self):
+        return f"<IdempotencyKey(campaign='{self.campaign_key}', channel='{self.channel}', recipient='{self.recipient}', status='{self.status}')>"
@@ -1,6 +1,6 @@
 """MessageLog model for tracking sent messages."""
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, Text, DateTime, JSON
+from sqlalchemy import Column, Integer, String, Text, DateTime, JSON, Index
 from database import Base
 import pytz
 
@@ -28,7 +28,21 @@ class MessageLog(Base):
     error_message = Column(Text, nullable=True)
     sent_at = Column(DateTime, default=get_colombia_time)
     attachments = Column(JSON, default=list)  # List of attachment filenames
-    batch_id = Column(String(50), nullable=True, index=True)
+    batch_id = Column(String(50), nullable=True)
+    
+    __table_args__ = (
+        # History pages and exports are ordered by date
+        Index("ix_message_logs_sent_at", "sent_at"),
+        # Callback results are matched on (batch, address); also serve lookups by batch
+        Index("ix_message_logs_batch_phone", "batch_id", "recipient_phone"),
+        Index("ix_message_logs_batch_email", "batch_id", "recipient_email"),
+        # Pending rows of a batch (failed webhooks); partial, so it stays small
+        Index(
+            "ix_message_logs_pending_batch", "batch_id",
+            postgresql_where=status == "pending",
+            sqlite_where=status == "pending"
+        ),
+    )
     
     def __repr__(self):
         return f"<MessageLog(id={self.id}, recipient='{self.recipient_name}', status='{self.status}')>"
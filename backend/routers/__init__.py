@@ -7,6 +7,8 @@ from routers.whatsapp import router as whatsapp_router
 from routers.assistant import router as assistant_router
 from routers.sms import router as sms_router
 from routers.groups import router as groups_router
+from routers.campaigns import router as campaigns_router
+from routers.admin import router as admin_router
 
-__all__ = ["contacts_router", "templates_router", "messages_router", "history_router", "whatsapp_router", "assistant_router", "sms_router", "groups_router"]
+__all__ = ["contacts_router", "templates_router", "messages_router", "history_router", "whatsapp_router", "assistant_router", "sms_router", "groups_router", "campaigns_router", "admin_router"]
 
@@ -0,0 +1,71 @@
+"""Admin router for on-demand profiling."""
+import logging
+import os
+import secrets
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Header
+from fastapi.responses import FileResponse
+from config import get_settings
+from schemas.admin import ProfilingRequest
+from services.profiler import ANY, JOB_NAMES, profiler
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+
+async def require_admin(x_admin_token: Optional[str] = Header(None, alias="X-Admin-Token")):
+    """Gate admin endpoints behind the X-Admin-Token header (ADMIN_TOKEN)."""
+    if not settings.admin_token:
+        raise HTTPException(status_code=403, detail="Endpoints de administración deshabilitados (ADMIN_TOKEN no configurado)")
+    if not x_admin_token or not secrets.compare_digest(x_admin_token, settings.admin_token):
+        raise HTTPException(status_code=403, detail="Token de administración inválido")
+
+
+router = APIRouter(prefix="/admin", tags=["admin"], dependencies=[Depends(require_admin)])
+
+
+@router.get("/profiling")
+async def profiling_status():
+    """Armed targets and the profiles written so far."""
+    return {**profiler.status(), "artifacts": profiler.artifacts()}
+
+
+@router.post("/profiling")
+async def arm_profiling(request: ProfilingRequest):
+    """
+    Arm the profiler for the next requests to a route, the next background
+    jobs, and/or start a time window that samples everything running
+    (e.g. a bulk send already in progress).
+    """
+    if not request.route and not request.job and not request.seconds:
+        raise HTTPException(status_code=400, detail="Indique route, job o seconds")
+    if request.job and request.job != ANY and request.job not in JOB_NAMES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Trabajo desconocido: {request.job}. Opciones: {', '.join(JOB_NAMES)} o '*'"
+        )
+    if request.seconds and not profiler.start_window(request.seconds):
+        raise HTTPException(status_code=409, detail="Ya hay un perfilado en curso")
+    
+    if request.route:
+        profiler.arm_route(request.route, request.requests)
+    if request.job:
+        profiler.arm_jobs(request.job, request.jobs)
+    logger.info(f"Profiling armed: route={request.route} x{request.requests}, job={request.job} x{request.jobs}, seconds={request.seconds}")
+    return profiler.status()
+
+
+@router.delete("/profiling")
+async def disarm_profiling():
+    """Clear every armed target and stop a running window (its profile is still written)."""
+    profiler.disarm()
+    return profiler.status()
+
+
+@router.get("/profiling/{name}")
+async def download_profile(name: str):
+    """Download one profile artifact."""
+    path = os.path.join(profiler.output_dir, os.path.basename(name))
+    if os.path.basename(name) != name or not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail="Perfil no encontrado")
+    return FileResponse(path, filename=name)
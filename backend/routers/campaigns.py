@@ -0,0 +1,145 @@
+"""Campaigns router: scheduled sends with time windows and throttled release."""
+import logging
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import select, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import get_db, get_read_db
+from models.campaign import Campaign, CampaignRecipient
+from models.message_log import get_colombia_time
+from schemas.campaign import CampaignCreate, CampaignResponse
+from services.audience_service import group_exists
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/campaigns", tags=["campaigns"])
+
+
+async def get_campaign_or_404(db: AsyncSession, campaign_id: int) -> Campaign:
+    campaign = await db.get(Campaign, campaign_id)
+    if campaign is None:
+        raise HTTPException(status_code=404, detail="Campaña no encontrada")
+    return campaign
+
+
+@router.post("", response_model=CampaignResponse)
+async def create_campaign(campaign_data: CampaignCreate, db: AsyncSession = Depends(get_db)):
+    """
+    Schedule a campaign.
+    
+    The campaign starts at start_at (Colombia time), only sends inside its
+    send windows and releases at most max_rate_per_minute recipients per
+    minute. Referenced groups/segments are resolved when the campaign starts.
+    """
+    if campaign_data.group_id is not None and not await group_exists(db, campaign_data.group_id):
+        raise HTTPException(status_code=404, detail="Grupo no encontrado")
+    
+    start_at = campaign_data.start_at or get_colombia_time()
+    if start_at.tzinfo is not None:
+        # Stored as naive Colombia time, like the rest of the timestamps
+        from pytz import timezone
+        start_at = start_at.astimezone(timezone('America/Bogota')).replace(tzinfo=None)
+    
+    if campaign_data.channel == "whatsapp_template":
+        params = {
+            "template_name": campaign_data.template_name,
+            "language_code": campaign_data.language_code,
+            "variable_mapping": campaign_data.variable_mapping,
+            "header_media_url": campaign_data.header_media_url
+        }
+    else:
+        params = {"message": campaign_data.message, "test": campaign_data.test}
+    
+    inline = campaign_data.audience_operand() is None
+    campaign = Campaign(
+        name=campaign_data.name,
+        channel=campaign_data.channel,
+        params=params,
+        group_id=campaign_data.group_id,
+        department=campaign_data.department,
+        start_at=start_at,
+        send_windows=campaign_data.send_windows,
+        send_days=campaign_data.send_days,
+        max_rate_per_minute=campaign_data.max_rate_per_minute,
+        status="scheduled",
+        recipients_loaded=inline,
+        total=len(campaign_data.recipients) if inline else 0
+    )
+    db.add(campaign)
+    await db.flush()
+    
+    if inline:
+        rows = []
+        for recipient in campaign_data.recipients:
+            data = recipient.model_dump()
+            rows.append({
+                "campaign_id": campaign.id,
+                "name": data.pop("name", None),
+                "phone": data.pop("phone", None),
+                "email": data.pop("email", None),
+                "data": data,
+                "status": "pending"
+            })
+        await db.execute(insert(CampaignRecipient), rows)
+    
+    await db.commit()
+    await db.refresh(campaign)
+    logger.info(f"Campaign {campaign.id} scheduled for {campaign.start_at}")
+    return campaign
+
+
+@router.get("", response_model=List[CampaignResponse])
+async def list_campaigns(
+    status: Optional[str] = Query(None, description="Filtrar por estado"),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """List campaigns, newest first."""
+    stmt = select(Campaign).order_by(Campaign.id.desc())
+    if status:
+        stmt = stmt.where(Campaign.status == status)
+    result = await db.execute(stmt)
+    return result.scalars().all()
+
+
+@router.get("/{campaign_id}", response_model=CampaignResponse)
+async def get_campaign(campaign_id: int, db: AsyncSession = Depends(get_read_db)):
+    """Get a campaign with its progress."""
+    return await get_campaign_or_404(db, campaign_id)
+
+
+@router.post("/{campaign_id}/pause", response_model=CampaignResponse)
+async def pause_campaign(campaign_id: int, db: AsyncSession = Depends(get_db)):
+    """Pause a campaign until it is resumed manually."""
+    campaign = await get_campaign_or_404(db, campaign_id)
+    if campaign.status not in ("scheduled", "running", "paused"):
+        raise HTTPException(status_code=400, detail=f"No se puede pausar una campaña en estado '{campaign.status}'")
+    campaign.paused_by_user = True
+    campaign.status = "paused"
+    await db.commit()
+    await db.refresh(campaign)
+    return campaign
+
+
+@router.post("/{campaign_id}/resume", response_model=CampaignResponse)
+async def resume_campaign(campaign_id: int, db: AsyncSession = Depends(get_db)):
+    """Resume a manually paused campaign; it sends again in its next window."""
+    campaign = await get_campaign_or_404(db, campaign_id)
+    if campaign.status != "paused":
+        raise HTTPException(status_code=400, detail="La campaña no está pausada")
+    campaign.paused_by_user = False
+    await db.commit()
+    await db.refresh(campaign)
+    return campaign
+
+
+@router.post("/{campaign_id}/cancel", response_model=CampaignResponse)
+async def cancel_campaign(campaign_id: int, db: AsyncSession = Depends(get_db)):
+    """Cancel a campaign; recipients not yet released are not sent."""
+    campaign = await get_campaign_or_404(db, campaign_id)
+    if campaign.status in ("completed", "cancelled"):
+        raise HTTPException(status_code=400, detail=f"La campaña ya está en estado '{campaign.status}'")
+    campaign.status = "cancelled"
+    campaign.completed_at = get_colombia_time()
+    await db.commit()
+    await db.refresh(campaign)
+    return campaign
@@ -6,6 +6,9 @@ from fastapi import APIRouter, HTTPException, Query
 from typing import Optional, List
 from config import get_settings
 from schemas.contact import Contact, ContactsResponse
+from services.circuit_breaker import get_breaker
+from services.metrics import observe_upstream, record_cache
+from services.tracing import span
 
 router = APIRouter(prefix="/contacts", tags=["contacts"])
 settings = get_settings()
@@ -56,7 +59,9 @@ async def get_owo_token(force_refresh: bool = False) -> str:
     
     # Check if we have a valid cached token
     if not force_refresh and _token_cache["token"] and not is_token_expired():
+        record_cache("owo_token", True)
         return _token_cache["token"]
+    record_cache("owo_token", False)
     
     if not settings.owo_api_login_url or not settings.owo_api_email or not settings.owo_api_password:
         raise HTTPException(
@@ -69,13 +74,20 @@ async def get_owo_token(force_refresh: bool = False) -> str:
     for attempt in range(MAX_RETRIES):
         try:
             async with httpx.AsyncClient(timeout=30.0, verify=settings.ssl_verify) as client:
-                response = await client.post(
-                    settings.owo_api_login_url,
-                    json={
-                        "email": settings.owo_api_email,
-                        "password": settings.owo_api_password
-                    }
-                )
+                started = time.perf_counter()
+                try:
+                    with span("owo login", attempt=attempt + 1):
+                        response = await client.post(
+                            settings.owo_api_login_url,
+                            json={
+                                "email": settings.owo_api_email,
+                                "password": settings.owo_api_password
+                            }
+                        )
+                except httpx.HTTPError:
+                    observe_upstream("owo", started)
+                    raise
+                observe_upstream("owo", started, response.status_code)
                 response.raise_for_status()
                 data = response.json()
                 
@@ -143,11 +155,18 @@ async def fetch_owo_contacts(token: str, retry_with_new_token: bool = True) -> L
                     "User-Agent": "MasivosOWO/1.0"
                 }
                 print(f"[DEBUG] Headers: {headers}")
-                response = await client.get(
-                    settings.owo_api_contacts_url,
-                    headers=headers,
-                    follow_redirects=False  # Detect 302s instead of following them
-                )
+                started = time.perf_counter()
+                try:
+                    with span("owo contacts", attempt=attempt + 1):
+                        response = await client.get(
+                            settings.owo_api_contacts_url,
+                            headers=headers,
+                            follow_redirects=False  # Detect 302s instead of following them
+                        )
+                except httpx.HTTPError:
+                    observe_upstream("owo", started)
+                    raise
+                observe_upstream("owo", started, response.status_code)
                 
                 # Treat redirects (302, 307) as auth failures (redirect to login)
                 if response.status_code in [302, 307, 301]:
@@ -338,6 +357,78 @@ def transform_owo_contact(raw_contact: dict, index: int) -> Contact:
     )
 
 
+async def load_owo_raw_contacts() -> List[dict]:
+    """
+    Authenticate and fetch every contact from the OWO API, untransformed.
+    
+    Callers that only need part of the contacts (a segment) transform them
+    as they go instead of building a Contact for every one.
+    
+    Raises:
+        HTTPException 503 while the OWO circuit is open.
+    """
+    breaker = get_breaker("owo")
+    configured = bool(settings.owo_api_login_url and settings.owo_api_contacts_url)
+    if configured and not breaker.allow():
+        raise HTTPException(
+            status_code=503,
+            detail=f"API OWO no disponible temporalmente; reintente en {int(breaker.retry_after()) + 1} s"
+        )
+    
+    try:
+        # Step 1: Get authentication token
+        token = await get_owo_token()
+        
+        # Step 2: Fetch contacts using the token
+        raw_contacts = await fetch_owo_contacts(token)
+    except Exception:
+        if configured:
+            breaker.record_failure()
+        raise
+    breaker.record_success()
+    return raw_contacts
+
+
+async def load_owo_contacts() -> List[Contact]:
+    """
+    Authenticate, fetch and transform every contact from the OWO API.
+    
+    Returns:
+        List of Contact objects, including inactive ones (department "Inactivo").
+    
+    Raises:
+        HTTPException 503 while the OWO circuit is open.
+    """
+    raw_contacts = await load_owo_raw_contacts()
+    
+    # Transform OWO contacts to our schema
+    with span("owo.transform", contacts=len(raw_contacts)):
+        return [
+            transform_owo_contact(raw, idx) 
+            for idx, raw in enumerate(raw_contacts)
+        ]
+
+
+def filter_contacts(contacts: List[Contact], search: Optional[str], department: Optional[str]) -> List[Contact]:
+    """Filter contacts by a search term (name, email or phone) and by department."""
+    if search:
+        search_lower = search.lower()
+        contacts = [
+            c for c in contacts
+            if search_lower in c.name.lower()
+            or (c.email and search_lower in c.email.lower())
+            or (c.phone and search_lower in c.phone)
+        ]
+    
+    if department:
+        contacts = [
+            c for c in contacts 
+            if c.department and c.department.lower() == department.lower()
+        ]
+    
+    return contacts
+
+
 @router.get("", response_model=ContactsResponse)
 async def get_contacts(
     search: Optional[str] = Query(None, description="Search term for filtering contacts"),
@@ -360,18 +451,8 @@ async def get_contacts(
     contacts: List[Contact] = []
     
     try:
-        # Step 1: Get authentication token
-        token = await get_owo_token()
-        
-        # Step 2: Fetch contacts using the token
-        raw_contacts = await fetch_owo_contacts(token)
-        
-        # Step 3: Transform OWO contacts to our schema
         # Include ALL contacts, identifying inactive ones via department
-        contacts = [
-            transform_owo_contact(raw, idx) 
-            for idx, raw in enumerate(raw_contacts)
-        ]
+        contacts = await load_owo_contacts()
         
     except HTTPException as e:
         # Re-raise HTTP exceptions
@@ -384,20 +465,7 @@ async def get_contacts(
         )
     
     # Apply local filtering
-    if search:
-        search_lower = search.lower()
-        contacts = [
-            c for c in contacts
-            if search_lower in c.name.lower()
-            or (c.email and search_lower in c.email.lower())
-            or (c.phone and search_lower in c.phone)
-        ]
-    
-    if department:
-        contacts = [
-            c for c in contacts 
-            if c.department and c.department.lower() == department.lower()
-        ]
+    contacts = filter_contacts(contacts, search, department)
     
     # Apply pagination
     total = len(contacts)
@@ -1,22 +1,36 @@
 """Groups router for managing contact groups."""
 import io
 import re
+import json
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Query
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, func
 from sqlalchemy.orm import selectinload
 
-from database import get_db
+from database import get_db, get_read_db, async_session
 from models.group import Group, GroupContact
 from schemas.group import (
     GroupCreate, GroupUpdate, GroupResponse, GroupDetailResponse,
     GroupContactCreate, GroupContactUpdate, GroupContactResponse,
-    ExcelUploadResponse
+    GroupContactPage, ExcelUploadResponse
 )
+from schemas.audience import AudienceRequest, AudienceCountResponse
+from services.audience_service import count_audience, iter_audience, materialize_audience
 
 router = APIRouter(prefix="/groups", tags=["groups"])
 
+# Columns that can be requested through the 'fields' projection
+CONTACT_FIELDS = {
+    "id": GroupContact.id,
+    "group_id": GroupContact.group_id,
+    "name": GroupContact.name,
+    "phone": GroupContact.phone,
+    "email": GroupContact.email,
+    "created_at": GroupContact.created_at,
+}
+
 
 def normalize_phone(phone: str) -> str:
     """Normalize phone number to +57 format for Colombia."""
@@ -44,7 +58,7 @@ def normalize_phone(phone: str) -> str:
 
 
 @router.get("", response_model=List[GroupResponse])
-async def get_groups(db: AsyncSession = Depends(get_db)):
+async def get_groups(db: AsyncSession = Depends(get_read_db)):
     """Get all groups with contact counts."""
     # Query groups with contact count
     stmt = (
@@ -72,8 +86,13 @@ async def get_groups(db: AsyncSession = Depends(get_db)):
 
 
 @router.get("/{group_id}", response_model=GroupDetailResponse)
-async def get_group(group_id: int, db: AsyncSession = Depends(get_db)):
-    """Get a group with all its contacts."""
+async def get_group(group_id: int, db: AsyncSession = Depends(get_read_db)):
+    """
+    Get a group with all its contacts.
+    
+    Loads every member in a single response. For large groups prefer
+    /groups/{group_id}/summary plus the paginated /groups/{group_id}/contacts.
+    """
     stmt = (
         select(Group)
         .options(selectinload(Group.contacts))
@@ -88,6 +107,97 @@ async def get_group(group_id: int, db: AsyncSession = Depends(get_db)):
     return group
 
 
+@router.get("/{group_id}/summary", response_model=GroupResponse)
+async def get_group_summary(group_id: int, db: AsyncSession = Depends(get_read_db)):
+    """Get a group header with its contact count, without loading contacts."""
+    stmt = select(Group).where(Group.id == group_id)
+    result = await db.execute(stmt)
+    group = result.scalar_one_or_none()
+    
+    if not group:
+        raise HTTPException(status_code=404, detail="Grupo no encontrado")
+    
+    # Count via the group_id index instead of loading the relationship
+    stmt = select(func.count(GroupContact.id)).where(GroupContact.group_id == group_id)
+    result = await db.execute(stmt)
+    count = result.scalar() or 0
+    
+    return GroupResponse(
+        id=group.id,
+        name=group.name,
+        description=group.description,
+        created_at=group.created_at,
+        updated_at=group.updated_at,
+        contact_count=count
+    )
+
+
+@router.get("/{group_id}/contacts", response_model=GroupContactPage)
+async def list_group_contacts(
+    group_id: int,
+    after: Optional[int] = Query(None, ge=0, description="Cursor: id of the last contact of the previous page"),
+    limit: int = Query(100, ge=1, le=1000, description="Maximum number of contacts per page"),
+    search: Optional[str] = Query(None, description="Search by name, phone or email"),
+    fields: Optional[str] = Query(
+        None,
+        description="Comma-separated columns to return (id, group_id, name, phone, email, created_at)"
+    ),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """
+    Get the contacts of a group using keyset pagination.
+    
+    Pages are ordered by contact id; pass the returned next_cursor as 'after'
+    to fetch the following page. 'id' is always included in the projection.
+    """
+    # Resolve the column projection
+    if fields:
+        requested = [f.strip() for f in fields.split(",") if f.strip()]
+        unknown = [f for f in requested if f not in CONTACT_FIELDS]
+        if unknown:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Campos no válidos: {', '.join(unknown)}"
+            )
+        if "id" not in requested:
+            requested.insert(0, "id")
+    else:
+        requested = list(CONTACT_FIELDS.keys())
+    
+    # Verify group exists without loading its contacts
+    result = await db.execute(select(Group.id).where(Group.id == group_id))
+    if result.scalar_one_or_none() is None:
+        raise HTTPException(status_code=404, detail="Grupo no encontrado")
+    
+    stmt = select(*[CONTACT_FIELDS[f] for f in requested]).where(GroupContact.group_id == group_id)
+    
+    if after is not None:
+        stmt = stmt.where(GroupContact.id > after)
+    
+    if search:
+        search_pattern = f"%{search}%"
+        stmt = stmt.where(
+            GroupContact.name.ilike(search_pattern) |
+            GroupContact.phone.ilike(search_pattern) |
+            GroupContact.email.ilike(search_pattern)
+        )
+    
+    # Fetch one extra row to know whether there is another page
+    stmt = stmt.order_by(GroupContact.id).limit(limit + 1)
+    result = await db.execute(stmt)
+    rows = result.mappings().all()
+    
+    has_more = len(rows) > limit
+    contacts = [dict(row) for row in rows[:limit]]
+    
+    return GroupContactPage(
+        group_id=group_id,
+        contacts=contacts,
+        next_cursor=contacts[-1]["id"] if has_more else None,
+        has_more=has_more
+    )
+
+
 @router.post("", response_model=GroupResponse)
 async def create_group(
     group_data: GroupCreate,
@@ -232,6 +342,70 @@ async def upload_excel(
         )
 
 
+@router.post("/audience")
+async def build_audience(
+    request: AudienceRequest,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Combine groups and OWO contact segments with a set operation in SQL.
+    
+    Contacts are matched by normalized phone or email ('key'). Operations:
+    - union: contacts in any operand
+    - intersection: contacts in every operand
+    - difference: contacts in the first operand and in none of the others
+    
+    Output:
+    - count: number of distinct contacts
+    - list: NDJSON stream with one {name, phone, email} per line
+    - group: a new group materialized with the result
+    """
+    # Verify referenced groups exist
+    group_ids = {op.group_id for op in request.operands if op.group_id is not None}
+    if group_ids:
+        result = await db.execute(select(Group.id).where(Group.id.in_(group_ids)))
+        missing = group_ids - set(result.scalars().all())
+        if missing:
+            raise HTTPException(
+                status_code=404,
+                detail=f"Grupo no encontrado: {', '.join(str(g) for g in sorted(missing))}"
+            )
+    
+    if request.output == "count":
+        count = await count_audience(db, request.operation, request.operands, request.key)
+        return AudienceCountResponse(operation=request.operation, key=request.key, count=count)
+    
+    if request.output == "list":
+        async def stream_members():
+            # Own session: the request session is closed once streaming starts
+            async with async_session() as session:
+                async for chunk in iter_audience(session, request.operation, request.operands, request.key):
+                    yield "".join(json.dumps(member, ensure_ascii=False) + "\n" for member in chunk)
+        
+        return StreamingResponse(stream_members(), media_type="application/x-ndjson")
+    
+    # Materialize into a new group
+    stmt = select(Group).where(Group.name == request.group_name)
+    result = await db.execute(stmt)
+    if result.scalar_one_or_none():
+        raise HTTPException(status_code=400, detail="Ya existe un grupo con ese nombre")
+    
+    group = Group(name=request.group_name, description=request.description)
+    db.add(group)
+    await db.flush()
+    
+    count = await materialize_audience(db, group.id, request.operation, request.operands, request.key)
+    
+    return GroupResponse(
+        id=group.id,
+        name=group.name,
+        description=group.description,
+        created_at=group.created_at,
+        updated_at=group.updated_at,
+        contact_count=count
+    )
+
+
 @router.put("/{group_id}", response_model=GroupResponse)
 async def update_group(
     group_id: int,
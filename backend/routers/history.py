@@ -3,12 +3,12 @@ from datetime import datetime, timedelta
 from fastapi import APIRouter, Depends, Query, HTTPException
 from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func, and_, delete
+from sqlalchemy import select, func, and_, case, delete
 from typing import List, Optional
 import io
 from openpyxl import Workbook
 from openpyxl.styles import PatternFill, Font, Alignment
-from database import get_db
+from database import get_db, get_read_db, get_replica_db
 from models.message_log import MessageLog
 from schemas.message import MessageResponse
 
@@ -24,7 +24,7 @@ async def get_history(
     date_to: Optional[datetime] = Query(None, description="Filter until this date"),
     limit: int = Query(50, ge=1, le=500),
     offset: int = Query(0, ge=0),
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     """Get message history with filtering options."""
     # Normalize dates for SQLite comparison (naive Bogota time)
@@ -76,7 +76,7 @@ async def get_history(
 @router.get("/stats")
 async def get_stats(
     days: int = Query(30, ge=1, le=365, description="Number of days to include in stats"),
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_replica_db)
 ):
     """Get messaging statistics."""
     from models.message_log import get_colombia_time
@@ -86,43 +86,17 @@ async def get_stats(
     total_result = await db.execute(select(func.max(MessageLog.id)))
     total = total_result.scalar() or 0
     
-    # Sent messages (últimos 30 días)
-    sent_result = await db.execute(
-        select(func.count(MessageLog.id)).where(
-            and_(MessageLog.sent_at >= cutoff_date, MessageLog.status == "sent")
-        )
-    )
-    sent = sent_result.scalar() or 0
-    
-    # Failed messages
-    failed_result = await db.execute(
-        select(func.count(MessageLog.id)).where(
-            and_(MessageLog.sent_at >= cutoff_date, MessageLog.status == "failed")
-        )
-    )
-    failed = failed_result.scalar() or 0
-    
-    # By channel
-    whatsapp_result = await db.execute(
-        select(func.count(MessageLog.id)).where(
-            and_(MessageLog.sent_at >= cutoff_date, MessageLog.channel.in_(["whatsapp", "both"]))
-        )
+    # Every windowed count in one pass over the period (últimos N días)
+    counts_result = await db.execute(
+        select(
+            func.count(case((MessageLog.status == "sent", 1))),
+            func.count(case((MessageLog.status == "failed", 1))),
+            func.count(case((MessageLog.channel.in_(["whatsapp", "both"]), 1))),
+            func.count(case((MessageLog.channel.in_(["email", "both"]), 1))),
+            func.count(case((MessageLog.channel == "sms", 1)))
+        ).where(MessageLog.sent_at >= cutoff_date)
     )
-    whatsapp = whatsapp_result.scalar() or 0
-    
-    email_result = await db.execute(
-        select(func.count(MessageLog.id)).where(
-            and_(MessageLog.sent_at >= cutoff_date, MessageLog.channel.in_(["email", "both"]))
-        )
-    )
-    email = email_result.scalar() or 0
-    
-    sms_result = await db.execute(
-        select(func.count(MessageLog.id)).where(
-            and_(MessageLog.sent_at >= cutoff_date, MessageLog.channel == "sms")
-        )
-    )
-    sms = sms_result.scalar() or 0
+    sent, failed, whatsapp, email, sms = counts_result.one()
     
     total_processed = sent + failed
     
@@ -146,7 +120,7 @@ async def get_history_count(
     status: Optional[str] = Query(None, pattern="^(sent|failed|pending)$"),
     date_from: Optional[datetime] = Query(None, description="Filter from this date"),
     date_to: Optional[datetime] = Query(None, description="Filter until this date"),
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     """Get total count of messages in history."""
     # Normalize dates
@@ -189,7 +163,7 @@ async def export_history(
     status: Optional[str] = Query(None, pattern="^(sent|failed|pending)$"),
     date_from: Optional[datetime] = Query(None, description="Filter from this date"),
     date_to: Optional[datetime] = Query(None, description="Filter until this date"),
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_replica_db)
 ):
     """Export message history to Excel format based on filters."""
     # Normalize dates
@@ -2,18 +2,29 @@
 import re
 import uuid
 from datetime import datetime
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, BackgroundTasks, Header
 from sqlalchemy import select, update
 from sqlalchemy.ext.asyncio import AsyncSession
-from typing import List, Dict, Any
-from database import get_db, async_session
+from typing import AsyncIterator, List, Dict, Any, Optional, Tuple
+from database import get_db, async_session, async_read_session
 from models.message_log import MessageLog
 from schemas.message import BulkMessageCreate, MessageResponse, BulkSendResponse, WebhookCallback
 from services.webhook_service import webhook_service
 from services.file_service import file_service
+from services.audience_service import group_exists, iter_members
+from services.message_renderer import compile_message
+from services.metrics import record_completed
+from services.tracing import span, span_from
+from services.profiler import profiler
+from services.idempotency_service import claim_recipients, recipient_key, release_recipients
+from services.bulk_db import insert_rows
+from services.status_buffer import status_buffer
 
 router = APIRouter(prefix="/messages", tags=["messages"])
 
+# Recipients per n8n webhook call (and per read of the batch's messages)
+DISPATCH_CHUNK_SIZE = 1000
+
 
 def replace_variables(message: str, recipient: Dict[str, Any]) -> str:
     """
@@ -24,27 +35,16 @@ def replace_variables(message: str, recipient: Dict[str, Any]) -> str:
     - {{email}} - Recipient's email
     - {{telefono}} or {{phone}} - Recipient's phone
     - {{primer_nombre}} or {{first_name}} - First name only
+    - {{any_field}} - Any other recipient field
+    - {{field|default}} - Default value when the field is empty
+    
+    Templates are compiled once and cached; for batches, compile with
+    compile_message() and call render() per recipient.
     """
     if not message:
         return message
     
-    replacements = {
-        # Spanish variables
-        '{{nombre}}': recipient.get('name', ''),
-        '{{email}}': recipient.get('email', ''),
-        '{{telefono}}': recipient.get('phone', ''),
-        '{{primer_nombre}}': recipient.get('name', '').split()[0] if recipient.get('name') else '',
-        # English variables (for compatibility)
-        '{{name}}': recipient.get('name', ''),
-        '{{phone}}': recipient.get('phone', ''),
-        '{{first_name}}': recipient.get('name', '').split()[0] if recipient.get('name') else '',
-    }
-    
-    result = message
-    for var, value in replacements.items():
-        result = result.replace(var, value or '')
-    
-    return result
+    return compile_message(message).render(recipient)
 
 
 @router.post("/upload-files", response_model=List[str])
@@ -65,180 +65,309 @@ async def delete_file(filename: str):
     raise HTTPException(status_code=404, detail="Archivo no encontrado")
 
 
-async def update_batch_failure(batch_id: str, error_message: str):
-    """Update all pending messages in a batch to failed."""
+async def update_batch_failure(batch_id: str, error_message: str, channel: str, from_id: int = 0):
+    """
+    Mark the pending messages of a batch sent through `channel` as failed,
+    from message id `from_id` on (earlier chunks already reached n8n).
+    
+    Written right away rather than through the status buffer: the claims
+    of those recipients are released in the same transaction, so an
+    immediate retry with the same Idempotency-Key sends them again.
+    """
     async with async_session() as db:
-        stmt = (
-            update(MessageLog)
+        last_id = from_id - 1
+        while True:
+            # Failed rows leave the partial index on pending rows, so each pass is cheap
+            result = await db.execute(
+                select(MessageLog.id, MessageLog.recipient_phone, MessageLog.recipient_email)
+                .where(MessageLog.batch_id == batch_id)
+                .where(MessageLog.status == "pending")
+                .where(MessageLog.channel.in_((channel, "both")))
+                .where(MessageLog.id > last_id)
+                .order_by(MessageLog.id)
+                .limit(DISPATCH_CHUNK_SIZE)
+            )
+            rows = result.all()
+            if not rows:
+                break
+            await db.execute(
+                update(MessageLog)
+                .where(MessageLog.id.in_([row.id for row in rows]))
+                .values(status="failed", error_message=error_message)
+            )
+            await release_recipients(db, batch_id, channel, [
+                recipient_key(channel, {"phone": row.recipient_phone, "email": row.recipient_email})
+                for row in rows
+            ], error_message)
+            last_id = rows[-1].id
+        await db.commit()
+
+
+async def iter_batch_chunks(
+    batch_id: str,
+    content: str,
+    extra: Dict[str, Any]
+) -> AsyncIterator[Tuple[int, List[Dict[str, Any]], List[Dict[str, Any]]]]:
+    """
+    Stream the messages of a batch as (first message id, WhatsApp recipients, email recipients).
+    
+    The rows written by send-bulk are the queue: the recipients are read
+    back and personalized one chunk at a time, so a large group or segment
+    is never held in memory. `extra` holds fields shared by every
+    recipient (the department of a segment).
+    """
+    compiled_message = compile_message(content)
+    async with async_read_session() as db:
+        result = await db.stream(
+            select(
+                MessageLog.id, MessageLog.recipient_name, MessageLog.recipient_phone,
+                MessageLog.recipient_email, MessageLog.channel
+            )
             .where(MessageLog.batch_id == batch_id)
-            .where(MessageLog.status == "pending")
-            .values(status="failed", error_message=error_message)
+            .order_by(MessageLog.id)
         )
-        await db.execute(stmt)
-        await db.commit()
+        async for rows in result.partitions(DISPATCH_CHUNK_SIZE):
+            whatsapp_recipients = []
+            email_recipients = []
+            for row in rows:
+                recipient = {
+                    **extra,
+                    "name": row.recipient_name,
+                    "phone": row.recipient_phone,
+                    "email": row.recipient_email
+                }
+                payload = {
+                    "name": row.recipient_name,
+                    "phone": row.recipient_phone,
+                    "email": row.recipient_email,
+                    "message": compiled_message.render(recipient)
+                }
+                if row.channel in ("whatsapp", "both") and row.recipient_phone:
+                    whatsapp_recipients.append(payload)
+                if row.channel in ("email", "both") and row.recipient_email:
+                    email_recipients.append(payload)
+            yield rows[0].id, whatsapp_recipients, email_recipients
 
 
 async def send_bulk_background(
     batch_id: str,
-    channel: str,
-    recipients_whatsapp: List[Dict[str, Any]],
-    recipients_email: List[Dict[str, Any]],
     subject: str,
     content: str,
-    attachment_data: List[Dict[str, Any]]
+    attachment_data: List[Dict[str, Any]],
+    extra: Optional[Dict[str, Any]] = None
 ):
-    """Background task to send bulk messages to n8n."""
-    # Send to WhatsApp webhook
-    if recipients_whatsapp:
-        result = await webhook_service.send_bulk_whatsapp(
-            recipients=recipients_whatsapp,
-            message=content,
-            attachments=attachment_data,
-            batch_id=batch_id
-        )
-        if not result.get("success"):
-            print(f"Error sending WhatsApp webhook: {result.get('error')}")
-            await update_batch_failure(batch_id, f"WhatsApp Webhook Error: {result.get('error')}")
-    
-    # Send to Email webhook
-    if recipients_email:
-        result = await webhook_service.send_bulk_email(
-            recipients=recipients_email,
-            subject=subject,
-            message=content,
-            attachments=attachment_data,
-            batch_id=batch_id
-        )
-        if not result.get("success"):
-            print(f"Error sending Email webhook: {result.get('error')}")
-            await update_batch_failure(batch_id, f"Email Webhook Error: {result.get('error')}")
+    """
+    Background task to send bulk messages to n8n, one webhook call per chunk and channel.
+    
+    When a channel's webhook fails, that channel stops: the failed chunk and
+    the rest of the batch are marked failed for it, while the chunks already
+    handed to n8n keep waiting for their callbacks.
+    """
+    failed_channels = set()
+    async with profiler.job("send_bulk"):
+        async for first_id, recipients_whatsapp, recipients_email in iter_batch_chunks(batch_id, content, extra or {}):
+            # Send to WhatsApp webhook
+            if recipients_whatsapp and "whatsapp" not in failed_channels:
+                with span("messages.dispatch_n8n", batch_id=batch_id, channel="whatsapp", recipients=len(recipients_whatsapp)):
+                    result = await webhook_service.send_bulk_whatsapp(
+                        recipients=recipients_whatsapp,
+                        message=content,
+                        attachments=attachment_data,
+                        batch_id=batch_id
+                    )
+                if not result.get("success"):
+                    record_completed("whatsapp", "n8n", failed=len(recipients_whatsapp))
+                    print(f"Error sending WhatsApp webhook: {result.get('error')}")
+                    failed_channels.add("whatsapp")
+                    await update_batch_failure(batch_id, f"WhatsApp Webhook Error: {result.get('error')}", "whatsapp", first_id)
+            
+            # Send to Email webhook
+            if recipients_email and "email" not in failed_channels:
+                with span("messages.dispatch_n8n", batch_id=batch_id, channel="email", recipients=len(recipients_email)):
+                    result = await webhook_service.send_bulk_email(
+                        recipients=recipients_email,
+                        subject=subject,
+                        message=content,
+                        attachments=attachment_data,
+                        batch_id=batch_id
+                    )
+                if not result.get("success"):
+                    record_completed("email", "n8n", failed=len(recipients_email))
+                    print(f"Error sending Email webhook: {result.get('error')}")
+                    failed_channels.add("email")
+                    await update_batch_failure(batch_id, f"Email Webhook Error: {result.get('error')}", "email", first_id)
 
 
 @router.post("/callback")
 async def webhook_callback(callback: WebhookCallback):
     """
     Callback from n8n to update message status.
+    
+    n8n may echo the 'traceparent' it received with the webhook so the
+    callback joins the trace of the batch.
     """
     print(f"[CALLBACK] Recibido batch_id: {callback.batch_id}")
-    updated_count = 0
+    queued_count = 0
     
-    async with async_session() as db:
+    # Continue the trace of the send when n8n echoes the trace context
+    carrier = {"traceparent": callback.traceparent} if callback.traceparent else {}
+    with span_from(carrier, "messages.callback", batch_id=callback.batch_id, results=len(callback.results)):
+        # Results are written by the status buffer, batched with other callbacks
         for result in callback.results:
             print(f"[CALLBACK] Procesando resultado: {result.email or result.phone} - Success: {result.success}")
-            if result.email:
-                stmt = (
-                    update(MessageLog)
-                    .where(MessageLog.batch_id == callback.batch_id)
-                    .where(MessageLog.recipient_email == result.email)
-                    .values(
-                        status="sent" if result.success else "failed",
-                        error_message=result.error
-                    )
-                )
-                res = await db.execute(stmt)
-                updated_count += res.rowcount
-            elif result.phone:
-                stmt = (
-                    update(MessageLog)
-                    .where(MessageLog.batch_id == callback.batch_id)
-                    .where(MessageLog.recipient_phone == result.phone)
-                    .values(
-                        status="sent" if result.success else "failed",
-                        error_message=result.error
-                    )
-                )
-                res = await db.execute(stmt)
-                updated_count += res.rowcount
-        
-        await db.commit()
+            channel = "email" if result.email else "whatsapp" if result.phone else None
+            if channel is None:
+                continue
+            record_completed(channel, "n8n", sent=int(result.success), failed=int(not result.success))
+            address = result.email if channel == "email" else result.phone
+            key = recipient_key(channel, {"email": result.email} if channel == "email" else {"phone": result.phone})
+            # A repeated recipient keeps its last result
+            await status_buffer.record_result(callback.batch_id, channel, address, key, result.success, result.error)
+            queued_count += 1
     
-    print(f"[CALLBACK] Actualizados {updated_count} registros en la base de datos")
-    return {"status": "ok", "total_received": len(callback.results), "actual_updates": updated_count}
+    print(f"[CALLBACK] {queued_count} resultados en cola para la base de datos")
+    # actual_updates keeps its name for the n8n workflows; the rows are written
+    # by the next flush of the status buffer, so it counts the accepted results
+    return {"status": "ok", "total_received": len(callback.results), "actual_updates": queued_count}
+
+
+def _take_claim(claimed: Optional[set], key: Optional[str]) -> bool:
+    """Consume a claimed recipient key; False if it was not claimed or already used."""
+    if not claimed or key not in claimed:
+        return False
+    claimed.discard(key)
+    return True
 
 
 @router.post("/send-bulk", response_model=BulkSendResponse)
 async def send_bulk_messages(
     bulk_message: BulkMessageCreate, 
     background_tasks: BackgroundTasks,
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_db),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
 ):
     """
     Send the same message to multiple recipients.
     Creates records as 'pending' and triggers n8n in background.
+    
+    Recipients are either sent inline or referenced with group_id/department,
+    in which case they are resolved server-side in chunks and the response
+    does not echo the created messages. Either way the messages are written
+    as they are prepared and the background task reads them back in chunks,
+    so no recipient list is kept in memory.
+    
+    With an Idempotency-Key header, each (recipient, channel) is claimed before
+    it is queued; recipients already sent or in progress under the same key
+    are skipped and counted in 'duplicates'.
     """
-    if not bulk_message.recipients:
+    audience = bulk_message.audience_operand()
+    if not bulk_message.recipients and audience is None:
         raise HTTPException(status_code=400, detail="Se requiere al menos un destinatario")
     
+    if audience is not None and audience.group_id is not None and not await group_exists(db, audience.group_id):
+        raise HTTPException(status_code=404, detail="Grupo no encontrado")
+    
     # Generate unique ID for this batch
     batch_id = str(uuid.uuid4())
     
     # Prepare attachments once
     attachment_data = await webhook_service.prepare_attachments(bulk_message.attachments)
     
-    # Separate recipients by channel capability
-    whatsapp_recipients = []
-    email_recipients = []
     log_entries: List[MessageLog] = []
+    log_rows: List[Dict[str, Any]] = []
+    total = 0
+    duplicates = 0
+    channels = ["whatsapp", "email"] if bulk_message.channel == "both" else [bulk_message.channel]
+    
+    async def recipient_chunks():
+        if audience is None:
+            yield [r.model_dump() for r in bulk_message.recipients]
+        else:
+            async for chunk in iter_members(db, audience):
+                yield chunk
     
-    for recipient in bulk_message.recipients:
-        recipient_data = {
-            "name": recipient.name,
-            "phone": recipient.phone,
-            "email": recipient.email
-        }
-        
-        # Personalize message for this recipient
-        personalized_message = replace_variables(bulk_message.content, recipient_data)
-        
-        if bulk_message.channel in ("whatsapp", "both") and recipient.phone:
-            whatsapp_recipients.append({
-                "name": recipient.name,
-                "phone": recipient.phone,
-                "email": recipient.email,
-                "message": personalized_message
-            })
-        
-        if bulk_message.channel in ("email", "both") and recipient.email:
-            email_recipients.append({
-                "name": recipient.name,
-                "email": recipient.email,
-                "phone": recipient.phone,
-                "message": personalized_message
-            })
+    async for chunk in recipient_chunks():
+        with span("messages.prepare_chunk", batch_id=batch_id, recipients=len(chunk)):
+            claimed = {}
+            if idempotency_key:
+                for channel in channels:
+                    keys = [recipient_key(channel, r) for r in chunk]
+                    # Committed with the message rows below: a send that fails
+                    # half-way leaves neither rows nor claims behind
+                    claimed[channel] = await claim_recipients(
+                        db, idempotency_key, channel, keys, batch_id=batch_id, commit=False
+                    )
             
-        # Create log entry
-        log_entry = MessageLog(
-            recipient_name=recipient.name,
-            recipient_phone=recipient.phone,
-            recipient_email=recipient.email,
-            subject=bulk_message.subject,
-            message_content=bulk_message.content,
-            channel=bulk_message.channel,
-            status="pending",
-            attachments=bulk_message.attachments,
-            batch_id=batch_id
-        )
-        db.add(log_entry)
-        log_entries.append(log_entry)
+            for recipient_data in chunk:
+                name = recipient_data.get("name") or ""
+                phone = recipient_data.get("phone")
+                email = recipient_data.get("email")
+                row_channel = bulk_message.channel
+                
+                if idempotency_key:
+                    keys = {channel: recipient_key(channel, recipient_data) for channel in channels}
+                    # Each claimed key is used once, so repeated recipients are sent once
+                    send_whatsapp = bool(phone) and _take_claim(claimed.get("whatsapp"), keys.get("whatsapp"))
+                    send_email = bool(email) and _take_claim(claimed.get("email"), keys.get("email"))
+                    if not send_whatsapp and not send_email and any(keys.values()):
+                        duplicates += 1
+                        continue
+                    if row_channel == "both" and send_whatsapp != send_email:
+                        # The other channel was already sent under this key
+                        row_channel = "whatsapp" if send_whatsapp else "email"
+                
+                # The message row is the queue entry the background task sends from
+                log_row = {
+                    "recipient_name": name,
+                    "recipient_phone": phone,
+                    "recipient_email": email,
+                    "subject": bulk_message.subject,
+                    "message_content": bulk_message.content,
+                    "channel": row_channel,
+                    "status": "pending",
+                    "attachments": bulk_message.attachments,
+                    "batch_id": batch_id
+                }
+                total += 1
+                if audience is None:
+                    # Inline recipients are echoed in the response, with their ids
+                    log_entry = MessageLog(**log_row)
+                    db.add(log_entry)
+                    log_entries.append(log_entry)
+                else:
+                    log_rows.append(log_row)
+            
+            # Group and segment chunks are written in bulk (COPY on PostgreSQL)
+            await insert_rows(db, MessageLog, log_rows)
+            log_rows.clear()
+            await db.flush()
+    
+    if total == 0 and duplicates:
+        # Everything was already sent under this Idempotency-Key
+        return BulkSendResponse(total=0, sent=0, failed=0, duplicates=duplicates, batch_id=batch_id, messages=[])
+    
+    if total == 0:
+        raise HTTPException(status_code=400, detail="El grupo o segmento no tiene destinatarios")
     
-    await db.flush()
+    # Commit before queueing: the background task (and n8n's callbacks)
+    # update these rows, and would otherwise wait on this session's write lock
+    await db.commit()
     
     # Queue the actual sending to n8n
     background_tasks.add_task(
         send_bulk_background,
         batch_id=batch_id,
-        channel=bulk_message.channel,
-        recipients_whatsapp=whatsapp_recipients,
-        recipients_email=email_recipients,
         subject=bulk_message.subject or "Mensaje",
         content=bulk_message.content,
-        attachment_data=attachment_data
+        attachment_data=attachment_data,
+        extra={"department": audience.department} if audience is not None and audience.department else None
     )
     
     return BulkSendResponse(
-        total=len(bulk_message.recipients),
+        total=total,
         sent=0,
         failed=0,
+        duplicates=duplicates,
         batch_id=batch_id,
         messages=[MessageResponse.model_validate(log) for log in log_entries]
     )
@@ -1,11 +1,18 @@
 """SMS router for LabsMobile integration."""
-from fastapi import APIRouter, HTTPException, Depends
-from pydantic import BaseModel
+from fastapi import APIRouter, HTTPException, Depends, Header
+from pydantic import BaseModel, Field
 from typing import List, Optional
 from sqlalchemy.ext.asyncio import AsyncSession
 from database import get_db
 from models.message_log import MessageLog
+from schemas.audience import AudienceReference
 from services.sms_service import sms_service
+from services.bulk_db import insert_rows
+from services.status_buffer import status_buffer
+from services.audience_service import group_exists, iter_members
+from services.idempotency_service import (
+    claim_recipients, complete_recipients, recipient_key, select_claimed
+)
 
 router = APIRouter(prefix="/sms", tags=["sms"])
 
@@ -14,13 +21,13 @@ class SMSRequest(BaseModel):
     message: str
     test: bool = False
 
-class BulkSMSRequest(BaseModel):
-    recipients: List[dict]  # List of {"phone": "...", "name": "..."}
+class BulkSMSRequest(AudienceReference):
+    recipients: List[dict] = Field(default_factory=list)  # List of {"phone": "...", "name": "..."}
     message: str
     test: bool = False
 
 @router.post("/send")
-async def send_sms(request: SMSRequest, db: AsyncSession = Depends(get_db)):
+async def send_sms(request: SMSRequest):
     """Send a single SMS."""
     result = await sms_service.send_single(
         phone=request.phone,
@@ -28,71 +35,160 @@ async def send_sms(request: SMSRequest, db: AsyncSession = Depends(get_db)):
         test_mode=request.test
     )
     
-    # Save to history
-    log_entry = MessageLog(
-        recipient_name="Unknown", # Single send might not have name context
-        recipient_phone=request.phone,
-        message_content=request.message,
-        channel="sms",
-        status="sent" if result["success"] else "failed",
-        error_message=result.get("error"),
-        subject="SMS Individual"
-    )
-    db.add(log_entry)
-    await db.commit()
-    await db.refresh(log_entry)
+    # Save to history with the next flush of the status buffer
+    await status_buffer.add_log({
+        "recipient_name": "Unknown",  # Single send might not have name context
+        "recipient_phone": request.phone,
+        "message_content": request.message,
+        "channel": "sms",
+        "status": "sent" if result["success"] else "failed",
+        "error_message": result.get("error"),
+        "subject": "SMS Individual"
+    })
     
     if not result["success"]:
         raise HTTPException(status_code=400, detail=result.get("error", "Error sending SMS"))
     
     return result
 
-@router.post("/send-bulk")
-async def send_bulk_sms(request: BulkSMSRequest, db: AsyncSession = Depends(get_db)):
-    """Send bulk SMS."""
-    try:
-        result = await sms_service.send_bulk(
-            recipients=request.recipients,
-            message=request.message,
-            test_mode=request.test
-        )
-        
-        # Save logs for each recipient
-        general_success = result["success"]
-        general_error = result.get("error")
+async def log_bulk_results(db: AsyncSession, recipients: List[dict], message: str, result: dict):
+    """Write a history entry for each recipient of a bulk SMS call (one bulk insert)."""
+    general_success = result["success"]
+    general_error = result.get("error")
+    # Per-recipient outcome when the send was split into several requests
+    failed_indexes = set(result.get("failed_indexes", []))
+    
+    # Ensure error is a string
+    if general_error and not isinstance(general_error, str):
+        general_error = str(general_error)
+    
+    rows = []
+    for index, recipient in enumerate(recipients):
+        name = recipient.get("name") or "Unknown"
+        phone = recipient.get("phone") or ""
+        # Use personalized message if available, otherwise use default
+        message_content = recipient.get("message") or message
         
-        # Ensure error is a string
-        if general_error and not isinstance(general_error, str):
-            general_error = str(general_error)
+        if "failed_indexes" in result:
+            recipient_success = index not in failed_indexes
+        else:
+            recipient_success = general_success
+        status = "sent" if recipient_success else "failed"
+        error = None if recipient_success else general_error
         
-        for recipient in request.recipients:
-            name = recipient.get("name", "Unknown")
-            phone = recipient.get("phone", "")
-            # Use personalized message if available, otherwise use default
-            message_content = recipient.get("message", request.message)
+        # Additional check: invalid phone numbers might be filtered by service
+        if not phone:
+            status = "failed"
+            error = "Sin número de teléfono"
             
-            status = "sent" if general_success else "failed"
-            error = general_error
+        rows.append({
+            "recipient_name": name,
+            "recipient_phone": phone,
+            "message_content": message_content,  # Save personalized message
+            "channel": "sms",
+            "status": status,
+            "error_message": error,
+            "subject": "SMS Masivo"
+        })
+    await insert_rows(db, MessageLog, rows)
+
+
+async def claim_sms_chunk(db: AsyncSession, idempotency_key: Optional[str], chunk: List[dict]) -> List[dict]:
+    """Drop recipients already sent under the idempotency key."""
+    if not idempotency_key:
+        return chunk
+    keys = [recipient_key("sms", r) for r in chunk]
+    claimed = await claim_recipients(db, idempotency_key, "sms", keys)
+    # Commit the claims so the write lock is not held while LabsMobile is called
+    await db.commit()
+    return select_claimed(chunk, keys, claimed)
+
+
+async def complete_sms_chunk(db: AsyncSession, idempotency_key: Optional[str], chunk: List[dict], result: dict):
+    """Record the outcome of a bulk SMS call for each claimed recipient."""
+    if not idempotency_key:
+        return
+    error = result.get("error")
+    failed_indexes = set(result.get("failed_indexes", []))
+    await complete_recipients(db, idempotency_key, "sms", [
+        (recipient_key("sms", r), result["success"] and index not in failed_indexes, None, error)
+        for index, r in enumerate(chunk)
+    ])
+
+
+@router.post("/send-bulk")
+async def send_bulk_sms(
+    request: BulkSMSRequest,
+    db: AsyncSession = Depends(get_db),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
+):
+    """
+    Send bulk SMS.
+    
+    Recipients are sent inline or referenced with group_id/department; referenced
+    audiences are resolved server-side and sent in chunks.
+    
+    With an Idempotency-Key header, recipients already sent (or being sent)
+    under the same key are skipped and counted in 'duplicates'.
+    """
+    audience = request.audience_operand()
+    if not request.recipients and audience is None:
+        raise HTTPException(status_code=400, detail="Se requiere al menos un destinatario")
+    
+    if audience is not None and audience.group_id is not None and not await group_exists(db, audience.group_id):
+        raise HTTPException(status_code=404, detail="Grupo no encontrado")
+    
+    try:
+        if audience is None:
+            recipients = await claim_sms_chunk(db, idempotency_key, request.recipients)
+            duplicates = len(request.recipients) - len(recipients)
+            if not recipients:
+                return {"success": True, "total": 0, "sent": 0, "failed": 0, "credits_used": 0, "duplicates": duplicates}
             
-            # Additional check: invalid phone numbers might be filtered by service
-            if not phone:
-                status = "failed"
-                error = "Sin número de teléfono"
-                
-            log_entry = MessageLog(
-                recipient_name=name,
-                recipient_phone=phone,
-                message_content=message_content,  # Save personalized message
-                channel="sms",
-                status=status,
-                error_message=error,
-                subject="SMS Masivo"
+            result = await sms_service.send_bulk(
+                recipients=recipients,
+                message=request.message,
+                test_mode=request.test
             )
-            db.add(log_entry)
+            await complete_sms_chunk(db, idempotency_key, recipients, result)
+            await log_bulk_results(db, recipients, request.message, result)
+            result["duplicates"] = duplicates
+        else:
+            result = {"success": False, "total": 0, "sent": 0, "failed": 0, "credits_used": 0, "duplicates": 0}
+            async for chunk in iter_members(db, audience):
+                claimed_chunk = await claim_sms_chunk(db, idempotency_key, chunk)
+                result["duplicates"] += len(chunk) - len(claimed_chunk)
+                chunk = claimed_chunk
+                if not chunk:
+                    continue
+                
+                chunk_result = await sms_service.send_bulk(
+                    recipients=chunk,
+                    message=request.message,
+                    test_mode=request.test
+                )
+                await complete_sms_chunk(db, idempotency_key, chunk, chunk_result)
+                await log_bulk_results(db, chunk, request.message, chunk_result)
+                await db.commit()
+                
+                result["success"] = result["success"] or chunk_result["success"]
+                result["total"] += len(chunk)
+                result["sent"] += chunk_result.get("sent", 0)
+                result["failed"] += len(chunk) - chunk_result.get("sent", 0)
+                result["credits_used"] += float(chunk_result.get("credits_used") or 0)
+                if chunk_result.get("error"):
+                    result["error"] = chunk_result["error"]
+            
+            if result["total"] == 0 and result["duplicates"]:
+                # Everything was already sent under this key
+                result["success"] = True
             
         await db.commit()
         
-        if not general_success:
+        if not result["success"]:
+            general_error = result.get("error")
+            if general_error and not isinstance(general_error, str):
+                general_error = str(general_error)
             raise HTTPException(status_code=400, detail=general_error or "Error sending bulk SMS")
         
         return result
@@ -3,7 +3,7 @@ from fastapi import APIRouter, Depends, HTTPException, Query, File, UploadFile
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, func
 from typing import List, Optional
-from database import get_db
+from database import get_db, get_read_db
 from models.template import Template
 from schemas.template import TemplateCreate, TemplateUpdate, TemplateResponse
 from services.whatsapp_service import get_whatsapp_service
@@ -25,7 +25,7 @@ async def get_templates(
     channel: Optional[str] = Query(None, pattern="^(whatsapp|email|sms|both)$"),
     limit: int = Query(100, ge=1, le=1000),
     offset: int = Query(0, ge=0),
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     """Get all templates with optional filtering."""
     query = select(Template)
@@ -46,7 +46,7 @@ async def get_templates(
 
 
 @router.get("/count")
-async def get_templates_count(db: AsyncSession = Depends(get_db)):
+async def get_templates_count(db: AsyncSession = Depends(get_read_db)):
     """Get total count of templates."""
     result = await db.execute(select(func.count(Template.id)))
     count = result.scalar()
@@ -54,7 +54,7 @@ async def get_templates_count(db: AsyncSession = Depends(get_db)):
 
 
 @router.get("/{template_id}", response_model=TemplateResponse)
-async def get_template(template_id: int, db: AsyncSession = Depends(get_db)):
+async def get_template(template_id: int, db: AsyncSession = Depends(get_read_db)):
     """Get a specific template by ID."""
     result = await db.execute(select(Template).where(Template.id == template_id))
     template = result.scalar_one_or_none()
@@ -144,16 +144,19 @@ async def get_whatsapp_templates(
         pattern="^(APPROVED|PENDING|REJECTED)$"
     ),
     limit: int = Query(100, ge=1, le=500),
-    parsed: bool = Query(True, description="Return parsed template structure")
+    parsed: bool = Query(True, description="Return parsed template structure"),
+    refresh: bool = Query(False, description="Bypass the template cache")
 ):
     """
     Get message templates directly from WhatsApp Business API.
     
     This endpoint fetches templates from the WhatsApp Cloud API using
-    the configured access token and business account ID.
+    the configured access token and business account ID. Templates are
+    served from a local catalog of every page, refreshed in the background;
+    use refresh=true to force a full sync first.
     """
     whatsapp_service = get_whatsapp_service()
-    result = await whatsapp_service.get_templates(status=status, limit=limit)
+    result = await whatsapp_service.get_templates(status=status, limit=limit, use_cache=not refresh)
     
     if not result["success"]:
         raise HTTPException(
@@ -173,6 +176,7 @@ async def get_whatsapp_templates(
     return {
         "success": True,
         "count": len(templates),
+        "total": result.get("total", len(templates)),
         "templates": templates,
         "paging": result.get("paging", {})
     }
@@ -187,16 +191,15 @@ async def get_whatsapp_template_by_name(
     Get a specific WhatsApp template by its name.
     """
     whatsapp_service = get_whatsapp_service()
-    template = await whatsapp_service.get_template_by_name(template_name)
+    compiled = await whatsapp_service.get_compiled_template(template_name)
     
-    if not template:
+    if not compiled:
         raise HTTPException(
             status_code=404,
             detail=f"Plantilla '{template_name}' no encontrada en WhatsApp Business"
         )
     
-    if parsed:
-        template = whatsapp_service.parse_template_components(template)
+    template = compiled.parsed if parsed else compiled.raw
     
     return {
         "success": True,
@@ -206,7 +209,8 @@ async def get_whatsapp_template_by_name(
 
 @router.get("/whatsapp/approved")
 async def get_approved_whatsapp_templates(
-    parsed: bool = Query(True, description="Return parsed template structure")
+    parsed: bool = Query(True, description="Return parsed template structure"),
+    refresh: bool = Query(False, description="Bypass the template cache")
 ):
     """
     Get only APPROVED WhatsApp templates (ready to use).
@@ -214,7 +218,7 @@ async def get_approved_whatsapp_templates(
     This is a convenience endpoint that filters for approved templates only.
     """
     whatsapp_service = get_whatsapp_service()
-    result = await whatsapp_service.get_templates(status="APPROVED")
+    result = await whatsapp_service.get_templates(status="APPROVED", use_cache=not refresh)
     
     if not result["success"]:
         raise HTTPException(
@@ -236,3 +240,42 @@ async def get_approved_whatsapp_templates(
         "templates": templates
     }
 
+
+@router.post("/whatsapp/sync")
+async def sync_whatsapp_templates():
+    """
+    Download every WhatsApp template page and rebuild the local catalog.
+    """
+    whatsapp_service = get_whatsapp_service()
+    result = await whatsapp_service.sync_templates()
+    
+    if not result["success"]:
+        raise HTTPException(
+            status_code=502,
+            detail={
+                "message": "Error al sincronizar plantillas de WhatsApp",
+                "error": result.get("error", "Unknown error")
+            }
+        )
+    
+    return {
+        "success": True,
+        "count": result["count"],
+        "pages": result["pages"]
+    }
+
+
+@router.post("/whatsapp/cache/invalidate")
+async def invalidate_whatsapp_template_cache(
+    template_name: Optional[str] = Query(None, description="Only invalidate this template")
+):
+    """
+    Drop cached WhatsApp template metadata.
+    
+    Call after editing templates in WhatsApp Business Manager so the next
+    lookup fetches fresh data. Without template_name the whole catalog is
+    dropped and re-synced on the next request.
+    """
+    whatsapp_service = get_whatsapp_service()
+    removed = whatsapp_service.invalidate_templates(template_name)
+    return {"success": True, "invalidated": removed}
@@ -1,8 +1,21 @@
 """WhatsApp direct messaging router."""
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Header
 from pydantic import BaseModel, Field
 from typing import List, Optional, Dict, Any
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import async_session
+from models.message_log import MessageLog
+from schemas.audience import AudienceReference
 from services.whatsapp_service import get_whatsapp_service
+from services.bulk_db import insert_rows
+from services.status_buffer import status_buffer
+from services.audience_service import group_exists, iter_members
+from services.retry_policy import run_with_retry, classify_whatsapp_result
+from services.rate_limiter import PRIORITY_HIGH
+from services.metrics import record_completed
+from services.idempotency_service import (
+    claim_recipients, complete_recipients, recipient_key, select_claimed
+)
 
 router = APIRouter(prefix="/whatsapp", tags=["whatsapp"])
 
@@ -22,11 +35,11 @@ class Recipient(BaseModel):
     }
 
 
-class SendTemplateRequest(BaseModel):
-    """Request to send a template message."""
+class SendTemplateRequest(AudienceReference):
+    """Request to send a template message (inline recipients or group_id/department)."""
     template_name: str = Field(..., description="Name of the approved WhatsApp template")
     language_code: str = Field(default="es_CO", description="Template language code")
-    recipients: List[Recipient] = Field(..., min_length=1, description="List of recipients")
+    recipients: List[Recipient] = Field(default_factory=list, description="List of recipients")
     variable_mapping: Optional[Dict[str, str]] = Field(
         default=None,
         description="Map template variables to recipient fields. E.g., {'nombre': 'name'}"
@@ -53,6 +66,7 @@ class MessageResult(BaseModel):
     success: bool
     message_id: Optional[str] = None
     error: Optional[str] = None
+    attempts: int = 0
 
 
 class BulkSendResponse(BaseModel):
@@ -60,11 +74,15 @@ class BulkSendResponse(BaseModel):
     total: int
     sent: int
     failed: int
+    duplicates: int = 0
     messages: List[MessageResult]
 
 
 @router.post("/send-template", response_model=BulkSendResponse)
-async def send_template_bulk(request: SendTemplateRequest):
+async def send_template_bulk(
+    request: SendTemplateRequest,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
+):
     """
     Send a WhatsApp template message to multiple recipients.
     
@@ -77,10 +95,18 @@ async def send_template_bulk(request: SendTemplateRequest):
     - empresa -> company
     - cargo -> position
     - departamento -> department
+    
+    Instead of inline recipients, group_id or department can be given; the
+    recipients are then resolved server-side and sent in chunks, and (as in
+    /messages/send-bulk) the response only carries the totals, not one entry
+    per recipient.
+    
+    With an Idempotency-Key header, recipients already sent (or being sent)
+    under the same key are skipped, so the request can be retried safely.
     """
-    from database import get_db
-    from models.message_log import MessageLog
-    from sqlalchemy.ext.asyncio import AsyncSession
+    audience = request.audience_operand()
+    if not request.recipients and audience is None:
+        raise HTTPException(status_code=400, detail="Se requiere al menos un destinatario")
     
     whatsapp_service = get_whatsapp_service()
     
@@ -98,52 +124,89 @@ async def send_template_bulk(request: SendTemplateRequest):
     
     variable_mapping = request.variable_mapping or default_mapping
     
-    # Convert recipients to dict format, including any extra fields
-    recipients_data = [r.model_dump() for r in request.recipients]
+    totals = {"total": 0, "sent": 0, "failed": 0, "duplicates": 0, "messages": []}
     
-    result = await whatsapp_service.send_bulk_template_messages(
-        recipients=recipients_data,
-        template_name=request.template_name,
-        language_code=request.language_code,
-        variable_mapping=variable_mapping,
-        header_media_url=request.header_media_url
-    )
-    
-    # Save to database
-    async for db in get_db():
-        try:
-            for msg_result in result["messages"]:
-                # Get template content for logging (simplified)
-                message_content = f"Template: {request.template_name}"
-                
-                log_entry = MessageLog(
-                    recipient_name=msg_result["recipient"],
-                    recipient_phone=msg_result.get("phone"),
-                    recipient_email=None,
-                    subject=request.template_name,
-                    message_content=message_content,
-                    channel="whatsapp",
-                    status="sent" if msg_result["success"] else "failed",
-                    error_message=msg_result.get("error"),
-                    attachments=[]
-                )
-                db.add(log_entry)
+    async with async_session() as db:
+        if audience is not None and audience.group_id is not None and not await group_exists(db, audience.group_id):
+            raise HTTPException(status_code=404, detail="Grupo no encontrado")
+        
+        async def recipient_chunks():
+            if audience is None:
+                # Convert recipients to dict format, including any extra fields
+                yield [r.model_dump() for r in request.recipients]
+            else:
+                async for chunk in iter_members(db, audience):
+                    yield chunk
+        
+        async for chunk in recipient_chunks():
+            if idempotency_key:
+                keys = [recipient_key("whatsapp", r) for r in chunk]
+                claimed = await claim_recipients(db, idempotency_key, "whatsapp", keys)
+                # Commit the claims so the write lock is not held during the Graph calls
+                await db.commit()
+                pending = select_claimed(chunk, keys, claimed)
+                totals["duplicates"] += len(chunk) - len(pending)
+                chunk = pending
+                if not chunk:
+                    continue
+            
+            result = await whatsapp_service.send_bulk_template_messages(
+                recipients=chunk,
+                template_name=request.template_name,
+                language_code=request.language_code,
+                variable_mapping=variable_mapping,
+                header_media_url=request.header_media_url
+            )
+            
+            for field in ("total", "sent", "failed"):
+                totals[field] += result[field]
+            if audience is None:
+                totals["messages"].extend(result["messages"])
+            
+            if idempotency_key:
+                await complete_recipients(db, idempotency_key, "whatsapp", [
+                    (recipient_key("whatsapp", msg), msg["success"], msg.get("message_id"), msg.get("error"))
+                    for msg in result["messages"]
+                ])
             
-            await db.commit()
-        except Exception as e:
-            print(f"Error saving to history: {e}")
-            await db.rollback()
-        finally:
-            break
+            # Save each chunk to history as soon as it is sent
+            await save_template_history(db, request.template_name, result["messages"])
     
     return BulkSendResponse(
-        total=result["total"],
-        sent=result["sent"],
-        failed=result["failed"],
-        messages=[MessageResult(**msg) for msg in result["messages"]]
+        total=totals["total"],
+        sent=totals["sent"],
+        failed=totals["failed"],
+        duplicates=totals["duplicates"],
+        messages=[MessageResult(**msg) for msg in totals["messages"]]
     )
 
 
+async def save_template_history(db: AsyncSession, template_name: str, messages: List[Dict[str, Any]]):
+    """Save template send results to the message history."""
+    try:
+        # Get template content for logging (simplified)
+        message_content = f"Template: {template_name}"
+        
+        await insert_rows(db, MessageLog, [
+            {
+                "recipient_name": msg_result["recipient"],
+                "recipient_phone": msg_result.get("phone"),
+                "recipient_email": None,
+                "subject": template_name,
+                "message_content": message_content,
+                "channel": "whatsapp",
+                "status": "sent" if msg_result["success"] else "failed",
+                "error_message": msg_result.get("error"),
+                "attachments": []
+            }
+            for msg_result in messages
+        ])
+        await db.commit()
+    except Exception as e:
+        print(f"Error saving to history: {e}")
+        await db.rollback()
+
+
 @router.post("/send-single")
 async def send_single_template(request: SendSingleTemplateRequest):
     """
@@ -157,8 +220,21 @@ async def send_single_template(request: SendSingleTemplateRequest):
     # Build components from variables
     components = None
     if request.variables:
+        variables = request.variables
+        # Order parameters like the template body (served from the template cache)
+        compiled = await whatsapp_service.get_compiled_template(request.template_name, request.language_code)
+        if compiled and compiled.body_variables:
+            # Known body variables first; anything else is passed through as sent
+            variables = {
+                name: request.variables[name]
+                for name in compiled.body_variables
+                if name in request.variables
+            }
+            for name, value in request.variables.items():
+                variables.setdefault(name, value)
+        
         body_params = []
-        for var_name, value in request.variables.items():
+        for var_name, value in variables.items():
             if value:  # Only add non-empty values
                 body_params.append({
                     "type": "text",
@@ -172,39 +248,34 @@ async def send_single_template(request: SendSingleTemplateRequest):
                 "parameters": body_params
             }]
     
-    result = await whatsapp_service.send_template_message(
-        to_phone=request.phone,
-        template_name=request.template_name,
-        language_code=request.language_code,
-        components=components
+    # Transient errors are retried with backoff before reporting a failure
+    result = await run_with_retry(
+        lambda: whatsapp_service.dispatch_template_message(
+            to_phone=request.phone,
+            template_name=request.template_name,
+            language_code=request.language_code,
+            components=components,
+            priority=PRIORITY_HIGH  # Reserved lane: not queued behind running campaigns
+        ),
+        classify_whatsapp_result
     )
+    record_completed("whatsapp", "graph", sent=int(result["success"]), failed=int(not result["success"]))
     
-    # Save to database
-    from database import get_db
-    from models.message_log import MessageLog
-    
-    async for db in get_db():
-        try:
-            message_content = f"Template: {request.template_name}"
-            
-            log_entry = MessageLog(
-                recipient_name=request.recipient_name or "Unknown",
-                recipient_phone=request.phone,
-                recipient_email=None,
-                subject=request.template_name,
-                message_content=message_content,
-                channel="whatsapp",
-                status="sent" if result["success"] else "failed",
-                error_message=result.get("error"),
-                attachments=[]
-            )
-            db.add(log_entry)
-            await db.commit()
-        except Exception as e:
-            print(f"Error saving to history: {e}")
-            await db.rollback()
-        finally:
-            break
+    # Save to history with the next flush of the status buffer (no commit per message)
+    try:
+        await status_buffer.add_log({
+            "recipient_name": request.recipient_name or "Unknown",
+            "recipient_phone": request.phone,
+            "recipient_email": None,
+            "subject": request.template_name,
+            "message_content": f"Template: {request.template_name}",
+            "channel": "whatsapp",
+            "status": "sent" if result["success"] else "failed",
+            "error_message": result.get("error"),
+            "attachments": []
+        })
+    except Exception as e:
+        print(f"Error saving to history: {e}")
     
     if result["success"]:
         return {
@@ -242,6 +313,7 @@ async def check_whatsapp_config():
             "business_account_id": has_business_id,
             "phone_number_id": has_phone_id
         },
+        "senders": whatsapp_service.sender_pool.status(),
         "can_fetch_templates": has_token and has_business_id,
         "can_send_messages": has_token and has_phone_id
     }
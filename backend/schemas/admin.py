@@ -0,0 +1,15 @@
+"""Pydantic schemas for the admin endpoints."""
+from typing import Optional
+from pydantic import BaseModel, Field
+
+
+class ProfilingRequest(BaseModel):
+    """
+    What to profile next: requests to a route, background jobs, and/or a
+    time window of the whole process.
+    """
+    route: Optional[str] = Field(None, description="Request path, e.g. /history/export, or '*' for any")
+    requests: int = Field(1, ge=1, le=100, description="Number of requests to profile")
+    job: Optional[str] = Field(None, description="Background job: send_bulk, campaign or '*'")
+    jobs: int = Field(1, ge=1, le=100, description="Number of jobs to profile")
+    seconds: Optional[float] = Field(None, gt=0, le=600, description="Profile everything running for this long")
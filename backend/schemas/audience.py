@@ -0,0 +1,56 @@
+"""Pydantic schemas for audience (set operations over groups and segments)."""
+from typing import Optional, List
+from pydantic import BaseModel, Field, model_validator
+
+
+class AudienceOperand(BaseModel):
+    """A set of contacts: a stored group or an OWO contact segment."""
+    group_id: Optional[int] = None
+    department: Optional[str] = None  # OWO segment: Apostador, Operacional o Inactivo
+
+    @model_validator(mode="after")
+    def check_single_source(self):
+        if (self.group_id is None) == (self.department is None):
+            raise ValueError("Cada operando debe indicar group_id o department (solo uno)")
+        return self
+
+
+class AudienceRequest(BaseModel):
+    """Request to combine groups and segments into an audience."""
+    operation: str = Field(default="union", pattern="^(union|intersection|difference)$")
+    operands: List[AudienceOperand] = Field(..., min_length=1)
+    key: str = Field(default="phone", pattern="^(phone|email)$")
+    output: str = Field(default="count", pattern="^(count|list|group)$")
+    group_name: Optional[str] = None  # Required when output is 'group'
+    description: Optional[str] = None
+
+    @model_validator(mode="after")
+    def check_group_name(self):
+        if self.output == "group" and not self.group_name:
+            raise ValueError("group_name es requerido cuando output es 'group'")
+        return self
+
+
+class AudienceCountResponse(BaseModel):
+    """Number of distinct contacts in an audience."""
+    operation: str
+    key: str
+    count: int
+
+
+class AudienceReference(BaseModel):
+    """Fields for send requests that target a stored audience instead of a recipient list."""
+    group_id: Optional[int] = Field(default=None, description="Send to every contact of this group")
+    department: Optional[str] = Field(default=None, description="Send to an OWO contact segment (e.g. Apostador)")
+
+    @model_validator(mode="after")
+    def check_single_reference(self):
+        if self.group_id is not None and self.department is not None:
+            raise ValueError("Indique group_id o department, no ambos")
+        return self
+
+    def audience_operand(self) -> Optional[AudienceOperand]:
+        """Return the referenced audience, or None when recipients are sent inline."""
+        if self.group_id is None and self.department is None:
+            return None
+        return AudienceOperand(group_id=self.group_id, department=self.department)
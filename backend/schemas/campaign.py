@@ -0,0 +1,90 @@
+"""Pydantic schemas for scheduled campaigns."""
+import re
+from datetime import datetime
+from typing import Optional, List, Dict, Any
+from pydantic import BaseModel, Field, field_validator, model_validator
+from schemas.audience import AudienceReference
+
+WINDOW_PATTERN = re.compile(r'^([01]\d|2[0-3]):[0-5]\d-([01]\d|2[0-3]):[0-5]\d$')
+
+
+class CampaignRecipientIn(BaseModel):
+    """Inline campaign recipient; extra fields can be used as template variables."""
+    name: Optional[str] = None
+    phone: Optional[str] = None
+    email: Optional[str] = None
+
+    model_config = {
+        "extra": "allow"
+    }
+
+
+class CampaignCreate(AudienceReference):
+    """Schema for scheduling a campaign (inline recipients or group_id/department)."""
+    name: str = Field(..., min_length=1, max_length=255)
+    channel: str = Field(..., pattern="^(whatsapp_template|sms)$")
+    recipients: List[CampaignRecipientIn] = Field(default_factory=list)
+    # WhatsApp template sends
+    template_name: Optional[str] = None
+    language_code: str = "es_CO"
+    variable_mapping: Optional[Dict[str, str]] = None
+    header_media_url: Optional[str] = None
+    # SMS sends ({{nombre}} style variables are personalized per recipient)
+    message: Optional[str] = None
+    test: bool = False
+    # Scheduling, in Colombia time
+    start_at: Optional[datetime] = Field(default=None, description="Hora de inicio (Colombia); ahora si se omite")
+    send_windows: List[str] = Field(default_factory=list, description="Franjas permitidas, p. ej. ['08:00-12:00', '14:00-19:00']")
+    send_days: List[int] = Field(default_factory=list, description="Días permitidos, 0 (lunes) a 6 (domingo)")
+    max_rate_per_minute: int = Field(default=60, ge=1, le=6000)
+
+    @field_validator("send_windows")
+    @classmethod
+    def check_windows(cls, windows):
+        for window in windows:
+            if not WINDOW_PATTERN.match(window):
+                raise ValueError(f"Franja inválida '{window}', use HH:MM-HH:MM")
+        return windows
+
+    @field_validator("send_days")
+    @classmethod
+    def check_days(cls, days):
+        if any(day < 0 or day > 6 for day in days):
+            raise ValueError("Los días deben estar entre 0 (lunes) y 6 (domingo)")
+        return sorted(set(days))
+
+    @model_validator(mode="after")
+    def check_channel_params(self):
+        if self.channel == "whatsapp_template" and not self.template_name:
+            raise ValueError("template_name es requerido para campañas de WhatsApp")
+        if self.channel == "sms" and not self.message:
+            raise ValueError("message es requerido para campañas de SMS")
+        if not self.recipients and self.audience_operand() is None:
+            raise ValueError("Se requiere al menos un destinatario, group_id o department")
+        return self
+
+
+class CampaignResponse(BaseModel):
+    """Campaign with its progress."""
+    id: int
+    name: str
+    channel: str
+    params: Dict[str, Any]
+    group_id: Optional[int]
+    department: Optional[str]
+    start_at: datetime
+    send_windows: List[str]
+    send_days: List[int]
+    max_rate_per_minute: int
+    status: str
+    paused_by_user: bool
+    total: int
+    sent: int
+    failed: int
+    last_error: Optional[str]
+    created_at: datetime
+    updated_at: datetime
+    completed_at: Optional[datetime]
+
+    class Config:
+        from_attributes = True
@@ -1,6 +1,6 @@
 """Pydantic schemas for groups and group contacts."""
 from datetime import datetime
-from typing import Optional, List
+from typing import Optional, List, Dict, Any
 from pydantic import BaseModel, EmailStr
 
 
@@ -72,6 +72,14 @@ class GroupDetailResponse(GroupBase):
         from_attributes = True
 
 
+class GroupContactPage(BaseModel):
+    """Keyset-paginated page of group contacts."""
+    group_id: int
+    contacts: List[Dict[str, Any]] = []
+    next_cursor: Optional[int] = None  # Pass as 'after' to fetch the next page
+    has_more: bool = False
+
+
 class ExcelUploadResponse(BaseModel):
     """Response after uploading an Excel file to create a group."""
     group_id: int
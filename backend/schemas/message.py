@@ -2,6 +2,7 @@
 from datetime import datetime
 from typing import Optional, List
 from pydantic import BaseModel, Field
+from schemas.audience import AudienceReference
 
 
 class RecipientInfo(BaseModel):
@@ -20,9 +21,9 @@ class MessageCreate(BaseModel):
     attachments: List[str] = Field(default_factory=list)
 
 
-class BulkMessageCreate(BaseModel):
-    """Schema for creating bulk messages."""
-    recipients: List[RecipientInfo]
+class BulkMessageCreate(AudienceReference):
+    """Schema for creating bulk messages (inline recipients or group_id/department)."""
+    recipients: List[RecipientInfo] = Field(default_factory=list)
     subject: Optional[str] = Field(None, max_length=500)
     content: str = Field(..., min_length=1)
     channel: str = Field(..., pattern="^(whatsapp|email|both)$")
@@ -52,6 +53,7 @@ class BulkSendResponse(BaseModel):
     total: int
     sent: int
     failed: int
+    duplicates: int = 0  # Recipients skipped by the Idempotency-Key
     batch_id: Optional[str] = None
     messages: List[MessageResponse]
 
@@ -68,3 +70,4 @@ class WebhookCallback(BaseModel):
     """Callback payload from n8n."""
     batch_id: str
     results: List[WebhookResult]
+    traceparent: Optional[str] = None  # Trace context sent with the webhook, echoed back
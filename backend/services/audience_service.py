@@ -0,0 +1,285 @@
+"""Audience service: set operations over groups and OWO contact segments in SQL."""
+import logging
+from contextlib import asynccontextmanager
+from typing import List, Dict, Any, AsyncIterator
+from sqlalchemy import (
+    MetaData, Table, Column, Integer, String, Index,
+    select, insert, literal, func, union, union_all, intersect, except_
+)
+from sqlalchemy.ext.asyncio import AsyncSession
+from models.group import Group, GroupContact, get_colombia_time, phone_match_key, email_match_key
+from schemas.audience import AudienceOperand
+
+logger = logging.getLogger(__name__)
+
+# OWO contacts live in an external API, so segments are loaded into a
+# per-connection temporary table to take part in the same SQL statement.
+_scratch_metadata = MetaData()
+
+owo_segment_table = Table(
+    "owo_segment",
+    _scratch_metadata,
+    Column("id", Integer, primary_key=True),
+    Column("segment", String(50), nullable=False),
+    Column("name", String(255), nullable=False),
+    Column("phone", String(50), nullable=True),
+    Column("email", String(255), nullable=True),
+    Column("phone_key", String(50), nullable=True),
+    Column("email_key", String(255), nullable=True),
+    Index("ix_owo_segment_phone_key", "segment", "phone_key"),
+    Index("ix_owo_segment_email_key", "segment", "email_key"),
+    prefixes=["TEMPORARY"],
+)
+
+
+async def _create_scratch(db: AsyncSession) -> None:
+    def _create(session):
+        conn = session.connection()
+        # Pooled connections may still hold the table from a previous request
+        owo_segment_table.drop(conn, checkfirst=True)
+        owo_segment_table.create(conn)
+    await db.run_sync(_create)
+
+
+async def _drop_scratch(db: AsyncSession) -> None:
+    await db.run_sync(lambda session: owo_segment_table.drop(session.connection(), checkfirst=True))
+
+
+async def group_exists(db: AsyncSession, group_id: int) -> bool:
+    """True if the group exists (send endpoints answer 404 for an unknown group_id)."""
+    result = await db.execute(select(Group.id).where(Group.id == group_id))
+    return result.scalar_one_or_none() is not None
+
+
+async def iter_owo_contacts(departments: List[str], chunk_size: int = 1000) -> AsyncIterator[List[Any]]:
+    """
+    Stream the OWO contacts of the given departments in chunks of Contact objects.
+    
+    The OWO API returns every contact in one response, but only the contacts
+    of the requested departments are transformed, one chunk at a time.
+    """
+    # Imported here: the OWO client lives with the contacts router
+    from routers.contacts import load_owo_raw_contacts, transform_owo_contact
+    
+    wanted = {d.lower() for d in departments}
+    chunk = []
+    for index, raw in enumerate(await load_owo_raw_contacts()):
+        contact = transform_owo_contact(raw, index)
+        if contact.department and contact.department.lower() in wanted:
+            chunk.append(contact)
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+    if chunk:
+        yield chunk
+
+
+async def _load_segments(db: AsyncSession, departments: List[str]) -> None:
+    """Fetch OWO contacts once and insert the requested departments in chunks."""
+    loaded = 0
+    async for contacts in iter_owo_contacts(departments):
+        await db.execute(insert(owo_segment_table), [
+            {
+                "segment": c.department.lower(),
+                "name": c.name,
+                "phone": c.phone,
+                "email": c.email,
+                "phone_key": phone_match_key(c.phone),
+                "email_key": email_match_key(c.email),
+            }
+            for c in contacts
+        ])
+        loaded += len(contacts)
+    logger.info(f"Loaded {loaded} OWO contacts for segments {departments}")
+
+
+@asynccontextmanager
+async def audience_scope(db: AsyncSession, operands: List[AudienceOperand]):
+    """Prepare the scratch segment table for the operands, dropping it on exit."""
+    departments = sorted({op.department for op in operands if op.department})
+    if not departments:
+        yield
+        return
+    
+    await _create_scratch(db)
+    try:
+        await _load_segments(db, departments)
+        yield
+    finally:
+        await _drop_scratch(db)
+
+
+def _operand_select(operand: AudienceOperand, key: str, rank: int):
+    """Select (key, name, phone, email, phone_key, email_key, rank, row_id) rows for one operand."""
+    if operand.group_id is not None:
+        source = GroupContact.__table__
+        condition = source.c.group_id == operand.group_id
+    else:
+        source = owo_segment_table
+        condition = source.c.segment == operand.department.lower()
+    
+    key_column = source.c.phone_key if key == "phone" else source.c.email_key
+    return (
+        select(
+            key_column.label("key"),
+            source.c.name,
+            source.c.phone,
+            source.c.email,
+            source.c.phone_key,
+            source.c.email_key,
+            literal(rank).label("rank"),
+            source.c.id.label("row_id"),
+        )
+        .where(condition)
+        .where(key_column.is_not(None))
+    )
+
+
+def build_key_query(operation: str, operands: List[AudienceOperand], key: str):
+    """
+    Build the compound select of distinct keys for the operation.
+    
+    'difference' keeps the keys of the first operand that are in none of the
+    others; compound operators are left-associative, so A EXCEPT B EXCEPT C.
+    """
+    selects = [
+        select(_operand_select(op, key, i).subquery().c.key)
+        for i, op in enumerate(operands)
+    ]
+    if len(selects) == 1:
+        return selects[0].distinct()
+    if operation == "intersection":
+        return intersect(*selects)
+    if operation == "difference":
+        return except_(*selects)
+    return union(*selects)
+
+
+def build_members_query(operation: str, operands: List[AudienceOperand], key: str):
+    """
+    Build the select of one representative contact per audience key.
+    
+    When a key appears in several operands, the row of the earliest operand
+    (and lowest id within it) is kept.
+    """
+    keys = build_key_query(operation, operands, key).subquery()
+    # Only the first operand can contribute members to a difference
+    sources = operands[:1] if operation == "difference" else operands
+    rows = union_all(*[_operand_select(op, key, i) for i, op in enumerate(sources)]).subquery()
+    
+    ranked = (
+        select(
+            rows.c.key,
+            rows.c.name,
+            rows.c.phone,
+            rows.c.email,
+            rows.c.phone_key,
+            rows.c.email_key,
+            func.row_number().over(
+                partition_by=rows.c.key,
+                order_by=(rows.c.rank, rows.c.row_id)
+            ).label("rn"),
+        )
+        .where(rows.c.key.in_(select(keys.c.key)))
+        .subquery()
+    )
+    return (
+        select(
+            ranked.c.key,
+            ranked.c.name,
+            ranked.c.phone,
+            ranked.c.email,
+            ranked.c.phone_key,
+            ranked.c.email_key,
+        )
+        .where(ranked.c.rn == 1)
+        .order_by(ranked.c.key)
+    )
+
+
+async def count_audience(db: AsyncSession, operation: str, operands: List[AudienceOperand], key: str) -> int:
+    """Count the distinct keys of the audience."""
+    async with audience_scope(db, operands):
+        keys = build_key_query(operation, operands, key).subquery()
+        result = await db.execute(select(func.count()).select_from(keys))
+        return result.scalar() or 0
+
+
+async def iter_members(
+    db: AsyncSession,
+    operand: AudienceOperand,
+    chunk_size: int = 1000
+) -> AsyncIterator[List[Dict[str, Any]]]:
+    """
+    Stream the contacts of a single group or segment in chunks, without deduplication.
+    
+    Groups are read with keyset pagination so the session stays usable between
+    chunks (callers add log rows while iterating).
+    """
+    if operand.department is not None:
+        async for contacts in iter_owo_contacts([operand.department], chunk_size):
+            yield [
+                {"name": c.name, "phone": c.phone, "email": c.email, "department": c.department}
+                for c in contacts
+            ]
+        return
+    
+    last_id = 0
+    while True:
+        stmt = (
+            select(GroupContact.id, GroupContact.name, GroupContact.phone, GroupContact.email)
+            .where(GroupContact.group_id == operand.group_id)
+            .where(GroupContact.id > last_id)
+            .order_by(GroupContact.id)
+            .limit(chunk_size)
+        )
+        result = await db.execute(stmt)
+        rows = result.all()
+        if not rows:
+            return
+        last_id = rows[-1].id
+        yield [{"name": row.name, "phone": row.phone, "email": row.email} for row in rows]
+
+
+async def iter_audience(
+    db: AsyncSession,
+    operation: str,
+    operands: List[AudienceOperand],
+    key: str,
+    chunk_size: int = 1000
+) -> AsyncIterator[List[Dict[str, Any]]]:
+    """Stream the audience members in chunks of dicts (name, phone, email)."""
+    async with audience_scope(db, operands):
+        stmt = build_members_query(operation, operands, key)
+        result = await db.stream(stmt)
+        async for partition in result.mappings().partitions(chunk_size):
+            yield [
+                {"name": row["name"], "phone": row["phone"], "email": row["email"]}
+                for row in partition
+            ]
+
+
+async def materialize_audience(
+    db: AsyncSession,
+    group_id: int,
+    operation: str,
+    operands: List[AudienceOperand],
+    key: str
+) -> int:
+    """Insert the audience members into an existing group with INSERT ... SELECT."""
+    async with audience_scope(db, operands):
+        members = build_members_query(operation, operands, key).subquery()
+        stmt = insert(GroupContact).from_select(
+            ["group_id", "name", "phone", "email", "phone_key", "email_key", "created_at"],
+            select(
+                literal(group_id),
+                members.c.name,
+                members.c.phone,
+                members.c.email,
+                members.c.phone_key,
+                members.c.email_key,
+                literal(get_colombia_time()),
+            )
+        )
+        result = await db.execute(stmt)
+        return result.rowcount
@@ -0,0 +1,130 @@
+"""
+Bulk writes that use the best statement each database offers.
+
+On PostgreSQL (asyncpg) rows are inserted with COPY and updated with a
+single UPDATE ... FROM (VALUES ...) per chunk; on SQLite both fall back to
+executemany, which runs in one transaction and reuses the prepared
+statement. Callers pass plain dicts, so the ORM unit of work (one INSERT
+or UPDATE per object) is skipped entirely.
+"""
+import json
+from typing import Any, Dict, Iterable, List, Sequence
+from sqlalchemy import JSON, Table, and_, bindparam, column, insert, update, values
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+# Rows per UPDATE ... FROM statement (PostgreSQL allows 32767 parameters)
+UPDATE_CHUNK_SIZE = 1000
+
+
+def _table(target) -> Table:
+    return getattr(target, "__table__", target)
+
+
+def _chunks(rows: List[Dict[str, Any]], size: int) -> Iterable[List[Dict[str, Any]]]:
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+
+def dialect_insert(db: AsyncSession, target):
+    """INSERT construct of the session's dialect (supports on_conflict_do_nothing)."""
+    if db.bind.dialect.name == "postgresql":
+        return postgresql.insert(_table(target))
+    return sqlite.insert(_table(target))
+
+
+def _with_defaults(table: Table, rows: List[Dict[str, Any]]) -> tuple:
+    """
+    Column names and value tuples for COPY, with the Python-side column
+    defaults (timestamps, JSON lists, statuses) that COPY would skip.
+    """
+    given = set()
+    for row in rows:
+        given.update(row)
+    columns = [c for c in table.columns if c.name in given or c.default is not None]
+    
+    def default(col):
+        if col.default is None:
+            return None
+        if col.default.is_callable:
+            return col.default.arg(None)
+        return col.default.arg
+    
+    records = []
+    for row in rows:
+        record = []
+        for col in columns:
+            value = row[col.name] if col.name in row else default(col)
+            if isinstance(col.type, JSON) and value is not None:
+                value = json.dumps(value)
+            record.append(value)
+        records.append(tuple(record))
+    return [c.name for c in columns], records
+
+
+async def insert_rows(db: AsyncSession, target, rows: List[Dict[str, Any]]) -> int:
+    """Insert plain-dict rows into a model's table; returns the number of rows."""
+    if not rows:
+        return 0
+    table = _table(target)
+    # Pending ORM changes (e.g. the parent of a foreign key) must reach the database first
+    await db.flush()
+    if db.bind.dialect.name != "postgresql":
+        await db.execute(insert(table), rows)
+        return len(rows)
+    
+    # COPY runs on the raw connection: the session's transaction must be
+    # open on it so the rows commit or roll back with the rest
+    conn = await db.connection()
+    await conn.exec_driver_sql("SELECT 1")
+    raw = await conn.get_raw_connection()
+    columns, records = _with_defaults(table, rows)
+    await raw.driver_connection.copy_records_to_table(table.name, records=records, columns=columns)
+    return len(rows)
+
+
+async def update_rows(
+    db: AsyncSession,
+    target,
+    rows: List[Dict[str, Any]],
+    match: Sequence[str],
+    where: Sequence[Any] = (),
+    **fixed: Any
+) -> int:
+    """
+    Update one row per dict, matched on the `match` columns.
+    
+    The other keys of each dict are the new values (every dict needs the
+    same keys); `where` adds conditions shared by all rows and `fixed`
+    values set on all of them. Returns the number of updated rows.
+    """
+    if not rows:
+        return 0
+    table = _table(target)
+    dialect = db.bind.dialect.name
+    names = list(rows[0])
+    set_names = [name for name in names if name not in match]
+    updated = 0
+    
+    if dialect == "postgresql":
+        for chunk in _chunks(rows, UPDATE_CHUNK_SIZE):
+            data = values(*[column(name, table.c[name].type) for name in names], name="data").data(
+                [tuple(row[name] for name in names) for row in chunk]
+            )
+            stmt = (
+                update(table)
+                .where(and_(*[table.c[name] == data.c[name] for name in match], *where))
+                .values({**{name: data.c[name] for name in set_names}, **fixed})
+            )
+            result = await db.execute(stmt)
+            updated += result.rowcount
+    else:
+        # Bind names must differ from the column names of an UPDATE
+        stmt = (
+            update(table)
+            .where(and_(*[table.c[name] == bindparam(f"b_{name}") for name in match], *where))
+            .values({**{name: bindparam(f"b_{name}") for name in set_names}, **fixed})
+        )
+        result = await db.execute(stmt, [{f"b_{name}": row[name] for name in names} for row in rows])
+        updated = result.rowcount
+    return updated
@@ -0,0 +1,385 @@
+"""Campaign scheduler: releases scheduled campaigns gradually inside their send windows."""
+import asyncio
+import logging
+import math
+import time
+from datetime import datetime, timedelta, time as dt_time
+from typing import Any, Dict, List, Optional, Tuple
+from sqlalchemy import select, func, update, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+from config import get_settings
+from database import async_session
+from models.campaign import Campaign, CampaignRecipient
+from models.message_log import MessageLog, get_colombia_time
+from schemas.audience import AudienceOperand
+from services.audience_service import iter_members
+from services.bulk_db import insert_rows
+from services.idempotency_service import (
+    claim_recipients, complete_recipients, recipient_key, select_claimed, sent_recipients
+)
+from services.message_renderer import compile_message
+from services.sms_service import sms_service
+from services.profiler import profiler
+from services.tracing import span
+from services.whatsapp_service import get_whatsapp_service
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+ACTIVE_STATUSES = ("scheduled", "running", "paused")
+
+
+def parse_window(window: str) -> Tuple[dt_time, dt_time]:
+    """Parse 'HH:MM-HH:MM' into (start, end) times."""
+    start, end = window.split("-")
+    return (
+        datetime.strptime(start, "%H:%M").time(),
+        datetime.strptime(end, "%H:%M").time()
+    )
+
+
+def in_send_window(now: datetime, windows: List[str], days: List[int]) -> bool:
+    """
+    True if `now` (Colombia time) falls inside one of the allowed windows.
+    
+    A window whose end is before its start spans midnight ('20:00-02:00').
+    No windows means any time; no days means every day.
+    """
+    if days and now.weekday() not in days:
+        return False
+    if not windows:
+        return True
+    current = now.time()
+    for window in windows:
+        start, end = parse_window(window)
+        if start <= end:
+            if start <= current < end:
+                return True
+        elif current >= start or current < end:
+            return True
+    return False
+
+
+def recipient_payload(row: CampaignRecipient) -> Dict[str, Any]:
+    """Recipient dict for the send services (stored extra fields first)."""
+    return {**(row.data or {}), "name": row.name or "", "phone": row.phone, "email": row.email}
+
+
+class CampaignScheduler:
+    """
+    Background loop that feeds due campaigns into the send pipeline.
+    
+    Every campaign_poll_interval seconds each due campaign releases at most
+    max_rate_per_minute * interval / 60 recipients (at least one), if Colombia
+    time is inside one of its send windows. After a release, next_release_at
+    holds the campaign back for as long as that release takes at its rate, so
+    rates below one recipient per tick are kept too. Campaigns pause outside
+    their windows and resume on their own when the next window opens.
+    
+    Sends are claimed with the idempotency key 'campaign-<id>', so a restart in
+    the middle of a release does not send a recipient twice.
+    
+    Status changes are conditional updates: a pause or cancel written by the
+    API while a release is in flight is never overwritten by the scheduler.
+    """
+    
+    def __init__(self, poll_interval: float):
+        self.poll_interval = poll_interval
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = asyncio.Event()
+    
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._stopping = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+    
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._stopping.set()
+        try:
+            # Let the current release finish so its results are recorded
+            await asyncio.wait_for(self._task, timeout=30)
+        except asyncio.TimeoutError:
+            self._task.cancel()
+        self._task = None
+    
+    async def _run(self) -> None:
+        logger.info(f"Campaign scheduler started (every {self.poll_interval}s)")
+        while not self._stopping.is_set():
+            started = time.monotonic()
+            try:
+                await self.tick()
+            except Exception as e:
+                logger.error(f"Campaign scheduler tick failed: {e}", exc_info=True)
+            # Fixed cadence: the release size per tick is what bounds the rate
+            wait = max(0.0, self.poll_interval - (time.monotonic() - started))
+            try:
+                await asyncio.wait_for(self._stopping.wait(), timeout=wait)
+            except asyncio.TimeoutError:
+                pass
+    
+    async def tick(self) -> None:
+        """Advance every due campaign by one release."""
+        now = get_colombia_time()
+        async with async_session() as db:
+            result = await db.execute(
+                select(Campaign.id)
+                .where(Campaign.status.in_(ACTIVE_STATUSES))
+                .where(Campaign.paused_by_user == False)  # noqa: E712
+                .where(Campaign.start_at <= now)
+                .order_by(Campaign.start_at, Campaign.id)
+            )
+            campaign_ids = result.scalars().all()
+        
+        for campaign_id in campaign_ids:
+            if self._stopping.is_set():
+                break
+            async with profiler.job("campaign"):
+                await self.advance(campaign_id, now)
+    
+    async def _set_status(
+        self,
+        db: AsyncSession,
+        campaign_id: int,
+        status: str,
+        expected: Tuple[str, ...],
+        **values: Any
+    ) -> bool:
+        """Move a campaign to `status` only if it is still in one of the `expected` states."""
+        result = await db.execute(
+            update(Campaign)
+            .where(Campaign.id == campaign_id)
+            .where(Campaign.status.in_(expected))
+            .where(Campaign.paused_by_user == False)  # noqa: E712
+            .values(status=status, **values)
+        )
+        return result.rowcount > 0
+    
+    async def advance(self, campaign_id: int, now: datetime) -> None:
+        """Release the next slice of one campaign."""
+        async with async_session() as db:
+            campaign = await db.get(Campaign, campaign_id)
+            if campaign is None or campaign.status not in ACTIVE_STATUSES or campaign.paused_by_user:
+                return
+            
+            if not in_send_window(now, campaign.send_windows or [], campaign.send_days or []):
+                if campaign.status != "paused":
+                    if await self._set_status(db, campaign.id, "paused", ("scheduled", "running")):
+                        logger.info(f"Campaign {campaign.id} paused outside its send window")
+                    await db.commit()
+                return
+            
+            if not campaign.recipients_loaded:
+                try:
+                    await self._load_recipients(db, campaign)
+                except Exception as e:
+                    # e.g. OWO unavailable: keep the campaign and try again next tick
+                    await db.rollback()
+                    campaign = await db.get(Campaign, campaign_id)
+                    campaign.last_error = f"Error cargando destinatarios: {getattr(e, 'detail', e)}"
+                    await db.commit()
+                    return
+            
+            release_size = max(1, math.floor(campaign.max_rate_per_minute * self.poll_interval / 60))
+            pending = (
+                select(CampaignRecipient)
+                .where(CampaignRecipient.campaign_id == campaign.id)
+                .where(CampaignRecipient.status == "pending")
+            )
+            # Rows still claimed by an interrupted release wait without blocking the ones after them
+            result = await db.execute(
+                pending
+                .where(or_(CampaignRecipient.retry_at.is_(None), CampaignRecipient.retry_at <= now))
+                .order_by(CampaignRecipient.id)
+                .limit(release_size)
+            )
+            rows = result.scalars().all()
+            
+            if not rows:
+                waiting = await db.execute(pending.limit(1))
+                if waiting.first() is not None:
+                    return
+                completed = await self._set_status(
+                    db, campaign.id, "completed", ACTIVE_STATUSES, completed_at=get_colombia_time()
+                )
+                await db.commit()
+                if completed:
+                    await db.refresh(campaign)
+                    logger.info(f"Campaign {campaign.id} completed: {campaign.sent} sent, {campaign.failed} failed")
+                return
+            
+            if campaign.next_release_at is not None and now < campaign.next_release_at:
+                return
+            
+            # Re-checks the status in this transaction: a pause or cancel since the tick started wins
+            previous_status = campaign.status
+            if not await self._set_status(db, campaign.id, "running", ACTIVE_STATUSES):
+                await db.rollback()
+                return
+            if previous_status != "running":
+                logger.info(f"Campaign {campaign.id} running")
+            
+            with span("campaign.release", campaign_id=campaign.id, channel=campaign.channel, recipients=len(rows)):
+                outcomes = await self._send(db, campaign, rows)
+                await self._record(db, campaign, rows, outcomes)
+            dispatched = sum(1 for status, _ in outcomes if status in ("sent", "failed"))
+            await db.execute(
+                update(Campaign)
+                .where(Campaign.id == campaign.id)
+                .values(next_release_at=now + timedelta(minutes=dispatched / campaign.max_rate_per_minute))
+            )
+            await db.commit()
+    
+    async def _load_recipients(self, db: AsyncSession, campaign: Campaign) -> None:
+        """Snapshot the referenced group or segment into campaign_recipients."""
+        if campaign.group_id is not None or campaign.department:
+            operand = AudienceOperand(group_id=campaign.group_id, department=campaign.department)
+            async for chunk in iter_members(db, operand):
+                await insert_rows(db, CampaignRecipient, [
+                    {
+                        "campaign_id": campaign.id,
+                        "name": member.get("name"),
+                        "phone": member.get("phone"),
+                        "email": member.get("email"),
+                        "data": {k: v for k, v in member.items() if k not in ("name", "phone", "email")},
+                        "status": "pending"
+                    }
+                    for member in chunk
+                ])
+        
+        count = await db.execute(
+            select(func.count(CampaignRecipient.id)).where(CampaignRecipient.campaign_id == campaign.id)
+        )
+        campaign.total = count.scalar_one()
+        campaign.recipients_loaded = True
+        campaign.last_error = None
+        await db.commit()
+        logger.info(f"Campaign {campaign.id}: {campaign.total} recipients loaded")
+    
+    async def _send(
+        self,
+        db: AsyncSession,
+        campaign: Campaign,
+        rows: List[CampaignRecipient]
+    ) -> List[Tuple[str, Optional[str]]]:
+        """Send one release and return (status, error) per row."""
+        params = campaign.params or {}
+        idempotency_key = f"campaign-{campaign.id}"
+        channel = "sms" if campaign.channel == "sms" else "whatsapp"
+        recipients = [recipient_payload(row) for row in rows]
+        
+        # Recipients already sent by an interrupted release are skipped; ones
+        # still claimed by it stay pending until the claim expires
+        keys = [recipient_key(channel, r) for r in recipients]
+        claimed = await claim_recipients(db, idempotency_key, channel, keys)
+        selected = select_claimed(recipients, keys, claimed)
+        selected_ids = {id(r) for r in selected}
+        already_sent = await sent_recipients(
+            db, idempotency_key, channel, [key for key in keys if key and key not in claimed]
+        )
+        outcomes: List[Tuple[str, Optional[str]]] = []
+        for r, key in zip(recipients, keys):
+            if id(r) in selected_ids or (key not in claimed and key not in already_sent):
+                outcomes.append(("pending", None))
+            elif key in already_sent:
+                outcomes.append(("skipped", "Ya enviado en esta campaña"))
+            else:
+                outcomes.append(("skipped", "Destinatario repetido en la campaña"))
+        positions = [i for i, r in enumerate(recipients) if id(r) in selected_ids]
+        if not selected:
+            return outcomes
+        # Commit the claims so the write lock is not held during the upstream calls
+        await db.commit()
+        
+        try:
+            if campaign.channel == "sms":
+                compiled = compile_message(params.get("message") or "")
+                for r in selected:
+                    r["message"] = compiled.render(r)
+                result = await sms_service.send_bulk(
+                    recipients=selected,
+                    message=params.get("message") or "",
+                    test_mode=params.get("test", False)
+                )
+                failed_indexes = set(result.get("failed_indexes", []))
+                if "failed_indexes" not in result and not result["success"]:
+                    failed_indexes = set(range(len(selected)))
+                for i, position in enumerate(positions):
+                    if i in failed_indexes:
+                        outcomes[position] = ("failed", result.get("error") or "Error enviando SMS")
+                    else:
+                        outcomes[position] = ("sent", None)
+            else:
+                result = await get_whatsapp_service().send_bulk_template_messages(
+                    recipients=selected,
+                    template_name=params.get("template_name"),
+                    language_code=params.get("language_code", "es_CO"),
+                    variable_mapping=params.get("variable_mapping"),
+                    header_media_url=params.get("header_media_url")
+                )
+                for position, message in zip(positions, result["messages"]):
+                    outcomes[position] = ("sent", None) if message["success"] else ("failed", message.get("error"))
+        except Exception as e:
+            logger.error(f"Campaign {campaign.id} release failed: {e}", exc_info=True)
+            for position in positions:
+                outcomes[position] = ("failed", str(e))
+        
+        await complete_recipients(db, idempotency_key, channel, [
+            (keys[position], outcomes[position][0] == "sent", None, outcomes[position][1])
+            for position in positions
+        ])
+        return outcomes
+    
+    async def _record(
+        self,
+        db: AsyncSession,
+        campaign: Campaign,
+        rows: List[CampaignRecipient],
+        outcomes: List[Tuple[str, Optional[str]]]
+    ) -> None:
+        """Update recipient rows, campaign counters and message history."""
+        now = get_colombia_time()
+        sent = failed = 0
+        log_channel = "sms" if campaign.channel == "sms" else "whatsapp"
+        params = campaign.params or {}
+        content = params.get("message") or f"Template: {params.get('template_name')}"
+        
+        logs = []
+        for row, (status, error) in zip(rows, outcomes):
+            if status == "pending":
+                # Claimed by an interrupted release: released again once the claim can expire
+                row.retry_at = now + timedelta(seconds=settings.idempotency_pending_timeout)
+                continue
+            row.status = status
+            row.error_message = error
+            if status == "skipped":
+                continue
+            row.sent_at = now
+            if status == "sent":
+                sent += 1
+            else:
+                failed += 1
+            logs.append({
+                "recipient_name": row.name or "Unknown",
+                "recipient_phone": row.phone,
+                "recipient_email": row.email,
+                "subject": campaign.name,
+                "message_content": content,
+                "channel": log_channel,
+                "status": status,
+                "error_message": error,
+                "attachments": [],
+                "batch_id": f"campaign-{campaign.id}"
+            })
+        await insert_rows(db, MessageLog, logs)
+        # Increments, so the API's writes to the campaign row are kept
+        await db.execute(
+            update(Campaign)
+            .where(Campaign.id == campaign.id)
+            .values(sent=Campaign.sent + sent, failed=Campaign.failed + failed)
+        )
+
+
+# Singleton instance
+campaign_scheduler = CampaignScheduler(poll_interval=settings.campaign_poll_interval)
@@ -0,0 +1,149 @@
+"""Circuit breakers for the upstream integrations (n8n, Graph API, LabsMobile, OWO)."""
+import logging
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+from config import get_settings
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """
+    Stops calling an upstream that is failing.
+    
+    The circuit opens after `failure_threshold` consecutive failures, or when
+    the error rate over the last `window_size` calls reaches `error_rate`
+    (once at least `min_calls` were made). While open, calls are rejected
+    without touching the network. After `recovery_timeout` seconds a single
+    probe call is let through (half-open): success closes the circuit,
+    failure opens it again.
+    """
+    
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = 5,
+        error_rate: float = 0.5,
+        window_size: int = 20,
+        min_calls: int = 10,
+        recovery_timeout: float = 30.0
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.error_rate = error_rate
+        self.min_calls = min_calls
+        self.recovery_timeout = recovery_timeout
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self.opened_count = 0
+        self.rejected = 0
+        self._window: Deque[bool] = deque(maxlen=window_size)  # True for failures
+        self._probe_started_at: Optional[float] = None
+    
+    def allow(self) -> bool:
+        """True if a call may be made now; counts a rejection otherwise."""
+        now = time.monotonic()
+        if self.state == OPEN and now - self.opened_at >= self.recovery_timeout:
+            self.state = HALF_OPEN
+            self._probe_started_at = None
+            logger.info(f"Circuit '{self.name}' half-open: probing upstream")
+        
+        if self.state == CLOSED:
+            return True
+        if self.state == HALF_OPEN:
+            # One probe at a time; a probe that never reported back expires
+            if self._probe_started_at is None or now - self._probe_started_at >= self.recovery_timeout:
+                self._probe_started_at = now
+                return True
+        self.rejected += 1
+        return False
+    
+    def retry_after(self) -> float:
+        """Seconds until the next probe is allowed (0 when closed)."""
+        if self.state != OPEN:
+            return 0.0
+        return max(0.0, self.recovery_timeout - (time.monotonic() - self.opened_at))
+    
+    def record_success(self) -> None:
+        self.consecutive_failures = 0
+        self._window.append(False)
+        if self.state == HALF_OPEN:
+            self.state = CLOSED
+            self._window.clear()
+            logger.info(f"Circuit '{self.name}' closed: upstream recovered")
+    
+    def record_failure(self) -> None:
+        self.consecutive_failures += 1
+        self._window.append(True)
+        if self.state == HALF_OPEN:
+            self._open("probe failed")
+        elif self.state == CLOSED:
+            if self.consecutive_failures >= self.failure_threshold:
+                self._open(f"{self.consecutive_failures} consecutive failures")
+            elif len(self._window) >= self.min_calls and self._failure_rate() >= self.error_rate:
+                self._open(f"error rate {self._failure_rate():.0%}")
+    
+    def record(self, success: bool) -> None:
+        if success:
+            self.record_success()
+        else:
+            self.record_failure()
+    
+    def _failure_rate(self) -> float:
+        return sum(self._window) / len(self._window) if self._window else 0.0
+    
+    def _open(self, reason: str) -> None:
+        self.state = OPEN
+        self.opened_at = time.monotonic()
+        self.opened_count += 1
+        self._probe_started_at = None
+        logger.warning(f"Circuit '{self.name}' opened ({reason}); retrying in {self.recovery_timeout}s")
+    
+    def status(self) -> Dict[str, Any]:
+        # Reading the state through allow() would consume the probe slot
+        state = self.state
+        if state == OPEN and self.retry_after() == 0:
+            state = HALF_OPEN
+        return {
+            "state": state,
+            "consecutive_failures": self.consecutive_failures,
+            "error_rate": round(self._failure_rate(), 3),
+            "retry_after": round(self.retry_after(), 1),
+            "times_opened": self.opened_count,
+            "rejected_calls": self.rejected
+        }
+
+
+def _build_breakers() -> Dict[str, CircuitBreaker]:
+    settings = get_settings()
+    return {
+        name: CircuitBreaker(
+            name,
+            failure_threshold=settings.circuit_failure_threshold,
+            error_rate=settings.circuit_error_rate,
+            window_size=settings.circuit_window_size,
+            min_calls=settings.circuit_min_calls,
+            recovery_timeout=settings.circuit_recovery_timeout
+        )
+        for name in ("n8n", "graph", "labsmobile", "owo")
+    }
+
+
+# One breaker per upstream, shared by every request
+breakers = _build_breakers()
+
+
+def get_breaker(name: str) -> CircuitBreaker:
+    """Get the circuit breaker of an upstream ('n8n', 'graph', 'labsmobile', 'owo')."""
+    return breakers[name]
+
+
+def circuit_states() -> Dict[str, Dict[str, Any]]:
+    """State of every circuit, for /health."""
+    return {name: breaker.status() for name, breaker in breakers.items()}
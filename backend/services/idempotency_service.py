@@ -0,0 +1,236 @@
+"""Idempotency keys: claim each (campaign, channel, recipient) before dispatch."""
+import logging
+import uuid
+from datetime import timedelta
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+from sqlalchemy import select, update, delete, and_, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+from config import get_settings
+from models.idempotency import IdempotencyKey
+from models.group import phone_match_key, email_match_key
+from models.message_log import get_colombia_time
+from services.bulk_db import dialect_insert, update_rows
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+# SQLite limits the number of bound parameters per statement
+CLAIM_CHUNK_SIZE = 500
+
+
+def recipient_key(channel: str, recipient: Dict[str, Any]) -> Optional[str]:
+    """Normalized recipient identity for a channel (phone or email match key)."""
+    if channel == "email":
+        return email_match_key(recipient.get("email"))
+    return phone_match_key(recipient.get("phone"))
+
+
+def _chunks(items: List[str], size: int = CLAIM_CHUNK_SIZE) -> Iterable[List[str]]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+async def claim_recipients(
+    db: AsyncSession,
+    campaign_key: str,
+    channel: str,
+    recipients: Iterable[str],
+    batch_id: Optional[str] = None,
+    commit: bool = True
+) -> Set[str]:
+    """
+    Claim recipients for a campaign send on one channel.
+    
+    Returns the recipient keys this call may send to. Keys already sent or
+    still pending in the same campaign are left out; failed ones (and pending
+    claims older than idempotency_pending_timeout, left by a crash) are
+    claimed again.
+    
+    With commit=False the claims are only flushed, so the caller commits
+    them together with the rows it queues from them.
+    """
+    keys = list(dict.fromkeys(r for r in recipients if r))
+    if not keys:
+        return set()
+    
+    claim_id = uuid.uuid4().hex
+    now = get_colombia_time()
+    abandoned_before = now - timedelta(seconds=settings.idempotency_pending_timeout)
+    claimed: Set[str] = set()
+    
+    for chunk in _chunks(keys):
+        scope = and_(
+            IdempotencyKey.campaign_key == campaign_key,
+            IdempotencyKey.channel == channel,
+            IdempotencyKey.recipient.in_(chunk)
+        )
+        # New recipients: the unique constraint decides the race between concurrent requests
+        await db.execute(
+            dialect_insert(db, IdempotencyKey)
+            .values([
+                {
+                    "campaign_key": campaign_key,
+                    "channel": channel,
+                    "recipient": key,
+                    "status": "pending",
+                    "claim_id": claim_id,
+                    "batch_id": batch_id,
+                    "created_at": now,
+                    "updated_at": now
+                }
+                for key in chunk
+            ])
+            .on_conflict_do_nothing(index_elements=["campaign_key", "channel", "recipient"])
+        )
+        # Retry failed sends and recover abandoned claims
+        await db.execute(
+            update(IdempotencyKey)
+            .where(scope)
+            .where(or_(
+                IdempotencyKey.status == "failed",
+                and_(IdempotencyKey.status == "pending", IdempotencyKey.updated_at < abandoned_before)
+            ))
+            .values(status="pending", claim_id=claim_id, batch_id=batch_id, error_message=None, updated_at=now)
+        )
+        result = await db.execute(
+            select(IdempotencyKey.recipient).where(scope).where(IdempotencyKey.claim_id == claim_id)
+        )
+        claimed.update(result.scalars().all())
+    
+    if commit:
+        # Make the claims visible to concurrent requests before sending
+        await db.commit()
+    
+    skipped = len(keys) - len(claimed)
+    if skipped:
+        logger.info(f"Idempotency '{campaign_key}' ({channel}): {skipped} recipient(s) already sent or in progress")
+    return claimed
+
+
+async def sent_recipients(
+    db: AsyncSession,
+    campaign_key: str,
+    channel: str,
+    recipients: Iterable[str]
+) -> Set[str]:
+    """Recipient keys already sent in a campaign on one channel."""
+    keys = list(dict.fromkeys(r for r in recipients if r))
+    sent: Set[str] = set()
+    for chunk in _chunks(keys):
+        result = await db.execute(
+            select(IdempotencyKey.recipient)
+            .where(IdempotencyKey.campaign_key == campaign_key)
+            .where(IdempotencyKey.channel == channel)
+            .where(IdempotencyKey.recipient.in_(chunk))
+            .where(IdempotencyKey.status == "sent")
+        )
+        sent.update(result.scalars().all())
+    return sent
+
+
+def select_claimed(
+    recipients: List[Dict[str, Any]],
+    keys: List[Optional[str]],
+    claimed: Set[str]
+) -> List[Dict[str, Any]]:
+    """
+    Keep the recipients this request may send to.
+    
+    Only the first occurrence of a claimed key is kept; recipients without a
+    key (no valid phone/email) pass through so they are reported as failed.
+    """
+    selected = []
+    seen: Set[str] = set()
+    for recipient, key in zip(recipients, keys):
+        if key is None:
+            selected.append(recipient)
+        elif key in claimed and key not in seen:
+            seen.add(key)
+            selected.append(recipient)
+    return selected
+
+
+async def complete_recipients(
+    db: AsyncSession,
+    campaign_key: str,
+    channel: str,
+    outcomes: Iterable[Tuple[str, bool, Optional[str], Optional[str]]]
+) -> None:
+    """
+    Record send outcomes as (recipient key, success, message_id, error).
+    
+    Failed recipients become claimable again by a retry with the same key.
+    All outcomes are written with one bulk update.
+    """
+    rows = {
+        key: {
+            "recipient": key,
+            "status": "sent" if success else "failed",
+            "message_id": message_id,
+            "error_message": None if success else (str(error) if error else None)
+        }
+        for key, success, message_id, error in outcomes
+        if key
+    }
+    await update_rows(
+        db, IdempotencyKey, list(rows.values()), match=["recipient"],
+        where=[IdempotencyKey.campaign_key == campaign_key, IdempotencyKey.channel == channel],
+        updated_at=get_colombia_time()
+    )
+    await db.commit()
+
+
+async def complete_batch_recipients(
+    db: AsyncSession,
+    channel: str,
+    outcomes: Iterable[Tuple[str, Optional[str], bool, Optional[str]]]
+) -> int:
+    """Record outcomes reported by n8n callbacks as (batch id, recipient key, success, error)."""
+    # The last outcome of a repeated recipient wins, as with one update per result
+    rows = {
+        (batch_id, key): {
+            "batch_id": batch_id,
+            "recipient": key,
+            "status": "sent" if success else "failed",
+            "error_message": None if success else error
+        }
+        for batch_id, key, success, error in outcomes
+        if key
+    }
+    return await update_rows(
+        db, IdempotencyKey, list(rows.values()), match=["batch_id", "recipient"],
+        where=[IdempotencyKey.channel == channel],
+        updated_at=get_colombia_time()
+    )
+
+
+async def release_recipients(
+    db: AsyncSession,
+    batch_id: str,
+    channel: str,
+    recipients: Iterable[Optional[str]],
+    error: Optional[str] = None
+) -> int:
+    """Mark the pending claims of these recipients of a batch as failed so a retry can send them."""
+    keys = sorted({key for key in recipients if key})
+    now = get_colombia_time()
+    released = 0
+    for chunk in _chunks(keys):
+        result = await db.execute(
+            update(IdempotencyKey)
+            .where(IdempotencyKey.batch_id == batch_id)
+            .where(IdempotencyKey.channel == channel)
+            .where(IdempotencyKey.status == "pending")
+            .where(IdempotencyKey.recipient.in_(chunk))
+            .values(status="failed", error_message=error, updated_at=now)
+        )
+        released += result.rowcount
+    return released
+
+
+async def purge_expired(db: AsyncSession) -> int:
+    """Delete keys older than idempotency_retention_hours."""
+    cutoff = get_colombia_time() - timedelta(hours=settings.idempotency_retention_hours)
+    result = await db.execute(delete(IdempotencyKey).where(IdempotencyKey.created_at < cutoff))
+    await db.commit()
+    return result.rowcount
@@ -0,0 +1,69 @@
+"""Event-loop lag monitor: how late the loop runs a callback scheduled at a fixed interval."""
+import asyncio
+import math
+import time
+from collections import deque
+from typing import Deque, Optional, Tuple
+from config import get_settings
+
+
+def percentile(values, fraction: float) -> float:
+    """Nearest-rank percentile of a non-empty sorted list."""
+    index = min(len(values) - 1, max(0, math.ceil(fraction * len(values)) - 1))
+    return values[index]
+
+
+class LoopLagMonitor:
+    """
+    Samples event-loop lag every `interval` seconds.
+    
+    A task sleeps for `interval` and records how much later than that it woke
+    up; blocking code in a handler (CPU-bound work, sync I/O) shows up as lag
+    for every request served by the same worker. Samples are kept with their
+    wall-clock time so a load test can ask for the lag during one scenario.
+    """
+    
+    def __init__(self, interval: float = 0.1, max_samples: int = 36000):
+        self.interval = interval
+        self.samples: Deque[Tuple[float, float]] = deque(maxlen=max_samples)
+        self._task: Optional[asyncio.Task] = None
+    
+    def start(self):
+        if self.interval > 0 and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._run())
+    
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+    
+    async def _run(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.monotonic() - expected)
+            self.samples.append((time.time(), lag))
+    
+    @property
+    def last_lag(self) -> float:
+        return self.samples[-1][1] if self.samples else 0.0
+    
+    def summary(self, since: Optional[float] = None) -> dict:
+        """Lag percentiles in milliseconds over the samples taken after `since` (epoch seconds)."""
+        lags = sorted(lag for ts, lag in self.samples if since is None or ts >= since)
+        if not lags:
+            return {"samples": 0, "p50_ms": 0.0, "p99_ms": 0.0, "max_ms": 0.0}
+        return {
+            "samples": len(lags),
+            "p50_ms": round(percentile(lags, 0.50) * 1000, 2),
+            "p99_ms": round(percentile(lags, 0.99) * 1000, 2),
+            "max_ms": round(lags[-1] * 1000, 2)
+        }
+
+
+# Singleton instance
+loop_monitor = LoopLagMonitor(get_settings().loop_monitor_interval)
@@ -0,0 +1,119 @@
+"""Compiled message templates for per-recipient personalization."""
+import re
+from functools import lru_cache
+from operator import itemgetter
+from typing import Any, Dict, List, Optional, Tuple
+
+# {{field}} or {{field|default value}}
+PLACEHOLDER_PATTERN = re.compile(r'\{\{\s*(\w+)\s*(?:\|([^}]*))?\}\}')
+
+# Spanish and English names of the built-in variables
+FIELD_ALIASES = {
+    "nombre": "name",
+    "telefono": "phone",
+    "correo": "email",
+    "primer_nombre": "first_name",
+}
+
+# Built-in variables render as '' when the recipient has no value
+BUILTIN_FIELDS = {"name", "phone", "email", "first_name"}
+
+
+class CompiledMessage:
+    """
+    A message template split once into literal text and placeholders.
+
+    Each distinct placeholder becomes a slot of a precomputed format string,
+    so rendering a recipient resolves every slot once and fills the text in
+    a single pass. Variable names, aliases included, match recipient fields
+    case-insensitively. Unknown variables without a default are left unchanged.
+    """
+
+    def __init__(self, template: str):
+        self.template = template or ""
+        # Distinct placeholders as (recipient field, value used when the field is empty)
+        self._slots: List[Tuple[str, str]] = []
+        slot_index: Dict[Tuple[str, str], int] = {}
+        parts: List[str] = []
+        order: List[int] = []  # Slot filling each placeholder position
+
+        position = 0
+        for match in PLACEHOLDER_PATTERN.finditer(self.template):
+            parts.append(_escape(self.template[position:match.start()]))
+            name = match.group(1).lower()
+            field = FIELD_ALIASES.get(name, name)
+            default = match.group(2)
+            if default is not None:
+                fallback = default
+            elif field in BUILTIN_FIELDS:
+                fallback = ""
+            else:
+                fallback = match.group(0)
+            # Aliases of the same field share a slot ({{nombre}} and {{name}})
+            slot = (field, fallback)
+            if slot not in slot_index:
+                slot_index[slot] = len(self._slots)
+                self._slots.append(slot)
+            order.append(slot_index[slot])
+            position = match.end()
+        parts.append(_escape(self.template[position:]))
+
+        self._format = "%s".join(parts)
+        self.is_static = not self._slots
+        # Maps slot values to placeholder positions when slots repeat
+        self._positions = None if order == list(range(len(self._slots))) else itemgetter(*order)
+        # first_name is derived from name unless the recipient provides it
+        self._first_name_slots = [i for i, (field, _) in enumerate(self._slots) if field == "first_name"]
+
+    @property
+    def fields(self) -> List[str]:
+        """Recipient fields referenced by the template, in order of first use."""
+        return [field for field, _ in self._slots]
+
+    def render(self, recipient: Dict[str, Any]) -> str:
+        """Personalize the template for one recipient."""
+        if self.is_static:
+            return self.template
+
+        # Empty values (None, '') use the fallback; %s converts the rest, 0 and False included
+        values = []
+        for field, fallback in self._slots:
+            value = _lookup(recipient, field)
+            values.append(fallback if _is_empty(value) else value)
+
+        if self._first_name_slots and _is_empty(_lookup(recipient, "first_name")):
+            name = _lookup(recipient, "name")
+            words = [] if _is_empty(name) else str(name).split()
+            first_name = words[0] if words else ""
+            for index in self._first_name_slots:
+                values[index] = first_name or self._slots[index][1]
+
+        if self._positions is not None:
+            return self._format % self._positions(values)
+        return self._format % tuple(values)
+
+
+def _lookup(recipient: Dict[str, Any], field: str) -> Any:
+    """Recipient value of a lower-case field, matching the key case-insensitively."""
+    if field in recipient:
+        return recipient[field]
+    for key, value in recipient.items():
+        if isinstance(key, str) and key.lower() == field:
+            return value
+    return None
+
+
+def _is_empty(value: Any) -> bool:
+    """Only None and '' count as missing; 0 and False are rendered."""
+    return value is None or value == ""
+
+
+def _escape(literal: str) -> str:
+    """Escape '%' so %-formatting only sees the slot markers."""
+    return literal.replace("%", "%%")
+
+
+@lru_cache(maxsize=256)
+def compile_message(template: str) -> CompiledMessage:
+    """Compile a message template, reusing the result for repeated templates."""
+    return CompiledMessage(template)
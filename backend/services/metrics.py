@@ -0,0 +1,125 @@
+"""Prometheus metrics for the send pipeline, served at /metrics."""
+import time
+from contextlib import contextmanager
+from typing import Optional
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from services.loop_monitor import loop_monitor
+
+# Upstream calls take from tens of milliseconds to minutes (large n8n batches)
+UPSTREAM_BUCKETS = (0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+DB_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5)
+
+MESSAGES_DISPATCHED = Counter(
+    "messaging_messages_dispatched_total",
+    "Messages handed to an upstream, counting every attempt",
+    ["channel", "upstream"]
+)
+MESSAGES_COMPLETED = Counter(
+    "messaging_messages_completed_total",
+    "Messages with a final outcome",
+    ["channel", "upstream", "status"]
+)
+UPSTREAM_LATENCY = Histogram(
+    "messaging_upstream_request_seconds",
+    "Latency of upstream HTTP requests",
+    ["upstream", "outcome"],
+    buckets=UPSTREAM_BUCKETS
+)
+QUEUE_DEPTH = Gauge(
+    "messaging_send_queue_depth",
+    "Recipients waiting in bulk send queues",
+    ["channel"]
+)
+IN_FLIGHT = Gauge(
+    "messaging_sends_in_flight",
+    "Messages currently being sent to an upstream",
+    ["channel"]
+)
+RATE_LIMITER_WAIT = Histogram(
+    "messaging_rate_limiter_wait_seconds",
+    "Time spent waiting for a rate limiter slot",
+    ["limiter", "lane"],
+    buckets=WAIT_BUCKETS
+)
+DB_QUERY_LATENCY = Histogram(
+    "messaging_db_query_seconds",
+    "Database statement execution time",
+    ["operation"],
+    buckets=DB_BUCKETS
+)
+CACHE_REQUESTS = Counter(
+    "messaging_cache_requests_total",
+    "Cache lookups by result (hit or miss)",
+    ["cache", "result"]
+)
+STATUS_BUFFER_PENDING = Gauge(
+    "messaging_status_buffer_pending",
+    "Message status changes waiting in the write-behind buffer"
+)
+STATUS_BUFFER_FLUSHES = Counter(
+    "messaging_status_buffer_flushes_total",
+    "Write-behind buffer flushes by outcome",
+    ["outcome"]
+)
+EVENT_LOOP_LAG = Gauge(
+    "messaging_event_loop_lag_seconds",
+    "Most recent event-loop lag sample"
+)
+EVENT_LOOP_LAG.set_function(lambda: loop_monitor.last_lag)
+
+
+def record_completed(channel: str, upstream: str, sent: int = 0, failed: int = 0):
+    """Count final outcomes of messages."""
+    if sent:
+        MESSAGES_COMPLETED.labels(channel, upstream, "sent").inc(sent)
+    if failed:
+        MESSAGES_COMPLETED.labels(channel, upstream, "failed").inc(failed)
+
+
+def record_cache(cache: str, hit: bool):
+    CACHE_REQUESTS.labels(cache, "hit" if hit else "miss").inc()
+
+
+def observe_upstream(upstream: str, started: float, status_code: Optional[int] = None):
+    """Observe an upstream call that started at `started` (perf_counter); no status means a network error."""
+    outcome = f"{status_code // 100}xx" if status_code else "error"
+    UPSTREAM_LATENCY.labels(upstream, outcome).observe(time.perf_counter() - started)
+
+
+@contextmanager
+def in_flight(channel: str, count: int = 1):
+    """Track messages being sent for the duration of the block."""
+    gauge = IN_FLIGHT.labels(channel)
+    gauge.inc(count)
+    try:
+        yield
+    finally:
+        gauge.dec(count)
+
+
+def instrument_engine(engine: Engine):
+    """Time every statement executed by a (sync) SQLAlchemy engine."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("metrics_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["metrics_started"].pop()
+        operation = statement.lstrip().split(None, 1)[0].lower() if statement.strip() else "other"
+        DB_QUERY_LATENCY.labels(operation).observe(time.perf_counter() - started)
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(context):
+        started = context.connection.info.get("metrics_started") if context.connection is not None else None
+        if started:
+            started.pop()
+
+
+def render_metrics():
+    """Exposition payload and its content type."""
+    return generate_latest(), CONTENT_TYPE_LATEST
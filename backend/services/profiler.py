@@ -0,0 +1,213 @@
+"""
+On-demand profiling of live requests and background jobs.
+
+An admin arms the profiler (see routers/admin.py) for the next N requests
+to a route, the next N background jobs, or a time window of the whole
+process, which also covers a send job that is already running. Each
+profile is written to settings.profiling_dir: pyinstrument HTML (flame and
+call-tree views) plus speedscope JSON when pyinstrument is installed,
+cProfile .prof files (snakeviz, flameprof) otherwise.
+
+While nothing is armed the only cost is one attribute check per request
+or job.
+"""
+import asyncio
+import cProfile
+import logging
+import os
+import re
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional
+from config import get_settings
+
+logger = logging.getLogger(__name__)
+
+try:
+    from pyinstrument import Profiler as SamplingProfiler
+    from pyinstrument.renderers import SpeedscopeRenderer
+except ImportError:  # Falls back to cProfile
+    SamplingProfiler = None
+    SpeedscopeRenderer = None
+
+ANY = "*"
+JOB_NAMES = ("send_bulk", "campaign")
+
+
+class Profiler:
+    """
+    Profiling state shared by the request middleware and the background jobs.
+    
+    Only one profile runs at a time: both backends hook the interpreter of
+    the event-loop thread, so a request or job that comes in while another
+    profile is running is not profiled and does not use up its slot.
+    """
+    
+    def __init__(self, output_dir: str, interval: float = 0.001):
+        self.output_dir = output_dir
+        self.interval = interval
+        self.routes: Dict[str, int] = {}
+        self.jobs: Dict[str, int] = {}
+        self.armed = False
+        self.busy = False
+        self._window: Optional[asyncio.Task] = None
+    
+    @property
+    def backend(self) -> str:
+        return "pyinstrument" if SamplingProfiler is not None else "cprofile"
+    
+    def _update_armed(self) -> None:
+        self.armed = bool(self.routes or self.jobs)
+    
+    def arm_route(self, path: str, count: int) -> None:
+        """Profile the next `count` requests to `path` ('*' for any path)."""
+        self.routes[path] = self.routes.get(path, 0) + count
+        self._update_armed()
+    
+    def arm_jobs(self, name: str, count: int) -> None:
+        """Profile the next `count` background jobs called `name` ('*' for any job)."""
+        self.jobs[name] = self.jobs.get(name, 0) + count
+        self._update_armed()
+    
+    def disarm(self) -> None:
+        self.routes.clear()
+        self.jobs.clear()
+        self._update_armed()
+        if self._window is not None:
+            self._window.cancel()
+    
+    def _take(self, targets: Dict[str, int], name: str) -> bool:
+        """Use one armed slot for `name`, if any is left and nothing else is profiling."""
+        if self.busy:
+            return False
+        key = name if name in targets else ANY if ANY in targets else None
+        if key is None:
+            return False
+        targets[key] -= 1
+        if targets[key] <= 0:
+            del targets[key]
+        self._update_armed()
+        return True
+    
+    def take_route(self, path: str) -> bool:
+        return self._take(self.routes, path)
+    
+    @asynccontextmanager
+    async def job(self, name: str) -> AsyncIterator[None]:
+        """Profile the block if a background job called `name` is armed."""
+        if not self.armed or not self._take(self.jobs, name):
+            yield
+            return
+        async with self.profile(f"job {name}"):
+            yield
+    
+    @asynccontextmanager
+    async def profile(self, label: str, async_mode: str = "enabled") -> AsyncIterator[None]:
+        """
+        Profile the block and write the artifacts.
+        
+        async_mode 'enabled' follows only the current task (awaits show up
+        as waiting time); 'disabled' samples everything the thread runs.
+        """
+        self.busy = True
+        started = time.perf_counter()
+        if SamplingProfiler is not None:
+            sampler = SamplingProfiler(interval=self.interval, async_mode=async_mode)
+            sampler.start()
+        else:
+            sampler = cProfile.Profile()
+            sampler.enable()
+        try:
+            yield
+        finally:
+            if SamplingProfiler is not None:
+                sampler.stop()
+            else:
+                sampler.disable()
+            self.busy = False
+            elapsed = time.perf_counter() - started
+            try:
+                paths = self._write(sampler, label)
+                logger.info(f"Profiled {label} ({elapsed:.3f}s) -> {', '.join(paths)}")
+            except OSError as e:
+                logger.error(f"Could not write profile for {label}: {e}")
+    
+    def start_window(self, seconds: float) -> bool:
+        """Profile the whole event-loop thread for `seconds` in the background; False if busy."""
+        if self.busy or (self._window is not None and not self._window.done()):
+            return False
+        
+        async def run():
+            if self.busy:
+                logger.warning("Profiling window skipped: another profile started first")
+                return
+            async with self.profile(f"window {seconds:g}s", async_mode="disabled"):
+                try:
+                    await asyncio.sleep(seconds)
+                except asyncio.CancelledError:
+                    pass  # Disarmed early: keep what was sampled
+        
+        self._window = asyncio.create_task(run())
+        return True
+    
+    def _write(self, sampler: Any, label: str) -> List[str]:
+        os.makedirs(self.output_dir, exist_ok=True)
+        slug = re.sub(r"[^A-Za-z0-9]+", "_", label).strip("_")[:80]
+        base = os.path.join(self.output_dir, f"{datetime.now():%Y%m%d-%H%M%S-%f}_{slug}")
+        if SamplingProfiler is None:
+            sampler.dump_stats(f"{base}.prof")
+            return [f"{base}.prof"]
+        with open(f"{base}.html", "w", encoding="utf-8") as f:
+            f.write(sampler.output_html())
+        with open(f"{base}.speedscope.json", "w", encoding="utf-8") as f:
+            f.write(sampler.output(SpeedscopeRenderer()))
+        return [f"{base}.html", f"{base}.speedscope.json"]
+    
+    def artifacts(self) -> List[Dict[str, Any]]:
+        """Written profiles, newest first."""
+        if not os.path.isdir(self.output_dir):
+            return []
+        entries = []
+        for name in os.listdir(self.output_dir):
+            path = os.path.join(self.output_dir, name)
+            if os.path.isfile(path):
+                stat = os.stat(path)
+                entries.append({
+                    "name": name,
+                    "size": stat.st_size,
+                    "created_at": datetime.fromtimestamp(stat.st_mtime).isoformat()
+                })
+        return sorted(entries, key=lambda entry: entry["name"], reverse=True)
+    
+    def status(self) -> Dict[str, Any]:
+        return {
+            "backend": self.backend,
+            "armed": self.armed,
+            "busy": self.busy,
+            "routes": dict(self.routes),
+            "jobs": dict(self.jobs),
+            "window_running": self._window is not None and not self._window.done(),
+            "output_dir": os.path.abspath(self.output_dir)
+        }
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware that profiles armed requests, including the body of
+    streaming responses such as /history/export.
+    """
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not profiler.armed or not profiler.take_route(scope["path"]):
+            await self.app(scope, receive, send)
+            return
+        async with profiler.profile(f"{scope['method']} {scope['path']}"):
+            await self.app(scope, receive, send)
+
+
+settings = get_settings()
+profiler = Profiler(settings.profiling_dir, settings.profiling_interval)
@@ -0,0 +1,121 @@
+"""
+Slow-query log and per-request database time.
+
+Every statement is timed through SQLAlchemy cursor events. Statements
+slower than settings.slow_query_ms are logged with their parameters and
+query plan. The time and number of statements of each request are summed
+in a context variable and returned in a Server-Timing header
+(`db;dur=12.3;desc="5 queries"`), which browsers show in the network
+panel; requests running more than settings.request_query_warning
+statements (the usual sign of an N+1 loop) are logged too.
+"""
+import logging
+import time
+from contextvars import ContextVar
+from typing import Optional
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+EXPLAIN_PREFIX = {
+    "sqlite": "EXPLAIN QUERY PLAN ",
+    "postgresql": "EXPLAIN ",
+}
+
+
+class QueryStats:
+    """Database statements run on behalf of one request."""
+    
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+    
+    def server_timing(self) -> str:
+        return f'db;dur={self.seconds * 1000:.1f};desc="{self.count} queries"'
+
+
+current_stats: ContextVar[Optional[QueryStats]] = ContextVar("query_stats", default=None)
+
+
+def _explain(conn, statement: str, parameters) -> str:
+    """Query plan of a statement, one line per plan row ('' if unavailable)."""
+    prefix = EXPLAIN_PREFIX.get(conn.dialect.name)
+    if prefix is None:
+        return ""
+    cursor = conn.connection.dbapi_connection.cursor()
+    try:
+        cursor.execute(prefix + statement, parameters)
+        return "\n".join(" | ".join(str(value) for value in row) for row in cursor.fetchall())
+    finally:
+        cursor.close()
+
+
+def track_queries(engine: Engine, slow_query_ms: float, explain: bool = True) -> None:
+    """Time every statement of a (sync) engine for the slow-query log and request stats."""
+    
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+    
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_started"].pop()
+        stats = current_stats.get()
+        if stats is not None:
+            stats.count += 1
+            stats.seconds += elapsed
+        
+        if slow_query_ms <= 0 or elapsed * 1000 < slow_query_ms:
+            return
+        plan = ""
+        if explain and not executemany:
+            try:
+                plan = _explain(conn, statement, parameters)
+            except Exception as e:
+                plan = f"(plan unavailable: {e})"
+        params = f"{len(parameters)} parameter sets" if executemany else repr(parameters)
+        message = f"Slow query ({elapsed * 1000:.1f} ms): {statement.strip()}\n  parameters: {params[:500]}"
+        if plan:
+            message += "\n  plan:\n    " + plan.replace("\n", "\n    ")
+        logger.warning(message)
+    
+    @event.listens_for(engine, "handle_error")
+    def handle_error(context):
+        started = context.connection.info.get("query_started") if context.connection is not None else None
+        if started:
+            started.pop()
+
+
+class ServerTimingMiddleware:
+    """ASGI middleware that reports each request's database time in Server-Timing."""
+    
+    def __init__(self, app, query_warning: int = 100):
+        self.app = app
+        self.query_warning = query_warning
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        stats = QueryStats()
+        token = current_stats.set(stats)
+        
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                # Statements run while a streaming body is sent are not included
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", stats.server_timing().encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+        
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            current_stats.reset(token)
+            if self.query_warning and stats.count > self.query_warning:
+                logger.warning(
+                    f"{scope['method']} {scope['path']} ran {stats.count} queries "
+                    f"({stats.seconds * 1000:.1f} ms); possible N+1"
+                )
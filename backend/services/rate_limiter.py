@@ -0,0 +1,91 @@
+"""Async rate limiter for upstream API calls."""
+import asyncio
+import time
+from typing import Optional
+from services.metrics import RATE_LIMITER_WAIT
+
+
+class AsyncRateLimiter:
+    """
+    Token-bucket style limiter (GCRA) for asyncio code.
+
+    Allows `rate` acquisitions per second on average with bursts of up to
+    `burst` back-to-back calls. Callers over the limit sleep until their slot.
+    """
+
+    def __init__(self, rate: float, burst: Optional[int] = None):
+        self.rate = rate
+        self.burst = max(1, burst if burst is not None else int(rate) or 1)
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._tat = 0.0  # Theoretical arrival time of the next call
+        self.total_wait = 0.0
+
+    def reserve(self) -> float:
+        """Claim the next slot and return how many seconds to wait for it."""
+        if self.interval <= 0:
+            return 0.0
+        now = time.monotonic()
+        tat = max(self._tat, now)
+        tolerance = (self.burst - 1) * self.interval
+        wait = max(0.0, tat - now - tolerance)
+        self._tat = tat + self.interval
+        return wait
+
+    async def acquire(self) -> float:
+        """Wait for a slot; returns the seconds waited."""
+        wait = self.reserve()
+        if wait > 0:
+            self.total_wait += wait
+            await asyncio.sleep(wait)
+        return wait
+
+
+PRIORITY_HIGH = "high"
+PRIORITY_BULK = "bulk"
+
+
+class PriorityRateLimiter:
+    """
+    Rate limiter with a high-priority lane that keeps a reserved share of the rate.
+    
+    Bulk callers are paced at rate * (1 - reserved_share) before taking a slot
+    of the overall limit, so the overall limiter never fills up with bulk work
+    and high-priority callers (single transactional sends) get a slot right
+    away even while a campaign saturates its lane.
+    """
+    
+    def __init__(self, rate: float, reserved_share: float = 0.2, burst: Optional[int] = None, name: str = "default"):
+        self.name = name
+        self.rate = rate
+        self.reserved_share = min(max(reserved_share, 0.0), 0.9)
+        self.total = AsyncRateLimiter(rate, burst)
+        bulk_rate = rate * (1 - self.reserved_share)
+        self.bulk = AsyncRateLimiter(bulk_rate, max(1, int(bulk_rate))) if rate > 0 else AsyncRateLimiter(0)
+        self.wait_by_lane = {PRIORITY_HIGH: 0.0, PRIORITY_BULK: 0.0}
+        self.calls_by_lane = {PRIORITY_HIGH: 0, PRIORITY_BULK: 0}
+    
+    @property
+    def total_wait(self) -> float:
+        return sum(self.wait_by_lane.values())
+    
+    async def acquire(self, priority: str = PRIORITY_BULK) -> float:
+        """Wait for a slot in the given lane; returns the seconds waited."""
+        lane = PRIORITY_HIGH if priority == PRIORITY_HIGH else PRIORITY_BULK
+        waited = 0.0
+        if lane == PRIORITY_BULK:
+            waited += await self.bulk.acquire()
+        waited += await self.total.acquire()
+        RATE_LIMITER_WAIT.labels(self.name, lane).observe(waited)
+        self.wait_by_lane[lane] += waited
+        self.calls_by_lane[lane] += 1
+        return waited
+    
+    def status(self) -> dict:
+        return {
+            lane: {
+                "calls": self.calls_by_lane[lane],
+                "avg_wait_ms": round(1000 * self.wait_by_lane[lane] / self.calls_by_lane[lane], 1)
+                if self.calls_by_lane[lane] else 0.0
+            }
+            for lane in (PRIORITY_HIGH, PRIORITY_BULK)
+        }
@@ -0,0 +1,134 @@
+"""Error classification and jittered exponential backoff for upstream sends."""
+import asyncio
+import logging
+import random
+from typing import Any, Awaitable, Callable, Dict, Optional
+from config import get_settings
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE = "retryable"
+PERMANENT = "permanent"
+
+# Graph API codes that mean "slow down" (app, account or pair rate limits)
+GRAPH_THROTTLING_CODES = {4, 17, 32, 613, 80007, 130429, 131048, 131056}
+
+# Graph API codes for temporary platform errors
+GRAPH_RETRYABLE_CODES = GRAPH_THROTTLING_CODES | {1, 2, 131000, 131016, 133004}
+
+# LabsMobile: 30 is a generic delivery error on their side; others (bad number, no credit...) are final
+LABSMOBILE_RETRYABLE_CODES = {"30"}
+
+RETRYABLE_STATUS_CODES = {408, 425, 429, 500, 502, 503, 504}
+
+
+def _classify(result: Dict[str, Any], error_code: Any, retryable_codes: set) -> Optional[str]:
+    if result.get("success"):
+        return None
+    if result.get("network_error") or result.get("circuit_open"):
+        return RETRYABLE
+    if result.get("status_code") in RETRYABLE_STATUS_CODES:
+        return RETRYABLE
+    if error_code is not None and error_code in retryable_codes:
+        return RETRYABLE
+    return PERMANENT
+
+
+def classify_whatsapp_result(result: Dict[str, Any]) -> Optional[str]:
+    """RETRYABLE, PERMANENT, or None for a successful Graph API send."""
+    return _classify(result, result.get("error_code"), GRAPH_RETRYABLE_CODES)
+
+
+def classify_sms_result(result: Dict[str, Any]) -> Optional[str]:
+    """
+    RETRYABLE, PERMANENT, or None for a successful LabsMobile send.
+    
+    A network error is retried only when the request never reached
+    LabsMobile: a read timeout may arrive after the SMS was sent (and
+    charged), so repeating it could send it twice.
+    """
+    if result.get("network_error") and not result.get("not_sent"):
+        return PERMANENT
+    code = result.get("code")
+    return _classify(result, str(code) if code is not None else None, LABSMOBILE_RETRYABLE_CODES)
+
+
+def classify_sms_bulk_result(result: Dict[str, Any]) -> Optional[str]:
+    """
+    RETRYABLE only when LabsMobile certainly did not take a multi-recipient send.
+    
+    A timeout or a 5xx can arrive after the numbers were queued, and repeating
+    a request for thousands of numbers would send them all twice. Only errors
+    raised before the request reached LabsMobile, an open circuit and an
+    explicit 429 are retried; anything else is a failure for the caller (and
+    its idempotency claims) to handle.
+    """
+    if result.get("success"):
+        return None
+    if result.get("not_sent") or result.get("circuit_open") or result.get("status_code") == 429:
+        return RETRYABLE
+    return PERMANENT
+
+
+class RetryPolicy:
+    """
+    Max-attempts policy with "full jitter" exponential backoff.
+    
+    The delay before attempt n+1 is uniform in [0, min(max_delay, base_delay * 2**(n-1))],
+    which spreads retries of many recipients instead of retrying them in lockstep.
+    """
+    
+    def __init__(self, max_attempts: int, base_delay: float, max_delay: float):
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+    
+    def should_retry(self, attempt: int, classification: Optional[str]) -> bool:
+        """True if a send that failed on `attempt` (1-based) should be tried again."""
+        return classification == RETRYABLE and attempt < self.max_attempts
+    
+    def backoff(self, attempt: int) -> float:
+        """Seconds to wait after a failed `attempt` (1-based)."""
+        ceiling = min(self.max_delay, self.base_delay * (2 ** (attempt - 1)))
+        return random.uniform(0, ceiling)
+
+
+def get_retry_policy() -> RetryPolicy:
+    """Retry policy from settings."""
+    settings = get_settings()
+    return RetryPolicy(
+        max_attempts=settings.retry_max_attempts,
+        base_delay=settings.retry_base_delay,
+        max_delay=settings.retry_max_delay
+    )
+
+
+async def run_with_retry(
+    send: Callable[[], Awaitable[Dict[str, Any]]],
+    classify: Callable[[Dict[str, Any]], Optional[str]],
+    policy: Optional[RetryPolicy] = None
+) -> Dict[str, Any]:
+    """
+    Call `send` until it succeeds, fails permanently or runs out of attempts.
+    
+    An open circuit is returned right away: waiting for it to close would
+    block the caller for the whole recovery timeout.
+    
+    The last result is returned with 'attempts' and 'retryable' added.
+    """
+    policy = policy or get_retry_policy()
+    attempt = 0
+    while True:
+        attempt += 1
+        result = await send()
+        classification = classify(result)
+        if result.get("circuit_open") or not policy.should_retry(attempt, classification):
+            result["attempts"] = attempt
+            result["retryable"] = classification == RETRYABLE
+            return result
+        delay = policy.backoff(attempt)
+        logger.warning(
+            f"Retryable failure (attempt {attempt}/{policy.max_attempts}): "
+            f"{result.get('error')}; retrying in {delay:.2f}s"
+        )
+        await asyncio.sleep(delay)
@@ -0,0 +1,129 @@
+"""Pool of WhatsApp sender phone numbers with per-sender limits and health."""
+import asyncio
+import logging
+import time
+import zlib
+from typing import Dict, List, Optional, Any
+from services.rate_limiter import PriorityRateLimiter, PRIORITY_HIGH
+from services.retry_policy import GRAPH_THROTTLING_CODES
+
+logger = logging.getLogger(__name__)
+
+
+class WhatsAppSender:
+    """
+    One sender phone number id with its own limiter and health state.
+    
+    Bulk and high-priority (single) sends use separate lanes: a share of the
+    rate and a few in-flight slots are reserved for high priority, so single
+    messages are not queued behind a running campaign.
+    """
+
+    def __init__(
+        self,
+        phone_number_id: str,
+        rate_per_second: float,
+        concurrency: int,
+        failure_threshold: int,
+        cooldown_seconds: float,
+        priority_concurrency: int = 2,
+        reserved_share: float = 0.2
+    ):
+        self.phone_number_id = phone_number_id
+        self.limiter = PriorityRateLimiter(rate_per_second, reserved_share, name="whatsapp")
+        self.concurrency = max(1, concurrency)
+        self.semaphore = asyncio.Semaphore(self.concurrency)  # Bulk lane
+        self.priority_semaphore = asyncio.Semaphore(max(1, priority_concurrency))
+        self.failure_threshold = failure_threshold
+        self.cooldown_seconds = cooldown_seconds
+        self.consecutive_failures = 0
+        self.unhealthy_until = 0.0
+        self.sent = 0
+        self.failed = 0
+
+    def is_healthy(self) -> bool:
+        return time.monotonic() >= self.unhealthy_until
+
+    def lane(self, priority: str) -> asyncio.Semaphore:
+        """In-flight slots for a priority."""
+        return self.priority_semaphore if priority == PRIORITY_HIGH else self.semaphore
+
+    def record_result(self, result: Dict[str, Any]) -> None:
+        """Update counters and health from a send result."""
+        if result.get("success"):
+            self.sent += 1
+            self.consecutive_failures = 0
+            return
+        if result.get("circuit_open"):
+            # Rejected locally; the sender itself was never called
+            return
+
+        self.failed += 1
+        if not is_sender_failure(result):
+            # Recipient-level errors (invalid number, template params...) say nothing about the sender
+            return
+
+        self.consecutive_failures += 1
+        if self.consecutive_failures >= self.failure_threshold:
+            self.unhealthy_until = time.monotonic() + self.cooldown_seconds
+            self.consecutive_failures = 0
+            logger.warning(
+                f"Sender {self.phone_number_id} marked unhealthy for {self.cooldown_seconds}s "
+                f"after {self.failure_threshold} consecutive failures"
+            )
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "phone_number_id": self.phone_number_id,
+            "healthy": self.is_healthy(),
+            "sent": self.sent,
+            "failed": self.failed,
+            "rate_per_second": self.limiter.rate,
+            "concurrency": self.concurrency,
+            "limiter_wait_seconds": round(self.limiter.total_wait, 3),
+            "lanes": self.limiter.status()
+        }
+
+
+def is_sender_failure(result: Dict[str, Any]) -> bool:
+    """True for timeouts, connection errors, 5xx and throttling responses."""
+    status_code = result.get("status_code")
+    if status_code is None or status_code >= 500:
+        return True
+    return result.get("error_code") in GRAPH_THROTTLING_CODES
+
+
+class SenderPool:
+    """
+    Spreads recipients across sender phone numbers.
+
+    Assignment is sticky: a recipient always maps to the same sender (by a
+    stable hash of the phone) so the conversation stays on one number. If
+    that sender is cooling down, the next healthy sender in the ring is used.
+    """
+
+    def __init__(self, senders: List[WhatsAppSender]):
+        self.senders = senders
+
+    def __len__(self):
+        return len(self.senders)
+
+    def preferred(self, phone: str) -> Optional[WhatsAppSender]:
+        if not self.senders:
+            return None
+        return self.senders[zlib.crc32(phone.encode()) % len(self.senders)]
+
+    def assign(self, phone: str) -> Optional[WhatsAppSender]:
+        """Sticky sender for a phone, skipping unhealthy senders when possible."""
+        if not self.senders:
+            return None
+        start = zlib.crc32(phone.encode()) % len(self.senders)
+        for offset in range(len(self.senders)):
+            sender = self.senders[(start + offset) % len(self.senders)]
+            if sender.is_healthy():
+                return sender
+        # Every sender is cooling down: keep the sticky choice
+        return self.senders[start]
+
+    def status(self) -> List[Dict[str, Any]]:
+        return [sender.status() for sender in self.senders]
@@ -1,9 +1,16 @@
 """LabsMobile SMS Service for sending text messages."""
+import asyncio
 import base64
 import httpx
 import logging
-from typing import List, Optional
+import time
+from typing import Dict, List, Optional, Tuple
 from config import get_settings
+from services.retry_policy import run_with_retry, classify_sms_result, classify_sms_bulk_result
+from services.circuit_breaker import get_breaker
+from services.rate_limiter import PriorityRateLimiter, PRIORITY_HIGH, PRIORITY_BULK
+from services.metrics import MESSAGES_DISPATCHED, in_flight, observe_upstream, record_completed
+from services.tracing import span
 
 logger = logging.getLogger(__name__)
 settings = get_settings()
@@ -14,10 +21,43 @@ class SMSService:
     
     def __init__(self):
         self.api_url = settings.labsmobile_api_url
+        self.balance_url = settings.labsmobile_balance_url
         self.username = settings.labsmobile_username
         self.token = settings.labsmobile_token
         self.sender = settings.labsmobile_sender
         self.ssl_verify = settings.ssl_verify
+        self.breaker = get_breaker("labsmobile")
+        # Single sends get a reserved share of the request rate, and bulk
+        # requests from every running bulk send share one concurrency pool
+        self.limiter = PriorityRateLimiter(
+            settings.labsmobile_rate_per_second, settings.priority_reserved_share, name="labsmobile"
+        )
+        self.bulk_semaphore = asyncio.Semaphore(max(1, settings.labsmobile_concurrency))
+    
+    async def _request(self, method: str, url: str, timeout: float, **kwargs) -> httpx.Response:
+        """Call LabsMobile and report the outcome to its circuit breaker."""
+        started = time.perf_counter()
+        with span(f"labsmobile {method}", **{"http.method": method, "http.url": url}) as current:
+            try:
+                async with httpx.AsyncClient(timeout=timeout, verify=self.ssl_verify) as client:
+                    response = await client.request(method, url, **kwargs)
+            except Exception:
+                observe_upstream("labsmobile", started)
+                self.breaker.record_failure()
+                raise
+            if current is not None:
+                current.set_attribute("http.status_code", response.status_code)
+        observe_upstream("labsmobile", started, response.status_code)
+        self.breaker.record(response.status_code < 500)
+        return response
+    
+    def _circuit_open_result(self) -> dict:
+        """Failure returned without calling LabsMobile while its circuit is open."""
+        return {
+            "success": False,
+            "error": f"LabsMobile no disponible temporalmente; reintente en {int(self.breaker.retry_after()) + 1} s",
+            "circuit_open": True
+        }
     
     def _get_auth_header(self) -> str:
         """Generate Base64 encoded Basic Auth header."""
@@ -44,6 +84,13 @@ class SMSService:
         # Return as-is if already has country code
         return clean_phone
     
+    def _parse_response(self, response: httpx.Response) -> dict:
+        """Decode a LabsMobile JSON body; gateway errors may answer with HTML."""
+        try:
+            return response.json()
+        except ValueError:
+            return {"code": None, "message": f"HTTP {response.status_code}"}
+    
     def is_configured(self) -> bool:
         """Check if LabsMobile is properly configured."""
         return bool(self.username and self.token and self.sender)
@@ -57,6 +104,11 @@ class SMSService:
         """
         Send a single SMS message.
         
+        Transient errors (failed connections, 5xx, LabsMobile code 30) are
+        retried with jittered exponential backoff. Read timeouts are not: the
+        SMS may already have been sent. Single sends use the
+        high-priority lane, so they are not queued behind bulk sends.
+        
         Args:
             phone: Recipient phone number
             message: Message text (max 160 chars for 1 SMS)
@@ -84,51 +136,73 @@ class SMSService:
         if test_mode:
             payload["test"] = "1"
         
+        result = await run_with_retry(
+            lambda: self._post_single(formatted_phone, payload),
+            classify_sms_result
+        )
+        record_completed("sms", "labsmobile", sent=int(result["success"]), failed=int(not result["success"]))
+        return result
+    
+    async def _post_single(self, formatted_phone: str, payload: dict) -> dict:
+        """Make one LabsMobile send request for a single recipient."""
+        if not self.breaker.allow():
+            return {**self._circuit_open_result(), "phone": formatted_phone}
+        
+        await self.limiter.acquire(PRIORITY_HIGH)
+        MESSAGES_DISPATCHED.labels("sms", "labsmobile").inc()
+        
         headers = {
             "Authorization": self._get_auth_header(),
             "Content-Type": "application/json"
         }
         
         try:
-            async with httpx.AsyncClient(timeout=30.0, verify=self.ssl_verify) as client:
-                logger.info(f"Sending SMS to {formatted_phone}")
-                logger.debug(f"Payload: {payload}")
-                
-                response = await client.post(
+            logger.info(f"Sending SMS to {formatted_phone}")
+            logger.debug(f"Payload: {payload}")
+            
+            with in_flight("sms"):
+                response = await self._request(
+                    "POST",
                     self.api_url,
+                    timeout=30.0,
                     json=payload,
                     headers=headers
                 )
+            
+            logger.info(f"LabsMobile response status: {response.status_code}")
+            logger.debug(f"LabsMobile response: {response.text}")
+            
+            data = self._parse_response(response)
+            
+            # LabsMobile returns code "0" for success
+            if data.get("code") == "0" or data.get("code") == 0:
+                return {
+                    "success": True,
+                    "phone": formatted_phone,
+                    "message_id": data.get("subid"),
+                    "credits_used": data.get("credits"),
+                    "response": data
+                }
+            else:
+                return {
+                    "success": False,
+                    "phone": formatted_phone,
+                    "error": data.get("message", "Error desconocido"),
+                    "code": data.get("code"),
+                    "status_code": response.status_code,
+                    "response": data
+                }
                 
-                logger.info(f"LabsMobile response status: {response.status_code}")
-                logger.debug(f"LabsMobile response: {response.text}")
-                
-                data = response.json()
-                
-                # LabsMobile returns code "0" for success
-                if data.get("code") == "0" or data.get("code") == 0:
-                    return {
-                        "success": True,
-                        "phone": formatted_phone,
-                        "message_id": data.get("subid"),
-                        "credits_used": data.get("credits"),
-                        "response": data
-                    }
-                else:
-                    return {
-                        "success": False,
-                        "phone": formatted_phone,
-                        "error": data.get("message", "Error desconocido"),
-                        "code": data.get("code"),
-                        "response": data
-                    }
-                    
+
         except httpx.HTTPError as e:
             logger.error(f"HTTP error sending SMS: {e}")
             return {
                 "success": False,
                 "phone": formatted_phone,
-                "error": f"Error de conexión: {str(e)}"
+                "error": f"Error de conexión: {str(e)}",
+                "network_error": True,
+                # The connection was never made, so LabsMobile did not get the request
+                "not_sent": isinstance(e, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout))
             }
         except Exception as e:
             logger.error(f"Unexpected error sending SMS: {e}")
@@ -147,13 +221,20 @@ class SMSService:
         """
         Send SMS to multiple recipients.
         
+        Recipients whose final text is the same (the default message or an
+        identical personalized one) share LabsMobile multi-recipient requests
+        of up to labsmobile_max_recipients numbers. The requests run
+        concurrently in the bulk lane, at most labsmobile_concurrency at a
+        time across all bulk sends.
+        
         Args:
             recipients: List of dicts with 'phone', optionally 'name' and 'message' (personalized)
             message: Default message text (used if recipient doesn't have custom message)
             test_mode: If True, simulates sending
         
         Returns:
-            dict with total, sent, failed counts and details
+            dict with total, sent, failed counts and details; 'failed_indexes'
+            lists the positions in `recipients` that were not sent
         """
         if not self.is_configured():
             return {
@@ -164,69 +245,92 @@ class SMSService:
                 "error": "LabsMobile no está configurado"
             }
         
-        # Check if recipients have individual messages (personalized)
-        has_personalized = any(r.get("message") for r in recipients)
+        # Group recipients by the text they will receive
+        groups: Dict[str, List[Tuple[int, str]]] = {}
+        failed_indexes: List[int] = []
+        for index, recipient in enumerate(recipients):
+            phone = recipient.get("phone") or ""
+            if not phone:
+                failed_indexes.append(index)
+                continue
+            # Use personalized message or default
+            text = recipient.get("message") or message
+            groups.setdefault(text, []).append((index, self._format_phone(phone)))
         
-        if has_personalized:
-            # Send individual SMS to each recipient with their personalized message
-            total = len(recipients)
-            sent = 0
-            failed = 0
-            total_credits = 0
-            
-            for recipient in recipients:
-                phone = recipient.get("phone", "")
-                if not phone:
-                    failed += 1
-                    continue
-                
-                # Use personalized message or default
-                msg = recipient.get("message", message)
-                
-                result = await self.send_single(phone, msg, test_mode)
-                if result.get("success"):
-                    sent += 1
-                    # Ensure credits_used is a number, default to 0 if None
-                    credits = result.get("credits_used") or 0
-                    total_credits += credits
-                else:
-                    failed += 1
-            
-            return {
-                "success": sent > 0,
-                "total": total,
-                "sent": sent,
-                "failed": failed,
-                "credits_used": total_credits
-            }
-        
-        # Original bulk send logic (same message to all)
-        # Format all phone numbers
-        formatted_recipients = []
-        for r in recipients:
-            phone = r.get("phone", "")
-            if phone:
-                formatted_recipients.append({
-                    "msisdn": self._format_phone(phone)
-                })
-        
-        if not formatted_recipients:
+        if not groups:
             return {
                 "success": False,
                 "total": len(recipients),
                 "sent": 0,
                 "failed": len(recipients),
-                "error": "No hay números de teléfono válidos"
+                "error": "No hay números de teléfono válidos",
+                "failed_indexes": failed_indexes
             }
         
-        payload = {
-            "message": message,
-            "tpoa": self.sender,
-            "recipient": formatted_recipients
-        }
+        # Split every group into requests of at most the provider maximum
+        max_recipients = max(1, settings.labsmobile_max_recipients)
+        batches = [
+            (text, members[start:start + max_recipients])
+            for text, members in groups.items()
+            for start in range(0, len(members), max_recipients)
+        ]
+        async def send_batch(text: str, members: List[Tuple[int, str]]) -> dict:
+            payload = {
+                "message": text,
+                "tpoa": self.sender,
+                "recipient": [{"msisdn": phone} for _, phone in members]
+            }
+            if test_mode:
+                payload["test"] = "1"
+            async with self.bulk_semaphore:
+                with span("sms.batch", recipients=len(members)):
+                    # One request covers every member: retried only if it was not accepted
+                    return await run_with_retry(
+                        lambda: self._post_bulk(payload, len(members)),
+                        classify_sms_bulk_result
+                    )
         
-        if test_mode:
-            payload["test"] = "1"
+        with span("sms.bulk_send", recipients=len(recipients), requests=len(batches)):
+            outcomes = await asyncio.gather(*(send_batch(text, members) for text, members in batches))
+        
+        sent = 0
+        total_credits = 0.0
+        error = None
+        for (_, members), outcome in zip(batches, outcomes):
+            if outcome["success"]:
+                sent += len(members)
+                # Ensure credits_used is a number, default to 0 if None
+                total_credits += float(outcome.get("credits_used") or 0)
+            else:
+                failed_indexes.extend(index for index, _ in members)
+                error = outcome.get("error")
+        
+        if len(batches) == 1:
+            # Single request: keep LabsMobile's own response details
+            result = outcomes[0]
+        else:
+            result = {"requests": len(batches)}
+            if error:
+                result["error"] = error
+        
+        result.update({
+            "success": sent > 0,
+            "total": len(recipients),
+            "sent": sent,
+            "failed": len(recipients) - sent,
+            "credits_used": total_credits,
+            "failed_indexes": sorted(failed_indexes)
+        })
+        record_completed("sms", "labsmobile", sent=sent, failed=len(recipients) - sent)
+        return result
+    
+    async def _post_bulk(self, payload: dict, count: int) -> dict:
+        """Make one LabsMobile send request for a list of recipients."""
+        if not self.breaker.allow():
+            return {**self._circuit_open_result(), "total": count, "sent": 0, "failed": count}
+        
+        await self.limiter.acquire(PRIORITY_BULK)
+        MESSAGES_DISPATCHED.labels("sms", "labsmobile").inc(count)
         
         headers = {
             "Authorization": self._get_auth_header(),
@@ -234,47 +338,54 @@ class SMSService:
         }
         
         try:
-            async with httpx.AsyncClient(timeout=60.0, verify=self.ssl_verify) as client:
-                logger.info(f"Sending bulk SMS to {len(formatted_recipients)} recipients")
-                
-                response = await client.post(
+            logger.info(f"Sending bulk SMS to {count} recipients")
+            
+            with in_flight("sms", count):
+                response = await self._request(
+                    "POST",
                     self.api_url,
+                    timeout=60.0,
                     json=payload,
                     headers=headers
                 )
+            
+            logger.info(f"LabsMobile bulk response status: {response.status_code}")
+            data = self._parse_response(response)
+            
+            if data.get("code") == "0" or data.get("code") == 0:
+                return {
+                    "success": True,
+                    "total": count,
+                    "sent": count,
+                    "failed": 0,
+                    "message_id": data.get("subid"),
+                    "credits_used": data.get("credits"),
+                    "response": data
+                }
+            else:
+                return {
+                    "success": False,
+                    "total": count,
+                    "sent": 0,
+                    "failed": count,
+                    "error": data.get("message", "Error desconocido"),
+                    "code": data.get("code"),
+                    "status_code": response.status_code,
+                    "response": data
+                }
                 
-                logger.info(f"LabsMobile bulk response status: {response.status_code}")
-                data = response.json()
-                
-                if data.get("code") == "0" or data.get("code") == 0:
-                    return {
-                        "success": True,
-                        "total": len(formatted_recipients),
-                        "sent": len(formatted_recipients),
-                        "failed": 0,
-                        "message_id": data.get("subid"),
-                        "credits_used": data.get("credits"),
-                        "response": data
-                    }
-                else:
-                    return {
-                        "success": False,
-                        "total": len(formatted_recipients),
-                        "sent": 0,
-                        "failed": len(formatted_recipients),
-                        "error": data.get("message", "Error desconocido"),
-                        "code": data.get("code"),
-                        "response": data
-                    }
-                    
+
         except Exception as e:
             logger.error(f"Error in bulk SMS: {e}")
             return {
                 "success": False,
-                "total": len(recipients),
+                "total": count,
                 "sent": 0,
-                "failed": len(recipients),
-                "error": str(e)
+                "failed": count,
+                "error": str(e),
+                "network_error": isinstance(e, httpx.TransportError),
+                # The connection was never made, so LabsMobile did not get the request
+                "not_sent": isinstance(e, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout))
             }
     
     async def get_credits(self) -> dict:
@@ -295,21 +406,26 @@ class SMSService:
             "Content-Type": "application/json"
         }
         
+        if not self.breaker.allow():
+            return self._circuit_open_result()
+        
         try:
             # LabsMobile credit check endpoint
-            async with httpx.AsyncClient(timeout=30.0, verify=self.ssl_verify) as client:
-                response = await client.get(
-                    "https://api.labsmobile.com/json/balance",
-                    headers=headers
-                )
-                
-                data = response.json()
-                return {
-                    "success": True,
-                    "credits": data.get("credits"),
-                    "response": data
-                }
-                
+            response = await self._request(
+                "GET",
+                self.balance_url,
+                timeout=30.0,
+                headers=headers
+            )
+            
+            data = response.json()
+            return {
+                "success": True,
+                "credits": data.get("credits"),
+                "response": data
+            }
+            
+
         except Exception as e:
             logger.error(f"Error getting credits: {e}")
             return {
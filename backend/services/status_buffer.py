@@ -0,0 +1,183 @@
+"""Write-behind buffer for message history: status changes are written in batched transactions."""
+import asyncio
+import logging
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from config import get_settings
+from database import async_session
+from models.message_log import MessageLog
+from services.bulk_db import insert_rows, update_rows
+from services.idempotency_service import complete_batch_recipients
+from services.metrics import STATUS_BUFFER_FLUSHES, STATUS_BUFFER_PENDING
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+ADDRESS_COLUMNS = {"email": "recipient_email", "whatsapp": "recipient_phone"}
+
+
+class StatusBuffer:
+    """
+    Collects message status changes in memory and writes them together.
+    
+    n8n callbacks and single sends used to open a transaction each (one
+    commit per callback or per message); during a large send that is
+    thousands of small write transactions competing for the database.
+    Changes are queued here instead and flushed every flush_interval
+    seconds, or as soon as max_pending changes are waiting, as one
+    transaction with one bulk statement per kind of change. The history
+    reflects a change at most flush_interval seconds later.
+    
+    A repeated change replaces the queued one (the last callback result of a
+    recipient wins, as before). A failed flush puts its changes back, under
+    any newer ones, for the next attempt. While the database is slow or down
+    the queue is capped at max_queued: callers then flush themselves, so
+    they wait for the database (or get its error) instead of growing memory.
+    stop() flushes what is left, so a normal shutdown loses nothing; a crash
+    loses at most one interval.
+    """
+    
+    def __init__(self, flush_interval: float, max_pending: int, max_queued: int):
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.max_queued = max(max_queued, max_pending)
+        # (batch_id, channel, address) -> MessageLog values
+        self._results: Dict[Tuple[str, str, str], Dict[str, Any]] = {}
+        # (batch_id, channel, recipient key) -> (success, error) for the idempotency claim
+        self._claims: Dict[Tuple[str, str, str], Tuple[bool, Optional[str]]] = {}
+        # Complete MessageLog rows (single sends)
+        self._logs: List[Dict[str, Any]] = []
+        self._lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._stopping = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+    
+    @property
+    def pending(self) -> int:
+        return len(self._results) + len(self._claims) + len(self._logs)
+    
+    async def record_result(
+        self,
+        batch_id: str,
+        channel: str,
+        address: str,
+        recipient_key: Optional[str],
+        success: bool,
+        error: Optional[str] = None
+    ) -> None:
+        """Queue the outcome n8n reported for one recipient of a batch."""
+        await self._make_room()
+        self._results[(batch_id, channel, address)] = {
+            "batch_id": batch_id,
+            ADDRESS_COLUMNS[channel]: address,
+            "status": "sent" if success else "failed",
+            "error_message": error
+        }
+        if recipient_key:
+            self._claims[(batch_id, channel, recipient_key)] = (success, error)
+        self._queued()
+    
+    async def add_log(self, row: Dict[str, Any]) -> None:
+        """Queue a finished message for the history (MessageLog column values)."""
+        await self._make_room()
+        self._logs.append(row)
+        self._queued()
+    
+    async def _make_room(self) -> None:
+        # Backpressure: past the cap the caller writes the queue itself (and
+        # fails with the database error) instead of queueing more
+        if self.pending >= self.max_queued:
+            await self.flush()
+    
+    def _queued(self) -> None:
+        STATUS_BUFFER_PENDING.set(self.pending)
+        if self.pending >= self.max_pending:
+            self._wakeup.set()
+    
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._stopping = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+    
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._stopping.set()
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        # Whatever was queued after the loop's last flush
+        try:
+            await self.flush()
+        except Exception:
+            logger.error(f"Status buffer: {self.pending} changes could not be saved at shutdown")
+    
+    async def _run(self) -> None:
+        logger.info(f"Status buffer started (every {self.flush_interval}s or {self.max_pending} changes)")
+        while not self._stopping.is_set():
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Status buffer flush failed, {self.pending} changes kept: {e}", exc_info=True)
+                # Do not retry in a tight loop while the database is unavailable
+                try:
+                    await asyncio.wait_for(self._stopping.wait(), timeout=self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+    
+    async def flush(self) -> int:
+        """Write every queued change in one transaction; returns the number of changes written."""
+        async with self._lock:
+            results, self._results = self._results, {}
+            claims, self._claims = self._claims, {}
+            logs, self._logs = self._logs, []
+            count = len(results) + len(claims) + len(logs)
+            if not count:
+                return 0
+            
+            started = time.perf_counter()
+            try:
+                async with async_session() as db:
+                    # One insert per set of columns: single sends of each channel fill different ones
+                    by_columns: Dict[Tuple[str, ...], List[Dict[str, Any]]] = {}
+                    for row in logs:
+                        by_columns.setdefault(tuple(sorted(row)), []).append(row)
+                    for rows in by_columns.values():
+                        await insert_rows(db, MessageLog, rows)
+                    for channel, column in ADDRESS_COLUMNS.items():
+                        await update_rows(
+                            db, MessageLog,
+                            [row for (_, row_channel, _), row in results.items() if row_channel == channel],
+                            match=["batch_id", column]
+                        )
+                        await complete_batch_recipients(db, channel, [
+                            (batch_id, key, success, error)
+                            for (batch_id, claim_channel, key), (success, error) in claims.items()
+                            if claim_channel == channel
+                        ])
+                    await db.commit()
+            except Exception:
+                # Keep the changes for the next flush; newer changes to the same rows win
+                self._results = {**results, **self._results}
+                self._claims = {**claims, **self._claims}
+                self._logs = logs + self._logs
+                STATUS_BUFFER_FLUSHES.labels("error").inc()
+                raise
+            finally:
+                STATUS_BUFFER_PENDING.set(self.pending)
+        
+        STATUS_BUFFER_FLUSHES.labels("ok").inc()
+        logger.debug(f"Status buffer: {count} changes written in {(time.perf_counter() - started) * 1000:.0f} ms")
+        return count
+
+
+# Singleton instance
+status_buffer = StatusBuffer(
+    flush_interval=settings.status_flush_interval,
+    max_pending=settings.status_flush_max_pending,
+    max_queued=settings.status_buffer_max_queued
+)
@@ -0,0 +1,151 @@
+"""In-memory TTL cache for WhatsApp template metadata."""
+import time
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+
+class CompiledTemplate:
+    """
+    WhatsApp template metadata parsed once and reused by every send.
+
+    Holds the raw Graph API template, its parsed structure and the values a
+    send needs: body variable names in order and the media header type.
+    """
+
+    def __init__(
+        self,
+        raw: Dict[str, Any],
+        parsed: Dict[str, Any],
+        body_variables: List[str],
+        header_format: Optional[str]
+    ):
+        self.raw = raw
+        self.parsed = parsed
+        self.name = raw.get("name")
+        self.language = raw.get("language")
+        self.status = raw.get("status")
+        self.body_variables = body_variables
+        self.header_format = header_format  # image, video or document; None for text headers
+
+    def __repr__(self):
+        return f"<CompiledTemplate(name='{self.name}', language='{self.language}')>"
+
+
+class TTLCache:
+    """
+    Small TTL cache with negative caching.
+
+    A value of None is stored as a negative entry ("known not to exist") and
+    expires after negative_ttl seconds instead of ttl.
+    """
+
+    def __init__(self, ttl: float, negative_ttl: float):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._entries: Dict[Hashable, Tuple[float, Any]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Tuple[bool, Any]:
+        """Return (found, value). A negative entry is found with value None."""
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at > time.monotonic():
+                self.hits += 1
+                return True, value
+            del self._entries[key]
+        self.misses += 1
+        return False, None
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """Store a value; None is cached for negative_ttl seconds."""
+        ttl = self.negative_ttl if value is None else self.ttl
+        if ttl > 0:
+            self._entries[key] = (time.monotonic() + ttl, value)
+
+    def invalidate(self, predicate: Optional[Callable[[Hashable], bool]] = None) -> int:
+        """Drop every entry, or only those whose key matches the predicate."""
+        if predicate is None:
+            count = len(self._entries)
+            self._entries.clear()
+            return count
+        keys = [key for key in self._entries if predicate(key)]
+        for key in keys:
+            del self._entries[key]
+        return len(keys)
+
+    def stats(self) -> Dict[str, int]:
+        """Return entry count and hit/miss counters."""
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+class TemplateCatalog:
+    """
+    Complete local copy of the account's templates with a name index.
+
+    Lookups by name (and language) are dictionary reads. The catalog is
+    replaced as a whole after each sync, so readers never see a partial page set.
+    """
+
+    def __init__(self):
+        self.by_name: Dict[str, Dict[str, CompiledTemplate]] = {}
+        self.by_id: Dict[str, CompiledTemplate] = {}
+        self.synced_at: Optional[float] = None  # time.monotonic() of the last full sync
+        self.synced_at_epoch: Optional[float] = None
+
+    @property
+    def loaded(self) -> bool:
+        return self.synced_at is not None
+
+    def is_stale(self, max_age: float) -> bool:
+        """True if never synced or older than max_age seconds."""
+        return self.synced_at is None or time.monotonic() - self.synced_at >= max_age
+
+    def replace(self, templates: List[CompiledTemplate]) -> None:
+        """Swap in a freshly synced set of templates."""
+        by_name: Dict[str, Dict[str, CompiledTemplate]] = {}
+        by_id: Dict[str, CompiledTemplate] = {}
+        for template in templates:
+            by_name.setdefault(template.name, {})[template.language] = template
+            if template.raw.get("id"):
+                by_id[template.raw["id"]] = template
+        self.by_name = by_name
+        self.by_id = by_id
+        self.synced_at = time.monotonic()
+        self.synced_at_epoch = time.time()
+
+    def upsert(self, template: CompiledTemplate) -> None:
+        """Add or update a single template without a full sync."""
+        self.by_name.setdefault(template.name, {})[template.language] = template
+        if template.raw.get("id"):
+            self.by_id[template.raw["id"]] = template
+
+    def remove(self, name: str) -> None:
+        """Forget every language of a template."""
+        for template in self.by_name.pop(name, {}).values():
+            self.by_id.pop(template.raw.get("id"), None)
+
+    def clear(self) -> None:
+        self.by_name = {}
+        self.by_id = {}
+        self.synced_at = None
+        self.synced_at_epoch = None
+
+    def lookup(self, name: str, language: Optional[str] = None) -> Optional[CompiledTemplate]:
+        """Get a template by name, preferring the given language."""
+        languages = self.by_name.get(name)
+        if not languages:
+            return None
+        if language and language in languages:
+            return languages[language]
+        return next(iter(languages.values()))
+
+    def list(self, status: Optional[str] = None) -> List[CompiledTemplate]:
+        """All templates, optionally filtered by status, ordered by name."""
+        templates = [t for languages in self.by_name.values() for t in languages.values()]
+        if status:
+            templates = [t for t in templates if t.status == status]
+        return sorted(templates, key=lambda t: (t.name or "", t.language or ""))
+
+    def __len__(self):
+        return sum(len(languages) for languages in self.by_name.values())
@@ -0,0 +1,181 @@
+"""
+Optional OpenTelemetry tracing for the bulk send lifecycle.
+
+Spans are created through the OpenTelemetry API when it is installed and
+exported only when TRACING_EXPORTER is set (console, file or otlp) and the
+SDK is available. Without the packages, or with tracing off, every helper
+here is a no-op.
+
+The trace context travels to n8n as a 'traceparent' field of the webhook
+payload; n8n echoes it in /messages/callback so the callback span joins the
+trace of the send.
+"""
+import logging
+import os
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+from config import get_settings
+
+logger = logging.getLogger(__name__)
+
+try:
+    from opentelemetry import propagate, trace
+except ImportError:  # Tracing is optional
+    propagate = None
+    trace = None
+
+_tracer = trace.get_tracer("masivos") if trace else None
+_provider = None
+
+
+def _attributes(attributes: Dict[str, Any]) -> Dict[str, Any]:
+    return {key: value for key, value in attributes.items() if value is not None}
+
+
+@contextmanager
+def span(name: str, **attributes) -> Iterator[Optional[Any]]:
+    """Run the block inside a child span of the current one; yields the span (None without OpenTelemetry)."""
+    if _tracer is None:
+        yield None
+        return
+    with _tracer.start_as_current_span(name, attributes=_attributes(attributes)) as current:
+        yield current
+
+
+@contextmanager
+def span_from(carrier: Dict[str, str], name: str, **attributes) -> Iterator[Optional[Any]]:
+    """Like span(), but parented to the context in `carrier` (e.g. {'traceparent': ...}) when it has one."""
+    if _tracer is None:
+        yield None
+        return
+    context = propagate.extract(carrier) if carrier else None
+    with _tracer.start_as_current_span(name, context=context, attributes=_attributes(attributes)) as current:
+        yield current
+
+
+def inject_context() -> Dict[str, str]:
+    """The current trace context as W3C headers ('traceparent', 'tracestate'); empty when not tracing."""
+    carrier: Dict[str, str] = {}
+    if propagate is not None and _provider is not None:
+        propagate.inject(carrier)
+    return carrier
+
+
+def _build_exporter(name: str, settings):
+    from opentelemetry.sdk.trace.export import ConsoleSpanExporter
+
+    if name == "console":
+        return ConsoleSpanExporter()
+    if name == "file":
+        # One JSON span per line, appended to tracing_file
+        stream = open(settings.tracing_file, "a", encoding="utf-8")
+        return ConsoleSpanExporter(out=stream, formatter=lambda s: s.to_json(indent=None) + os.linesep)
+    if name == "otlp":
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        return OTLPSpanExporter(endpoint=settings.tracing_otlp_endpoint)
+    raise ValueError(f"unknown exporter '{name}'")
+
+
+def setup_tracing(app=None) -> bool:
+    """
+    Configure the tracer provider and exporter from the settings.
+
+    Also traces every DB statement and, when given the FastAPI app, every
+    request (natively in recent FastAPI versions, with
+    opentelemetry-instrumentation-fastapi if installed, or a minimal
+    middleware otherwise). Returns True if tracing is on.
+    """
+    global _provider
+    settings = get_settings()
+    exporter_name = settings.tracing_exporter.strip().lower()
+    if not exporter_name or _provider is not None:
+        return _provider is not None
+    if trace is None:
+        logger.warning("TRACING_EXPORTER is set but opentelemetry-api is not installed; tracing disabled")
+        return False
+
+    try:
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+        from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+        exporter = _build_exporter(exporter_name, settings)
+    except (ImportError, ValueError) as e:
+        logger.warning(f"Tracing disabled: {e}")
+        return False
+
+    provider = TracerProvider(
+        resource=Resource.create({"service.name": settings.tracing_service_name}),
+        sampler=ParentBased(TraceIdRatioBased(settings.tracing_sample_ratio))
+    )
+    provider.add_span_processor(BatchSpanProcessor(exporter))
+    trace.set_tracer_provider(provider)
+    _provider = provider
+
+    from database import engines
+    for engine in engines:
+        _instrument_engine(engine.sync_engine)
+    if app is not None:
+        _instrument_app(app)
+    logger.info(f"Tracing enabled ({exporter_name} exporter)")
+    return True
+
+
+def shutdown_tracing() -> None:
+    """Flush pending spans."""
+    if _provider is not None:
+        _provider.shutdown()
+
+
+def _instrument_app(app) -> None:
+    try:
+        # Recent FastAPI versions trace requests themselves once a provider is set
+        import fastapi.telemetry  # noqa: F401
+        return
+    except ImportError:
+        pass
+    try:
+        from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
+        FastAPIInstrumentor.instrument_app(app)
+        return
+    except ImportError:
+        pass
+
+    @app.middleware("http")
+    async def trace_requests(request, call_next):
+        with span_from(
+            dict(request.headers), f"{request.method} {request.url.path}",
+            **{"http.method": request.method, "http.target": request.url.path}
+        ) as current:
+            response = await call_next(request)
+            current.set_attribute("http.status_code", response.status_code)
+            return response
+
+
+def _instrument_engine(engine) -> None:
+    """One span per SQL statement, child of the span that ran it."""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "SQL"
+        current = _tracer.start_span(
+            f"db {operation}",
+            attributes={"db.system": engine.dialect.name, "db.statement": statement[:1000]}
+        )
+        conn.info.setdefault("trace_spans", []).append(current)
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        spans = conn.info.get("trace_spans")
+        if spans:
+            spans.pop().end()
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(context):
+        spans = context.connection.info.get("trace_spans") if context.connection is not None else None
+        if spans:
+            current = spans.pop()
+            current.record_exception(context.original_exception)
+            current.set_status(trace.Status(trace.StatusCode.ERROR))
+            current.end()
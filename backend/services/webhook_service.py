@@ -4,7 +4,11 @@ import base64
 import os
 from typing import Optional, List, Dict, Any
 import mimetypes
+import time
 from config import get_settings
+from services.circuit_breaker import get_breaker
+from services.metrics import MESSAGES_DISPATCHED, in_flight, observe_upstream
+from services.tracing import inject_context, span
 
 settings = get_settings()
 
@@ -15,8 +19,49 @@ class WebhookService:
     def __init__(self):
         self.whatsapp_url = settings.webhook_whatsapp
         self.email_url = settings.webhook_email
-        self.timeout = 600.0  # 10 minutes timeout for bulk operations
+        # 10 minutes for n8n to process a bulk call, but fail fast if it is unreachable
+        self.timeout = httpx.Timeout(600.0, connect=10.0)
         self.ssl_verify = settings.ssl_verify
+        self.breaker = get_breaker("n8n")
+    
+    def _circuit_open_result(self, recipients: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Failure returned without calling n8n while its circuit is open."""
+        return {
+            "success": False,
+            "error": f"n8n webhook unavailable (circuit open, retry in {int(self.breaker.retry_after()) + 1}s)",
+            "sent": 0,
+            "failed": len(recipients),
+            "results": [],
+            "circuit_open": True
+        }
+    
+    async def _post(self, url: str, payload: Dict[str, Any]) -> httpx.Response:
+        """
+        POST to n8n and report the outcome to the circuit breaker.
+        
+        The trace context is added to the payload ('traceparent') for n8n
+        to echo back in /messages/callback.
+        """
+        channel = payload["channel"]
+        count = len(payload["recipients"])
+        MESSAGES_DISPATCHED.labels(channel, "n8n").inc(count)
+        started = time.perf_counter()
+        with span("n8n POST", channel=channel, batch_id=payload.get("batch_id"), recipients=count) as current:
+            payload.update(inject_context())
+            try:
+                with in_flight(channel, count):
+                    async with httpx.AsyncClient(timeout=self.timeout, verify=self.ssl_verify) as client:
+                        response = await client.post(url, json=payload)
+            except Exception:
+                observe_upstream("n8n", started)
+                self.breaker.record_failure()
+                raise
+            if current is not None:
+                current.set_attribute("http.status_code", response.status_code)
+        observe_upstream("n8n", started, response.status_code)
+        # 4xx means n8n answered: a bad request, not an outage
+        self.breaker.record(response.status_code < 500)
+        return response
     
     async def send_bulk_whatsapp(
         self,
@@ -46,21 +91,23 @@ class WebhookService:
             "total_recipients": len(recipients)
         }
         
+        if not self.breaker.allow():
+            return self._circuit_open_result(recipients)
+        
         try:
-            async with httpx.AsyncClient(timeout=self.timeout, verify=self.ssl_verify) as client:
-                response = await client.post(self.whatsapp_url, json=payload)
-                response.raise_for_status()
-                
-                # Parse response from n8n
-                data = response.json() if response.text else {}
-                
-                return {
-                    "success": data.get("success", True),
-                    "sent": data.get("sent", len(recipients)),
-                    "failed": data.get("failed", 0),
-                    "results": data.get("results", []),
-                    "error": data.get("error")
-                }
+            response = await self._post(self.whatsapp_url, payload)
+            response.raise_for_status()
+            
+            # Parse response from n8n
+            data = response.json() if response.text else {}
+            
+            return {
+                "success": data.get("success", True),
+                "sent": data.get("sent", len(recipients)),
+                "failed": data.get("failed", 0),
+                "results": data.get("results", []),
+                "error": data.get("error")
+            }
         except httpx.TimeoutException:
             return {
                 "success": False, 
@@ -116,21 +163,23 @@ class WebhookService:
             "total_recipients": len(recipients)
         }
         
+        if not self.breaker.allow():
+            return self._circuit_open_result(recipients)
+        
         try:
-            async with httpx.AsyncClient(timeout=self.timeout, verify=self.ssl_verify) as client:
-                response = await client.post(self.email_url, json=payload)
-                response.raise_for_status()
-                
-                # Parse response from n8n
-                data = response.json() if response.text else {}
-                
-                return {
-                    "success": data.get("success", True),
-                    "sent": data.get("sent", len(recipients)),
-                    "failed": data.get("failed", 0),
-                    "results": data.get("results", []),
-                    "error": data.get("error")
-                }
+            response = await self._post(self.email_url, payload)
+            response.raise_for_status()
+            
+            # Parse response from n8n
+            data = response.json() if response.text else {}
+            
+            return {
+                "success": data.get("success", True),
+                "sent": data.get("sent", len(recipients)),
+                "failed": data.get("failed", 0),
+                "results": data.get("results", []),
+                "error": data.get("error")
+            }
         except httpx.TimeoutException:
             return {
                 "success": False, 
@@ -1,25 +1,118 @@
 """WhatsApp Business API service for templates and direct messaging."""
+import asyncio
 import httpx
 import re
 import logging
-from typing import List, Optional, Dict, Any
+import time
+from typing import List, Optional, Dict, Any, Tuple
 from urllib.parse import quote
 from config import get_settings
+from services.template_cache import TTLCache, CompiledTemplate, TemplateCatalog
+from services.sender_pool import SenderPool, WhatsAppSender
+from services.rate_limiter import PRIORITY_BULK
+from services.retry_policy import classify_whatsapp_result, get_retry_policy
+from services.circuit_breaker import CLOSED, get_breaker
+from services.metrics import MESSAGES_DISPATCHED, QUEUE_DEPTH, in_flight, observe_upstream, record_cache, record_completed
+from services.tracing import span
 
 logger = logging.getLogger(__name__)
 
 
+class TemplateSendPlan:
+    """
+    Reusable skeleton of a template send, compiled once per campaign.
+    
+    Holds the prebuilt header component and the ordered (variable, field)
+    pairs of the body, so a recipient only contributes its parameter values.
+    """
+    
+    def __init__(
+        self,
+        template_name: str,
+        language_code: str,
+        header_component: Optional[Dict[str, Any]],
+        body_fields: List[Tuple[str, str]]
+    ):
+        self.template_name = template_name
+        self.language_code = language_code
+        self.header_component = header_component  # Shared by every recipient, never mutated
+        self.body_fields = body_fields
+    
+    def build_components(self, recipient: Dict[str, Any]) -> Optional[List[Dict[str, Any]]]:
+        """Fill the skeleton with one recipient's values."""
+        components = [self.header_component] if self.header_component else []
+        
+        if self.body_fields:
+            body_params = []
+            for var_name, field_name in self.body_fields:
+                value = recipient.get(field_name)
+                if value is None:
+                    continue
+                text = str(value).strip()
+                # Skip empty values; the API rejects blank parameters
+                if text:
+                    body_params.append({
+                        "type": "text",
+                        "parameter_name": var_name,
+                        "text": text
+                    })
+            if body_params:
+                components.append({
+                    "type": "body",
+                    "parameters": body_params
+                })
+        
+        return components or None
+
+
 class WhatsAppService:
     """Service to interact with WhatsApp Business API."""
     
-    BASE_URL = "https://graph.facebook.com/v18.0"
+    CATALOG_PAGE_SIZE = 100
+    # Seconds between checks while a bulk send waits for the Graph circuit
+    CIRCUIT_POLL_INTERVAL = 1.0
     
     def __init__(self):
         self.settings = get_settings()
+        self.base_url = self.settings.whatsapp_api_base_url.rstrip("/")
         self.access_token = self.settings.whatsapp_access_token
         self.business_account_id = self.settings.whatsapp_business_account_id
         self.phone_number_id = self.settings.whatsapp_phone_number_id
+        self.sender_pool = self._build_sender_pool()
+        self.breaker = get_breaker("graph")
+        if not self.phone_number_id and len(self.sender_pool):
+            self.phone_number_id = self.sender_pool.senders[0].phone_number_id
         self.ssl_verify = self.settings.ssl_verify
+        # Complete template catalog, refreshed every whatsapp_template_cache_ttl seconds
+        self.catalog = TemplateCatalog()
+        self._sync_task: Optional[asyncio.Task] = None
+        # monotonic time of the last failed sync, for the retry cool-down
+        self._sync_failed_at: Optional[float] = None
+        # monotonic time after which bulk sends stop waiting for the open Graph circuit
+        self._circuit_wait_deadline: Optional[float] = None
+        # Negative entries for names not found, keyed by ('template', name)
+        self.template_cache = TTLCache(
+            ttl=self.settings.whatsapp_template_cache_ttl,
+            negative_ttl=self.settings.whatsapp_template_negative_cache_ttl
+        )
+    
+    def _build_sender_pool(self) -> SenderPool:
+        """Create one sender per configured phone number id."""
+        ids = [i.strip() for i in self.settings.whatsapp_phone_number_ids.split(",") if i.strip()]
+        if not ids and self.settings.whatsapp_phone_number_id:
+            ids = [self.settings.whatsapp_phone_number_id]
+        return SenderPool([
+            WhatsAppSender(
+                phone_number_id=phone_number_id,
+                rate_per_second=self.settings.whatsapp_sender_rate_per_second,
+                concurrency=self.settings.whatsapp_sender_concurrency,
+                failure_threshold=self.settings.whatsapp_sender_failure_threshold,
+                cooldown_seconds=self.settings.whatsapp_sender_cooldown_seconds,
+                priority_concurrency=self.settings.whatsapp_priority_concurrency,
+                reserved_share=self.settings.priority_reserved_share
+            )
+            for phone_number_id in dict.fromkeys(ids)
+        ])
     
     def _get_headers(self) -> Dict[str, str]:
         """Get authorization headers for API requests."""
@@ -28,6 +121,27 @@ class WhatsAppService:
             "Content-Type": "application/json"
         }
     
+    async def _graph_request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        """Call the Graph API and report the outcome to its circuit breaker."""
+        started = time.perf_counter()
+        with span(f"graph {method}", **{"http.method": method, "http.url": url}) as current:
+            try:
+                async with httpx.AsyncClient(timeout=30.0, verify=self.ssl_verify) as client:
+                    response = await client.request(method, url, headers=self._get_headers(), **kwargs)
+            except Exception:
+                observe_upstream("graph", started)
+                self.breaker.record_failure()
+                raise
+            if current is not None:
+                current.set_attribute("http.status_code", response.status_code)
+        observe_upstream("graph", started, response.status_code)
+        # Only server errors count as an outage; 4xx are per-request problems
+        self.breaker.record(response.status_code < 500)
+        return response
+    
+    def _circuit_open_error(self) -> str:
+        return f"WhatsApp API unavailable (circuit open, retry in {int(self.breaker.retry_after()) + 1}s)"
+    
     def _format_phone_number(self, phone: str) -> str:
         """
         Format phone number for WhatsApp API.
@@ -49,18 +163,141 @@ class WhatsAppService:
     async def get_templates(
         self,
         status: Optional[str] = None,
-        limit: int = 100
+        limit: int = 100,
+        use_cache: bool = True
     ) -> Dict[str, Any]:
         """
-        Fetch message templates from WhatsApp Business API.
+        Get message templates from the local catalog of the WhatsApp Business account.
+        
+        The catalog holds every template (all cursor pages) and is refreshed in
+        the background once it is older than whatsapp_template_cache_ttl seconds.
         
         Args:
             status: Filter by template status (APPROVED, PENDING, REJECTED)
-            limit: Maximum number of templates to fetch
+            limit: Maximum number of templates to return
+            use_cache: If False, sync the catalog from the API before answering
             
         Returns:
-            Dictionary containing templates data and paging info
+            Dictionary containing templates data and sync info
+        """
+        if use_cache:
+            sync_result = await self.ensure_catalog()
+        else:
+            sync_result = await self.sync_templates()
+        
+        if not self.catalog.loaded:
+            return {
+                "success": False,
+                "error": sync_result.get("error", "Template catalog not available"),
+                "data": []
+            }
+        
+        templates = [t.raw for t in self.catalog.list(status)]
+        return {
+            "success": True,
+            "data": templates[:limit],
+            "paging": {},
+            "total": len(templates),
+            "synced_at": self.catalog.synced_at_epoch
+        }
+    
+    async def ensure_catalog(self) -> Dict[str, Any]:
         """
+        Make sure the template catalog is usable.
+        
+        Waits for the first sync; afterwards a stale catalog keeps serving
+        lookups while a refresh runs in the background. After a failed sync,
+        lookups do not start another one for whatsapp_template_negative_cache_ttl
+        seconds, so an API outage does not turn every send into a full
+        cursor walk.
+        """
+        if not self.catalog.loaded:
+            if self._sync_failed_at is not None:
+                retry_in = self._sync_failed_at + self.settings.whatsapp_template_negative_cache_ttl - time.monotonic()
+                if retry_in > 0:
+                    return {
+                        "success": False,
+                        "error": f"Template catalog sync failed recently, next attempt in {retry_in:.0f}s"
+                    }
+            return await self.sync_templates()
+        if self.catalog.is_stale(self.settings.whatsapp_template_cache_ttl):
+            self.start_template_sync()
+        return {"success": True, "count": len(self.catalog)}
+    
+    async def sync_templates(self) -> Dict[str, Any]:
+        """
+        Download every template page and rebuild the name index.
+        
+        Concurrent callers share one in-flight sync instead of each walking
+        the cursor pages.
+        """
+        return await asyncio.shield(self.start_template_sync())
+    
+    def start_template_sync(self) -> "asyncio.Task":
+        """Start a catalog sync in the background unless one is running."""
+        if self._sync_task is None or self._sync_task.done():
+            self._sync_task = asyncio.create_task(self._sync_catalog())
+        return self._sync_task
+    
+    async def _sync_catalog(self) -> Dict[str, Any]:
+        """Walk all cursor pages and swap in the new catalog."""
+        result = await self._walk_catalog()
+        self._sync_failed_at = None if result["success"] else time.monotonic()
+        return result
+    
+    async def _walk_catalog(self) -> Dict[str, Any]:
+        """Download every page and replace the catalog; failures leave it untouched."""
+        try:
+            templates: List[Dict[str, Any]] = []
+            after = None
+            pages = 0
+            
+            # Graph cursors are opaque, so pages must be requested in sequence
+            while True:
+                result = await self._fetch_templates(limit=self.CATALOG_PAGE_SIZE, after=after)
+                if not result["success"]:
+                    logger.error(f"Template catalog sync failed on page {pages + 1}: {result.get('error')}")
+                    return result
+                
+                templates.extend(result["data"])
+                pages += 1
+                
+                paging = result.get("paging", {})
+                after = paging.get("cursors", {}).get("after")
+                if not paging.get("next") or not after:
+                    break
+            
+            # Reuse compiled templates whose definition did not change
+            compiled = []
+            reused = 0
+            for template in templates:
+                previous = self.catalog.by_id.get(template.get("id"))
+                if previous is not None and previous.raw == template:
+                    compiled.append(previous)
+                    reused += 1
+                else:
+                    compiled.append(self.compile_template(template))
+            
+            self.catalog.replace(compiled)
+            self.template_cache.invalidate()
+            logger.info(
+                f"Template catalog synced: {len(templates)} templates in {pages} pages "
+                f"({len(templates) - reused} new or changed)"
+            )
+            return {"success": True, "count": len(templates), "pages": pages}
+            
+        except Exception as e:
+            logger.error(f"Template catalog sync failed: {e}", exc_info=True)
+            return {"success": False, "error": str(e)}
+    
+    async def _fetch_templates(
+        self,
+        status: Optional[str] = None,
+        limit: int = 100,
+        name: Optional[str] = None,
+        after: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Query one page of the message_templates endpoint."""
         if not self.access_token or not self.business_account_id:
             return {
                 "success": False,
@@ -68,7 +305,7 @@ class WhatsAppService:
                 "data": []
             }
         
-        url = f"{self.BASE_URL}/{self.business_account_id}/message_templates"
+        url = f"{self.base_url}/{self.business_account_id}/message_templates"
         params = {
             "limit": limit,
             "fields": "name,status,category,language,components,id"
@@ -77,30 +314,44 @@ class WhatsAppService:
         if status:
             params["status"] = status
         
+        if name:
+            params["name"] = name
+        
+        if after:
+            params["after"] = after
+        
+        if not self.breaker.allow():
+            return {
+                "success": False,
+                "error": self._circuit_open_error(),
+                "circuit_open": True,
+                "data": []
+            }
+        
         try:
-            async with httpx.AsyncClient(timeout=30.0, verify=self.ssl_verify) as client:
-                response = await client.get(
-                    url,
-                    headers=self._get_headers(),
-                    params=params
-                )
+            response = await self._graph_request("GET", url, params=params)
+            
+            if response.status_code == 200:
+                data = response.json()
+                return {
+                    "success": True,
+                    "data": data.get("data", []),
+                    "paging": data.get("paging", {})
+                }
+            else:
+                # Gateways and proxies answer errors with HTML or an empty body
+                try:
+                    error = response.json().get("error", {})
+                except ValueError:
+                    error = {"message": f"HTTP {response.status_code}: {response.text[:200]}"}
+                return {
+                    "success": False,
+                    "error": error.get("message", "Unknown error"),
+                    "error_code": error.get("code"),
+                    "data": []
+                }
                 
-                if response.status_code == 200:
-                    data = response.json()
-                    return {
-                        "success": True,
-                        "data": data.get("data", []),
-                        "paging": data.get("paging", {})
-                    }
-                else:
-                    error_data = response.json()
-                    return {
-                        "success": False,
-                        "error": error_data.get("error", {}).get("message", "Unknown error"),
-                        "error_code": error_data.get("error", {}).get("code"),
-                        "data": []
-                    }
-                    
+
         except httpx.TimeoutException:
             return {
                 "success": False,
@@ -114,31 +365,110 @@ class WhatsAppService:
                 "data": []
             }
     
-    async def get_template_by_name(self, template_name: str) -> Optional[Dict[str, Any]]:
+    async def get_template_by_name(
+        self,
+        template_name: str,
+        language_code: Optional[str] = None
+    ) -> Optional[Dict[str, Any]]:
         """
         Get a specific template by name.
         
         Args:
             template_name: Name of the template to fetch
+            language_code: Preferred language; any language matches if not available
             
         Returns:
             Template data if found, None otherwise
         """
-        result = await self.get_templates()
+        compiled = await self.get_compiled_template(template_name, language_code)
+        return compiled.raw if compiled else None
+    
+    async def get_compiled_template(
+        self,
+        template_name: str,
+        language_code: Optional[str] = None
+    ) -> Optional[CompiledTemplate]:
+        """
+        Get a template with its parsed components from the local catalog.
         
-        if result["success"]:
-            for template in result["data"]:
-                if template.get("name") == template_name:
-                    return template
+        Names missing from the catalog (e.g. created after the last sync) are
+        fetched individually and added to it; names that do not exist are
+        cached negatively. API errors are not cached.
+        """
+        await self.ensure_catalog()
+        compiled = self.catalog.lookup(template_name, language_code)
+        record_cache("templates", compiled is not None)
+        if compiled:
+            return compiled
+        
+        cache_key = ("template", template_name)
+        found, _ = self.template_cache.get(cache_key)
+        if found:
+            return None
+        
+        result = await self._fetch_templates(name=template_name)
+        if not result["success"]:
+            logger.error(f"Could not fetch template '{template_name}': {result.get('error')}")
+            return None
+        
+        for template in result["data"]:
+            if template.get("name") == template_name:
+                self.catalog.upsert(self.compile_template(template))
+        
+        compiled = self.catalog.lookup(template_name, language_code)
+        if compiled is None:
+            self.template_cache.set(cache_key, None)
+        return compiled
+    
+    def compile_template(self, template: Dict[str, Any]) -> CompiledTemplate:
+        """Precompute what a send needs from a raw template."""
+        body_variables: List[str] = []
+        header_format = None
+        for comp in template.get("components", []):
+            comp_type = comp.get("type", "").upper()
+            if comp_type == "BODY":
+                body_variables = self._extract_variable_names(comp.get("text", ""))
+            elif comp_type == "HEADER":
+                # Check header format for media types
+                fmt = comp.get("format", "TEXT")
+                if fmt in ["IMAGE", "VIDEO", "DOCUMENT"]:
+                    header_format = fmt.lower()
+        
+        return CompiledTemplate(
+            raw=template,
+            parsed=self.parse_template_components(template),
+            body_variables=body_variables,
+            header_format=header_format
+        )
+    
+    def invalidate_templates(self, template_name: Optional[str] = None) -> int:
+        """
+        Drop cached template metadata.
+        
+        Args:
+            template_name: Only drop this template; the whole catalog if None
+            
+        Returns:
+            Number of templates removed from the catalog
+        """
+        if template_name is None:
+            count = len(self.catalog)
+            self.catalog.clear()
+            self.template_cache.invalidate()
+            return count
         
-        return None
+        count = len(self.catalog.by_name.get(template_name, {}))
+        self.catalog.remove(template_name)
+        self.template_cache.invalidate(lambda key: key[1] == template_name)
+        return count
     
     async def send_template_message(
         self,
         to_phone: str,
         template_name: str,
         language_code: str = "es_CO",
-        components: Optional[List[Dict[str, Any]]] = None
+        components: Optional[List[Dict[str, Any]]] = None,
+        phone_number_id: Optional[str] = None
     ) -> Dict[str, Any]:
         """
         Send a template message to a WhatsApp number.
@@ -148,23 +478,22 @@ class WhatsAppService:
             template_name: Name of the approved template to send
             language_code: Language code of the template (e.g., 'es_CO', 'en_US')
             components: Optional list of components with variable values
+            phone_number_id: Sender phone number id; defaults to the primary sender
             
         Returns:
             Dictionary with success status and message details
         """
-        logger.info(f"Attempting to send template '{template_name}' to {to_phone}")
-        
-        if not self.phone_number_id:
+        phone_number_id = phone_number_id or self.phone_number_id
+        if not phone_number_id:
             logger.error("WhatsApp Phone Number ID not configured")
             return {
                 "success": False,
                 "error": "WhatsApp Phone Number ID not configured"
             }
         
-        url = f"{self.BASE_URL}/{self.phone_number_id}/messages"
+        url = f"{self.base_url}/{phone_number_id}/messages"
         
         formatted_phone = self._format_phone_number(to_phone)
-        logger.info(f"Formatted phone: {formatted_phone}")
         
         payload = {
             "messaging_product": "whatsapp",
@@ -181,47 +510,66 @@ class WhatsAppService:
         # Add components if provided (for variables)
         if components:
             payload["template"]["components"] = components
-            logger.info(f"Template components: {components}")
         
-        logger.info(f"Sending request to: {url}")
-        logger.debug(f"Payload: {payload}")
+        logger.debug("Sending template '%s' to %s", template_name, formatted_phone)
+        
+        if not self.breaker.allow():
+            # Fail fast while the Graph API is down instead of waiting for a timeout
+            return {
+                "success": False,
+                "error": self._circuit_open_error(),
+                "phone": formatted_phone,
+                "circuit_open": True,
+                "retry_after": self.breaker.retry_after()
+            }
         
         try:
-            async with httpx.AsyncClient(timeout=30.0, verify=self.ssl_verify) as client:
-                response = await client.post(
-                    url,
-                    headers=self._get_headers(),
-                    json=payload
-                )
-                
+            response = await self._graph_request("POST", url, json=payload)
+            
+            try:
                 response_data = response.json()
+            except ValueError:
+                # Gateways answer 5xx with HTML bodies
+                response_data = {"error": {"message": f"HTTP {response.status_code}"}}
+            
+            if response.status_code in [200, 201]:
+                logger.info(f"✅ Message sent successfully to {formatted_phone}. Message ID: {response_data.get('messages', [{}])[0].get('id')}")
+                return {
+                    "success": True,
+                    "message_id": response_data.get("messages", [{}])[0].get("id"),
+                    "phone": formatted_phone,
+                    "status": "sent",
+                    "status_code": response.status_code
+                }
+            else:
+                error_msg = response_data.get("error", {}).get("message", "Unknown error")
+                error_code = response_data.get("error", {}).get("code")
+                logger.error(f"❌ Failed to send to {formatted_phone}. Status: {response.status_code}, Error: {error_msg}, Code: {error_code}")
+                logger.debug("Full response: %s", response_data)
+                return {
+                    "success": False,
+                    "error": error_msg,
+                    "error_code": error_code,
+                    "phone": formatted_phone,
+                    "status_code": response.status_code
+                }
                 
-                if response.status_code in [200, 201]:
-                    logger.info(f"✅ Message sent successfully to {formatted_phone}. Message ID: {response_data.get('messages', [{}])[0].get('id')}")
-                    return {
-                        "success": True,
-                        "message_id": response_data.get("messages", [{}])[0].get("id"),
-                        "phone": formatted_phone,
-                        "status": "sent"
-                    }
-                else:
-                    error_msg = response_data.get("error", {}).get("message", "Unknown error")
-                    error_code = response_data.get("error", {}).get("code")
-                    logger.error(f"❌ Failed to send to {formatted_phone}. Status: {response.status_code}, Error: {error_msg}, Code: {error_code}")
-                    logger.error(f"Full response: {response_data}")
-                    return {
-                        "success": False,
-                        "error": error_msg,
-                        "error_code": error_code,
-                        "phone": formatted_phone
-                    }
-                    
+
         except httpx.TimeoutException:
             logger.error(f"⏱️ Timeout sending to {formatted_phone}")
             return {
                 "success": False,
                 "error": "Connection timeout",
-                "phone": formatted_phone
+                "phone": formatted_phone,
+                "network_error": True
+            }
+        except httpx.TransportError as e:
+            logger.error(f"🔌 Connection error sending to {formatted_phone}: {str(e)}")
+            return {
+                "success": False,
+                "error": f"Connection error: {str(e)}",
+                "phone": formatted_phone,
+                "network_error": True
             }
         except Exception as e:
             logger.error(f"💥 Exception sending to {formatted_phone}: {str(e)}", exc_info=True)
@@ -231,6 +579,98 @@ class WhatsAppService:
                 "phone": formatted_phone
             }
     
+    async def dispatch_template_message(
+        self,
+        to_phone: str,
+        template_name: str,
+        language_code: str = "es_CO",
+        components: Optional[List[Dict[str, Any]]] = None,
+        sender: Optional[WhatsAppSender] = None,
+        priority: str = PRIORITY_BULK
+    ) -> Dict[str, Any]:
+        """
+        Send a template message through the sender pool.
+        
+        Uses the recipient's sticky sender unless one is given, waits for that
+        sender's rate limit and concurrency slot in the lane of `priority`
+        ('high' for single transactional sends, 'bulk' otherwise), and
+        updates its health.
+        """
+        if sender is None:
+            sender = self.sender_pool.assign(self._format_phone_number(to_phone))
+        if sender is None:
+            return await self.send_template_message(to_phone, template_name, language_code, components)
+        
+        async with sender.lane(priority):
+            await sender.limiter.acquire(priority)
+            MESSAGES_DISPATCHED.labels("whatsapp", "graph").inc()
+            with in_flight("whatsapp"):
+                result = await self.send_template_message(
+                    to_phone=to_phone,
+                    template_name=template_name,
+                    language_code=language_code,
+                    components=components,
+                    phone_number_id=sender.phone_number_id
+                )
+        sender.record_result(result)
+        result["sender"] = sender.phone_number_id
+        return result
+    
+    def build_send_plan(
+        self,
+        template_name: str,
+        language_code: str,
+        compiled: Optional[CompiledTemplate],
+        variable_mapping: Optional[Dict[str, str]] = None,
+        header_media_url: Optional[str] = None
+    ) -> "TemplateSendPlan":
+        """
+        Compile the parts of a template send shared by every recipient.
+        
+        The header block (with the quoted media URL) is built once and the body
+        variables are resolved to recipient fields in template order, so each
+        recipient only fills in its parameter values.
+        """
+        header_component = None
+        body_fields: List[Tuple[str, str]] = []
+        
+        if compiled is None:
+            logger.error(f"Could not fetch template '{template_name}' to determine variable order")
+        else:
+            # Add header component if media URL is provided and template has media header
+            if header_media_url and compiled.header_format:
+                param_type = compiled.header_format
+                header_component = {
+                    "type": "header",
+                    "parameters": [
+                        {
+                            "type": param_type,
+                            param_type: {  # e.g. "video": { "link": ... }
+                                "link": quote(header_media_url, safe=":/")
+                            }
+                        }
+                    ]
+                }
+                logger.info(f"Template has {param_type.upper()} header, using media URL: {header_media_url}")
+            
+            # Build parameters in the correct order
+            if variable_mapping and compiled.body_variables:
+                for var_name in compiled.body_variables:
+                    field_name = variable_mapping.get(var_name.lower())
+                    if field_name:
+                        body_fields.append((var_name, field_name))
+                    else:
+                        logger.warning(f"No mapping found for variable {{{{{var_name}}}}}")
+            elif not compiled.body_variables:
+                logger.info("Template has no variables, sending without body components")
+        
+        return TemplateSendPlan(
+            template_name=template_name,
+            language_code=language_code,
+            header_component=header_component,
+            body_fields=body_fields
+        )
+    
     async def send_bulk_template_messages(
         self,
         recipients: List[Dict[str, Any]],
@@ -242,6 +682,19 @@ class WhatsAppService:
         """
         Send template messages to multiple recipients.
         
+        Recipients are spread over the sender pool (sticky per phone number)
+        and every sender works through its share concurrently, so throughput
+        grows with the number of configured phone numbers. Results keep the
+        order of the recipients.
+        
+        Transient failures (timeouts, 5xx, Graph throttling) are re-enqueued
+        with jittered exponential backoff up to retry_max_attempts; permanent
+        errors fail the recipient right away. Sends rejected by the open Graph
+        circuit wait for its next probe and do not count as attempts, for at
+        most circuit_max_wait seconds of outage: after that, recipients
+        rejected by the circuit fail with its error (also in later sends,
+        until a call gets through again).
+        
         Args:
             recipients: List of recipients with 'phone' and other fields for variables
             template_name: Name of the approved template
@@ -253,134 +706,165 @@ class WhatsAppService:
         Returns:
             Summary of sent and failed messages
         """
-        logger.info(f"📤 Starting bulk send: {len(recipients)} recipients, template: '{template_name}'")
+        logger.info(
+            f"📤 Starting bulk send: {len(recipients)} recipients, template: '{template_name}', "
+            f"{len(self.sender_pool)} sender(s)"
+        )
         logger.info(f"Variable mapping: {variable_mapping}")
-        if header_media_url:
-            logger.info(f"Header media URL: {header_media_url}")
         
         results = {
             "total": len(recipients),
             "sent": 0,
             "failed": 0,
+            "retries": 0,
             "messages": []
         }
         
-        # Cache template data ONCE before the loop (optimization)
-        cached_template_data = None
-        cached_template_vars = []
-        cached_header_type = None  # Track header type for media
-        
-        # Always fetch template data to check for header type
-        cached_template_data = await self.get_template_by_name(template_name)
-        if cached_template_data:
-            # Extract variables in order from template body
-            body_text = ""
-            for comp in cached_template_data.get("components", []):
-                if comp.get("type") == "BODY":
-                    body_text = comp.get("text", "")
-                elif comp.get("type") == "HEADER":
-                    # Check header format for media types
-                    header_format = comp.get("format", "TEXT")
-                    if header_format in ["IMAGE", "VIDEO", "DOCUMENT"]:
-                        cached_header_type = header_format.lower()
-                        logger.info(f"Template has {header_format} header, media URL required")
-            cached_template_vars = self._extract_variable_names(body_text)
-            logger.info(f"Template variables cached (order): {cached_template_vars}")
-            if cached_header_type:
-                logger.info(f"Template header type: {cached_header_type}")
-        else:
-            logger.error(f"Could not fetch template '{template_name}' to determine variable order")
-        
-        for recipient in recipients:
-            phone = recipient.get("phone")
-            logger.info(f"Processing recipient: {recipient}")
-            
-            if not phone:
-                results["failed"] += 1
-                results["messages"].append({
-                    "recipient": recipient.get("name", "Unknown"),
-                    "phone": None,
-                    "success": False,
-                    "error": "No phone number provided"
-                })
-                continue
-            
-            # Build components for variables and header media
-            components = []
-            
-            # Add header component if media URL is provided and template has media header
-            if header_media_url and cached_header_type:
-                # Determine parameter type (image, video, document)
-                param_type = cached_header_type.lower()
-                
-                header_component = {
-                    "type": "header",
-                    "parameters": [
-                        {
-                            "type": param_type,
-                            param_type: { # e.g. "video": { "link": ... }
-                                "link": quote(header_media_url, safe=":/")
-                            }
-                        }
-                    ]
-                }
-                components.append(header_component)
-                logger.info(f"Added header component with {param_type}: {header_media_url}")
-            
-            # Build body parameters if we have variable mapping
-            if variable_mapping and cached_template_data and cached_template_vars:
-                # Build parameters in the correct order
-                body_params = []
-                for var_name in cached_template_vars:
-                    var_lower = var_name.lower()
-                    # Find the field name for this variable
-                    field_name = variable_mapping.get(var_lower)
-                    if field_name:
-                        value = recipient.get(field_name, "")
-                        if value and str(value).strip():  # Ensure value is not empty or whitespace
-                            body_params.append({
-                                "type": "text",
-                                "parameter_name": var_name,  # Include the parameter name!
-                                "text": str(value).strip()
-                            })
-                            logger.debug(f"Added parameter for {{{{{var_name}}}}}: '{str(value).strip()}'")
-                        else:
-                            logger.warning(f"Variable {{{{{var_name}}}}} maps to field '{field_name}' but value is empty for {recipient.get('name')}")
-                    else:
-                        logger.warning(f"No mapping found for variable {{{{{var_name}}}}}")
-                
-                if body_params:
-                    components.append({
-                        "type": "body",
-                        "parameters": body_params
-                    })
-                    logger.info(f"Added body component for {recipient.get('name')}")
-            elif not cached_template_vars:
-                logger.info(f"Template has no variables, sending without body components")
-            
-            # Send the message with components if we have any
-            final_components = components if components else None
-            logger.info(f"Final components for {recipient.get('name')}: {final_components}")
-            
-            result = await self.send_template_message(
-                to_phone=phone,
+        # Compile the send once per campaign; template metadata comes from the catalog
+        with span("whatsapp.compile_template", template=template_name, language=language_code):
+            compiled = await self.get_compiled_template(template_name, language_code)
+            plan = self.build_send_plan(
                 template_name=template_name,
                 language_code=language_code,
-                components=final_components
+                compiled=compiled,
+                variable_mapping=variable_mapping,
+                header_media_url=header_media_url
             )
-            
+        
+        messages: List[Optional[Dict[str, Any]]] = [None] * len(recipients)
+        
+        def record(index: int, recipient: Dict[str, Any], result: Dict[str, Any]) -> None:
             if result["success"]:
                 results["sent"] += 1
             else:
                 results["failed"] += 1
-            
-            results["messages"].append({
+            record_completed("whatsapp", "graph", sent=int(result["success"]), failed=int(not result["success"]))
+            messages[index] = {
                 "recipient": recipient.get("name", "Unknown"),
-                "phone": phone,
+                "phone": recipient.get("phone"),
                 "success": result["success"],
                 "message_id": result.get("message_id"),
-                "error": result.get("error")
-            })
+                "error": result.get("error"),
+                "attempts": result.get("attempts", 0)
+            }
+        
+        # Sticky sender per recipient: one queue per sender phone number
+        queues: Dict[str, asyncio.Queue] = {
+            sender.phone_number_id: asyncio.Queue() for sender in self.sender_pool.senders
+        }
+        queue_depth = QUEUE_DEPTH.labels("whatsapp")
+        pending = 0
+        for index, recipient in enumerate(recipients):
+            phone = recipient.get("phone")
+            if not phone:
+                record(index, recipient, {"success": False, "error": "No phone number provided"})
+                continue
+            sender = self.sender_pool.assign(self._format_phone_number(phone))
+            if sender is None:
+                record(index, recipient, {"success": False, "error": "WhatsApp Phone Number ID not configured"})
+                continue
+            queues[sender.phone_number_id].put_nowait((index, recipient, 1))
+            queue_depth.inc()
+            pending += 1
+        
+        done = asyncio.Event()
+        if pending == 0:
+            done.set()
+        
+        retry_policy = get_retry_policy()
+        loop = asyncio.get_running_loop()
+        retry_timers: List[asyncio.TimerHandle] = []
+        
+        def requeue(index: int, recipient: Dict[str, Any], attempt: int) -> None:
+            # Re-resolve the sender: the original one may be cooling down by now
+            target = self.sender_pool.assign(self._format_phone_number(recipient["phone"]))
+            queues[target.phone_number_id].put_nowait((index, recipient, attempt))
+            queue_depth.inc()
+        
+        async def worker(sender: WhatsAppSender) -> None:
+            nonlocal pending
+            queue = queues[sender.phone_number_id]
+            while True:
+                index, recipient, attempt = await queue.get()
+                queue_depth.dec()
+                phone = recipient["phone"]
+                if not sender.is_healthy():
+                    # Hand the recipient to a healthy sender while this one cools down
+                    target = self.sender_pool.assign(self._format_phone_number(phone))
+                    if target is not sender:
+                        queues[target.phone_number_id].put_nowait((index, recipient, attempt))
+                        queue_depth.inc()
+                        continue
+                try:
+                    with span("whatsapp.render", attempt=attempt):
+                        components = plan.build_components(recipient)
+                    result = await self.dispatch_template_message(
+                        to_phone=phone,
+                        template_name=template_name,
+                        language_code=language_code,
+                        components=components,
+                        sender=sender
+                    )
+                except Exception as e:
+                    logger.error(f"💥 Exception sending to {phone}: {str(e)}", exc_info=True)
+                    result = {"success": False, "error": str(e)}
+                
+                if result.get("circuit_open"):
+                    now = time.monotonic()
+                    if self._circuit_wait_deadline is None:
+                        self._circuit_wait_deadline = now + self.settings.circuit_max_wait
+                    if now < self._circuit_wait_deadline:
+                        # Nothing was sent, so this is not an attempt: wait for the
+                        # breaker's next probe (or for a probe in flight to report)
+                        delay = max(result.get("retry_after") or 0, self.CIRCUIT_POLL_INTERVAL)
+                        delay = min(delay, self._circuit_wait_deadline - now)
+                        retry_timers.append(loop.call_later(
+                            delay, requeue, index, recipient, attempt
+                        ))
+                        continue
+                elif self.breaker.state == CLOSED:
+                    # The outage (if any) is over; the next one gets its own wait
+                    self._circuit_wait_deadline = None
+                
+                if retry_policy.should_retry(attempt, classify_whatsapp_result(result)):
+                    # Transient error: retry later without holding this worker
+                    delay = retry_policy.backoff(attempt)
+                    results["retries"] += 1
+                    retry_timers.append(loop.call_later(
+                        delay, requeue, index, recipient, attempt + 1
+                    ))
+                    continue
+                
+                result["attempts"] = attempt
+                record(index, recipient, result)
+                pending -= 1
+                if pending == 0:
+                    done.set()
+        
+        # Senders work in parallel, each with its own limiter and concurrency.
+        # Workers inherit the span, so every Graph call nests under it.
+        with span("whatsapp.bulk_send", template=template_name, recipients=pending) as current:
+            workers = [
+                asyncio.create_task(worker(sender))
+                for sender in self.sender_pool.senders
+                for _ in range(sender.concurrency)
+            ]
+            try:
+                await done.wait()
+            finally:
+                for timer in retry_timers:
+                    timer.cancel()
+                for task in workers:
+                    task.cancel()
+                await asyncio.gather(*workers, return_exceptions=True)
+                # Recipients left behind if the send was cancelled
+                queue_depth.dec(sum(queue.qsize() for queue in queues.values()))
+            if current is not None:
+                current.set_attribute("sent", results["sent"])
+                current.set_attribute("failed", results["failed"])
+                current.set_attribute("retries", results["retries"])
+        
+        results["messages"] = messages
         
         logger.info(f"📊 Bulk send complete: {results['sent']} sent, {results['failed']} failed out of {results['total']} total")
         return results
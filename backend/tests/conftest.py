@@ -0,0 +1,61 @@
+"""
+Shared fixtures.
+
+Tests run against a throwaway SQLite file migrated to head; DATABASE_URL is
+set here, before the application modules read their settings.
+"""
+import os
+import sys
+import tempfile
+import pytest
+
+_DB_DIR = tempfile.mkdtemp(prefix="messaging-tests-")
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{os.path.join(_DB_DIR, 'test.db')}"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import delete  # noqa: E402
+from database import Base, async_session, engines, init_db  # noqa: E402
+import models  # noqa: E402,F401  (registers every table on Base.metadata)
+
+_migrated = False
+
+
+class FakeClock:
+    """Stand-in for the time module: monotonic() only moves when advanced."""
+    
+    def __init__(self, start: float = 1000.0):
+        self.now = start
+    
+    def monotonic(self) -> float:
+        return self.now
+    
+    def time(self) -> float:
+        return self.now
+    
+    def perf_counter(self) -> float:
+        return self.now
+    
+    def advance(self, seconds: float) -> None:
+        self.now += seconds
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+async def db():
+    """A session on an empty, migrated database."""
+    global _migrated
+    if not _migrated:
+        await init_db()
+        _migrated = True
+    async with async_session() as session:
+        for table in reversed(Base.metadata.sorted_tables):
+            await session.execute(delete(table))
+        await session.commit()
+        yield session
+    # Pooled aiosqlite connections belong to this test's event loop
+    for engine in engines:
+        await engine.dispose()
@@ -0,0 +1,76 @@
+"""Set operations over groups (build_key_query / build_members_query)."""
+import pytest
+from sqlalchemy import select
+from models.group import Group, GroupContact
+from schemas.audience import AudienceOperand
+from services.audience_service import build_key_query, build_members_query, count_audience
+
+
+async def make_group(db, name, contacts):
+    group = Group(name=name)
+    db.add(group)
+    await db.flush()
+    for contact_name, phone, email in contacts:
+        db.add(GroupContact(group_id=group.id, name=contact_name, phone=phone, email=email))
+    await db.commit()
+    return AudienceOperand(group_id=group.id)
+
+
+@pytest.fixture
+async def groups(db):
+    a = await make_group(db, "A", [
+        ("Ana", "+57 300 000 0001", "ana@example.com"),
+        ("Beto", "3000000002", "beto@example.com"),
+        ("Caro", "573000000003", None),
+    ])
+    b = await make_group(db, "B", [
+        ("Ana B", "3000000001", "ANA@example.com "),
+        ("Dani", "3000000004", "dani@example.com"),
+    ])
+    c = await make_group(db, "C", [
+        ("Beto C", "573000000002", None),
+    ])
+    return a, b, c
+
+
+async def keys(db, operation, operands, key="phone"):
+    result = await db.execute(build_key_query(operation, operands, key))
+    return sorted(result.scalars().all())
+
+
+async def test_union_deduplicates_normalized_phones(db, groups):
+    a, b, _ = groups
+    assert await keys(db, "union", [a, b]) == [
+        "573000000001", "573000000002", "573000000003", "573000000004"
+    ]
+
+
+async def test_intersection(db, groups):
+    a, b, _ = groups
+    assert await keys(db, "intersection", [a, b]) == ["573000000001"]
+    assert await keys(db, "intersection", [a, b], key="email") == ["ana@example.com"]
+
+
+async def test_difference_is_left_associative(db, groups):
+    a, b, c = groups
+    assert await keys(db, "difference", [a, b]) == ["573000000002", "573000000003"]
+    assert await keys(db, "difference", [a, b, c]) == ["573000000003"]
+
+
+async def test_single_operand_is_distinct_and_skips_missing_keys(db, groups):
+    a, _, _ = groups
+    assert await keys(db, "union", [a], key="email") == ["ana@example.com", "beto@example.com"]
+
+
+async def test_members_keep_the_earliest_operand(db, groups):
+    a, b, _ = groups
+    result = await db.execute(build_members_query("union", [b, a], "phone"))
+    names = {row.key: row.name for row in result}
+    assert names["573000000001"] == "Ana B"
+    assert names["573000000002"] == "Beto"
+
+
+async def test_count_audience(db, groups):
+    a, b, c = groups
+    assert await count_audience(db, "union", [a, b, c], "phone") == 4
+    assert await count_audience(db, "difference", [a, c], "phone") == 2
@@ -0,0 +1,191 @@
+"""Send windows and campaign releases."""
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import select, update
+from database import async_session
+from models.campaign import Campaign, CampaignRecipient
+from models.idempotency import IdempotencyKey
+from models.message_log import MessageLog, get_colombia_time
+from services import campaign_scheduler as scheduler_module
+from services.campaign_scheduler import CampaignScheduler, in_send_window, parse_window
+from services.idempotency_service import claim_recipients
+
+# 2026-10-19 is a Monday (weekday 0)
+MONDAY_10AM = datetime(2026, 10, 19, 10, 0)
+
+
+def test_parse_window():
+    assert parse_window("08:00-12:30") == (datetime(1, 1, 1, 8).time(), datetime(1, 1, 1, 12, 30).time())
+
+
+@pytest.mark.parametrize("now, windows, days, expected", [
+    (MONDAY_10AM, [], [], True),
+    (MONDAY_10AM, ["08:00-12:00"], [], True),
+    (MONDAY_10AM, ["10:00-12:00"], [], True),
+    (MONDAY_10AM, ["08:00-10:00"], [], False),  # the end is exclusive
+    (MONDAY_10AM, ["08:00-09:00", "09:30-11:00"], [], True),
+    (MONDAY_10AM, ["08:00-12:00"], [1, 2], False),
+    (MONDAY_10AM, [], [0], True),
+    # Windows across midnight
+    (datetime(2026, 10, 19, 23, 0), ["20:00-02:00"], [], True),
+    (datetime(2026, 10, 19, 1, 59), ["20:00-02:00"], [], True),
+    (datetime(2026, 10, 19, 2, 0), ["20:00-02:00"], [], False),
+])
+def test_in_send_window(now, windows, days, expected):
+    assert in_send_window(now, windows, days) == expected
+
+
+class SmsSends(list):
+    """Phones of every bulk SMS request; `on_send` runs while a request is in flight."""
+    on_send = None
+
+
+@pytest.fixture
+def sms_sends(monkeypatch):
+    sends = SmsSends()
+
+    async def send_bulk(recipients, message, test_mode=False):
+        sends.append([r["phone"] for r in recipients])
+        if sends.on_send:
+            await sends.on_send()
+        return {"success": True, "failed_indexes": []}
+
+    monkeypatch.setattr(scheduler_module.sms_service, "send_bulk", send_bulk)
+    return sends
+
+
+async def make_campaign(db, phones, **values):
+    values = {"max_rate_per_minute": 600, **values}
+    campaign = Campaign(
+        name="Promo", channel="sms", params={"message": "Hola"},
+        start_at=get_colombia_time() - timedelta(minutes=1), recipients_loaded=True, total=len(phones),
+        **values
+    )
+    db.add(campaign)
+    await db.flush()
+    for phone in phones:
+        db.add(CampaignRecipient(campaign_id=campaign.id, phone=phone, status="pending"))
+    await db.commit()
+    return campaign.id
+
+
+async def reload(campaign_id):
+    async with async_session() as db:
+        campaign = await db.get(Campaign, campaign_id)
+        result = await db.execute(
+            select(CampaignRecipient.phone, CampaignRecipient.status)
+            .where(CampaignRecipient.campaign_id == campaign_id)
+            .order_by(CampaignRecipient.id)
+        )
+        return campaign, dict(result.all())
+
+
+async def test_release_sends_and_completes(db, sms_sends):
+    campaign_id = await make_campaign(db, ["3000000001", "3000000002"])
+    scheduler = CampaignScheduler(poll_interval=10)
+    await scheduler.advance(campaign_id, get_colombia_time())
+    campaign, rows = await reload(campaign_id)
+    assert sms_sends == [["3000000001", "3000000002"]]
+    assert (campaign.status, campaign.sent) == ("running", 2)
+    assert set(rows.values()) == {"sent"}
+    logs = await db.execute(select(MessageLog.batch_id).where(MessageLog.batch_id == f"campaign-{campaign_id}"))
+    assert len(logs.all()) == 2
+
+    await scheduler.advance(campaign_id, get_colombia_time())
+    campaign, _ = await reload(campaign_id)
+    assert campaign.status == "completed"
+    assert campaign.completed_at is not None
+
+
+async def test_release_is_throttled(db, sms_sends):
+    campaign_id = await make_campaign(db, [f"30000000{i:02d}" for i in range(10)], max_rate_per_minute=24)
+    await CampaignScheduler(poll_interval=10).advance(campaign_id, get_colombia_time())
+    assert [len(send) for send in sms_sends] == [4]
+
+
+async def test_only_sent_claims_are_skipped(db, sms_sends):
+    campaign_id = await make_campaign(db, ["3000000001", "3000000002", "3000000003"])
+    # An interrupted release sent the first recipient and still holds the second
+    await claim_recipients(db, f"campaign-{campaign_id}", "sms", ["573000000001", "573000000002"])
+    await db.execute(
+        update(IdempotencyKey).where(IdempotencyKey.recipient == "573000000001").values(status="sent")
+    )
+    await db.commit()
+
+    scheduler = CampaignScheduler(poll_interval=10)
+    await scheduler.advance(campaign_id, get_colombia_time())
+    campaign, rows = await reload(campaign_id)
+    assert sms_sends == [["3000000003"]]
+    assert rows == {"3000000001": "skipped", "3000000002": "pending", "3000000003": "sent"}
+    assert (campaign.sent, campaign.failed) == (1, 0)
+
+    # Only the held recipient is left: the campaign waits instead of completing
+    await scheduler.advance(campaign_id, get_colombia_time() + timedelta(seconds=10))
+    campaign, _ = await reload(campaign_id)
+    assert campaign.status == "running"
+
+    # Once the abandoned claim expires the recipient is sent
+    async with async_session() as other:
+        await other.execute(
+            update(IdempotencyKey).values(updated_at=get_colombia_time() - timedelta(days=1))
+        )
+        await other.commit()
+    await scheduler.advance(campaign_id, get_colombia_time() + timedelta(days=1))
+    campaign, rows = await reload(campaign_id)
+    assert sms_sends[-1] == ["3000000002"]
+    assert rows["3000000002"] == "sent"
+    assert campaign.sent == 2
+
+
+async def test_held_rows_do_not_stall_the_rows_after_them(db, sms_sends):
+    campaign_id = await make_campaign(db, ["3000000001", "3000000002", "3000000003"], max_rate_per_minute=12)
+    await claim_recipients(db, f"campaign-{campaign_id}", "sms", ["573000000001"])
+    scheduler = CampaignScheduler(poll_interval=5)
+    start = get_colombia_time()
+    for tick in range(3):
+        await scheduler.advance(campaign_id, start + timedelta(seconds=5 * tick))
+    _, rows = await reload(campaign_id)
+    assert sms_sends == [["3000000002"], ["3000000003"]]
+    assert rows["3000000001"] == "pending"
+
+
+async def test_rates_below_one_per_tick_are_kept(db, sms_sends):
+    campaign_id = await make_campaign(db, [f"30000000{i:02d}" for i in range(5)], max_rate_per_minute=2)
+    scheduler = CampaignScheduler(poll_interval=5)
+    start = get_colombia_time()
+    # Two minutes of 5-second ticks
+    for tick in range(24):
+        await scheduler.advance(campaign_id, start + timedelta(seconds=5 * tick))
+    assert len(sms_sends) == 4
+    campaign, _ = await reload(campaign_id)
+    assert campaign.next_release_at == start + timedelta(seconds=120)
+
+
+@pytest.mark.parametrize("change", [
+    {"status": "cancelled"},
+    {"status": "paused", "paused_by_user": True},
+])
+async def test_api_changes_during_a_release_are_kept(db, sms_sends, change):
+    campaign_id = await make_campaign(db, ["3000000001", "3000000002"])
+
+    async def change_status():
+        async with async_session() as api:
+            await api.execute(update(Campaign).where(Campaign.id == campaign_id).values(**change))
+            await api.commit()
+
+    sms_sends.on_send = change_status
+    await CampaignScheduler(poll_interval=10).advance(campaign_id, get_colombia_time())
+    campaign, rows = await reload(campaign_id)
+    assert campaign.status == change["status"]
+    # The release in flight is still recorded
+    assert campaign.sent == 2
+    assert set(rows.values()) == {"sent"}
+
+
+async def test_outside_the_window_pauses_without_sending(db, sms_sends):
+    campaign_id = await make_campaign(db, ["3000000001"], send_windows=["08:00-09:00"])
+    await CampaignScheduler(poll_interval=10).advance(campaign_id, MONDAY_10AM)
+    campaign, _ = await reload(campaign_id)
+    assert campaign.status == "paused"
+    assert not campaign.paused_by_user
+    assert sms_sends == []
@@ -0,0 +1,80 @@
+"""CircuitBreaker state machine."""
+import pytest
+from services import circuit_breaker
+from services.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+
+
+@pytest.fixture(autouse=True)
+def fake_time(monkeypatch, clock):
+    monkeypatch.setattr(circuit_breaker, "time", clock)
+
+
+@pytest.fixture
+def breaker():
+    return CircuitBreaker(
+        "test", failure_threshold=3, error_rate=0.5, window_size=10, min_calls=6, recovery_timeout=30
+    )
+
+
+def test_opens_after_consecutive_failures(breaker):
+    for _ in range(2):
+        breaker.record_failure()
+    assert breaker.state == CLOSED
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+    assert breaker.status()["rejected_calls"] == 1
+
+
+def test_success_resets_the_consecutive_count(breaker):
+    breaker.record(False)
+    breaker.record(False)
+    breaker.record(True)
+    breaker.record(False)
+    breaker.record(False)
+    assert breaker.state == CLOSED
+
+
+def test_opens_on_error_rate_once_enough_calls(breaker):
+    for success in [False, True, False, True, False]:
+        breaker.record(success)
+    assert breaker.state == CLOSED  # only 5 calls, below min_calls
+    breaker.record(True)
+    breaker.record(False)
+    assert breaker.state == OPEN
+
+
+def test_half_open_lets_one_probe_through(breaker, clock):
+    for _ in range(3):
+        breaker.record_failure()
+    assert breaker.retry_after() == 30
+    clock.advance(10)
+    assert breaker.retry_after() == 20
+    clock.advance(20)
+    assert breaker.status()["state"] == HALF_OPEN
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+    assert not breaker.allow()  # the probe is still in flight
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    assert breaker.allow()
+
+
+def test_failed_probe_reopens(breaker, clock):
+    for _ in range(3):
+        breaker.record_failure()
+    clock.advance(30)
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert breaker.retry_after() == 30
+    assert breaker.status()["times_opened"] == 2
+
+
+def test_probe_that_never_reports_expires(breaker, clock):
+    for _ in range(3):
+        breaker.record_failure()
+    clock.advance(30)
+    assert breaker.allow()
+    clock.advance(30)
+    assert breaker.allow()
@@ -0,0 +1,82 @@
+"""Idempotency claims on SQLite."""
+from datetime import timedelta
+from sqlalchemy import select, update
+from models.idempotency import IdempotencyKey
+from models.message_log import get_colombia_time
+from services import idempotency_service
+from services.idempotency_service import (
+    claim_recipients, complete_batch_recipients, complete_recipients, recipient_key,
+    release_recipients, select_claimed, sent_recipients
+)
+
+
+async def statuses(db, campaign_key="camp"):
+    result = await db.execute(
+        select(IdempotencyKey.recipient, IdempotencyKey.status).where(IdempotencyKey.campaign_key == campaign_key)
+    )
+    return dict(result.all())
+
+
+def test_recipient_key_normalizes_per_channel():
+    assert recipient_key("whatsapp", {"phone": "+57 300 123 4567"}) == "573001234567"
+    assert recipient_key("sms", {"phone": "3001234567"}) == "573001234567"
+    assert recipient_key("email", {"email": " Ana@Example.com"}) == "ana@example.com"
+    assert recipient_key("whatsapp", {"phone": ""}) is None
+
+
+async def test_claim_is_exclusive_until_completed(db):
+    assert await claim_recipients(db, "camp", "whatsapp", ["a", "b", None, "a"]) == {"a", "b"}
+    # Still pending: a concurrent or repeated request gets nothing
+    assert await claim_recipients(db, "camp", "whatsapp", ["a", "b", "c"]) == {"c"}
+    # Same recipients on another channel or campaign are independent
+    assert await claim_recipients(db, "camp", "sms", ["a"]) == {"a"}
+    assert await claim_recipients(db, "other", "whatsapp", ["a"]) == {"a"}
+
+
+async def test_failed_claims_can_be_taken_again(db):
+    await claim_recipients(db, "camp", "whatsapp", ["a", "b"])
+    await complete_recipients(db, "camp", "whatsapp", [("a", True, "wamid.1", None), ("b", False, None, "boom")])
+    assert await statuses(db) == {"a": "sent", "b": "failed"}
+    assert await claim_recipients(db, "camp", "whatsapp", ["a", "b"]) == {"b"}
+    assert await sent_recipients(db, "camp", "whatsapp", ["a", "b", "c"]) == {"a"}
+
+
+async def test_abandoned_pending_claims_expire(db):
+    await claim_recipients(db, "camp", "whatsapp", ["a", "b"])
+    await db.execute(
+        update(IdempotencyKey)
+        .where(IdempotencyKey.recipient == "a")
+        .values(updated_at=get_colombia_time() - timedelta(days=1))
+    )
+    await db.commit()
+    assert await claim_recipients(db, "camp", "whatsapp", ["a", "b"]) == {"a"}
+
+
+async def test_claims_span_several_chunks(db, monkeypatch):
+    # The chunk size is bound as _chunks' default argument
+    monkeypatch.setattr(idempotency_service._chunks, "__defaults__", (3,))
+    keys = [f"k{i}" for i in range(10)]
+    assert await claim_recipients(db, "camp", "whatsapp", keys) == set(keys)
+    await complete_recipients(db, "camp", "whatsapp", [(key, True, None, None) for key in keys])
+    assert set((await statuses(db)).values()) == {"sent"}
+
+
+def test_select_claimed_keeps_first_occurrence_and_keyless_recipients():
+    recipients = [{"n": 1}, {"n": 2}, {"n": 3}, {"n": 4}]
+    keys = ["a", "a", None, "b"]
+    assert select_claimed(recipients, keys, {"a"}) == [{"n": 1}, {"n": 3}]
+
+
+async def test_batch_outcomes_and_release(db):
+    await claim_recipients(db, "req-1", "whatsapp", ["a", "b", "c"], batch_id="batch-1")
+    updated = await complete_batch_recipients(db, "whatsapp", [
+        ("batch-1", "a", False, "first"),
+        ("batch-1", "a", True, None),  # the last outcome of a recipient wins
+        ("batch-1", "b", False, "rejected"),
+    ])
+    assert updated == 2
+    # Pending claims of the batch are released so a retry can send them
+    assert await release_recipients(db, "batch-1", "whatsapp", ["a", "c"], "webhook failed") == 1
+    await db.commit()
+    assert await statuses(db, "req-1") == {"a": "sent", "b": "failed", "c": "failed"}
+    assert await claim_recipients(db, "req-1", "whatsapp", ["a", "b", "c"]) == {"b", "c"}
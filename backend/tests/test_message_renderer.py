@@ -0,0 +1,33 @@
+"""Compiled message templates."""
+import pytest
+from services.message_renderer import compile_message
+
+
+def test_aliases_share_a_slot():
+    compiled = compile_message("{{nombre}} / {{name}} / {{primer_nombre}}")
+    assert compiled.fields == ["name", "first_name"]
+    assert compiled.render({"name": "Ana María"}) == "Ana María / Ana María / Ana"
+
+
+@pytest.mark.parametrize("template", ["{{empresa}}", "{{Empresa}}", "{{EMPRESA}}"])
+@pytest.mark.parametrize("recipient", [{"empresa": "OWO"}, {"Empresa": "OWO"}])
+def test_fields_match_case_insensitively(template, recipient):
+    assert compile_message(template).render(recipient) == "OWO"
+
+
+def test_aliases_and_builtins_ignore_case():
+    assert compile_message("{{Nombre}} {{TELEFONO}}").render({"Name": "Ana", "phone": "300"}) == "Ana 300"
+
+
+@pytest.mark.parametrize("value, expected", [
+    (0, "0"),
+    (False, "False"),
+    (None, "-"),
+    ("", "-"),
+])
+def test_only_missing_values_use_the_default(value, expected):
+    assert compile_message("{{saldo|-}}").render({"saldo": value}) == expected
+
+
+def test_unknown_variables_are_kept():
+    assert compile_message("Hola {{apodo}}, 100%").render({"name": "Ana"}) == "Hola {{apodo}}, 100%"
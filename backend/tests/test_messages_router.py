@@ -0,0 +1,39 @@
+"""Bulk send endpoint: rows and idempotency claims."""
+import pytest
+from fastapi import BackgroundTasks
+from sqlalchemy import func, select
+from models.idempotency import IdempotencyKey
+from models.message_log import MessageLog
+from routers import messages as messages_router
+from schemas.message import BulkMessageCreate
+
+BULK = BulkMessageCreate(
+    recipients=[{"name": "Ana", "phone": "3000000001"}, {"name": "Beto", "phone": "3000000002"}],
+    content="Hola", channel="whatsapp"
+)
+
+
+async def count(db, model):
+    return await db.scalar(select(func.count()).select_from(model))
+
+
+async def test_claims_are_committed_with_the_rows(db):
+    tasks = BackgroundTasks()
+    response = await messages_router.send_bulk_messages(BULK, tasks, db, idempotency_key="req-1")
+    assert (response.total, response.duplicates) == (2, 0)
+    assert len(tasks.tasks) == 1
+
+    repeated = await messages_router.send_bulk_messages(BULK, BackgroundTasks(), db, idempotency_key="req-1")
+    assert (repeated.total, repeated.duplicates) == (0, 2)
+
+
+async def test_failed_send_leaves_no_claims_behind(db, monkeypatch):
+    async def insert_rows(db, model, rows):
+        raise ConnectionError("database unavailable")
+
+    monkeypatch.setattr(messages_router, "insert_rows", insert_rows)
+    with pytest.raises(ConnectionError):
+        await messages_router.send_bulk_messages(BULK, BackgroundTasks(), db, idempotency_key="req-1")
+    await db.rollback()  # what get_db does with the error
+    assert await count(db, MessageLog) == 0
+    assert await count(db, IdempotencyKey) == 0
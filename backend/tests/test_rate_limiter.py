@@ -0,0 +1,78 @@
+"""AsyncRateLimiter (GCRA) and PriorityRateLimiter lanes."""
+from types import SimpleNamespace
+import pytest
+from services import rate_limiter
+from services.rate_limiter import PRIORITY_BULK, PRIORITY_HIGH, AsyncRateLimiter, PriorityRateLimiter
+
+
+NO_WAIT = pytest.approx(0.0, abs=1e-9)
+
+
+@pytest.fixture(autouse=True)
+def fake_time(monkeypatch, clock):
+    monkeypatch.setattr(rate_limiter, "time", clock)
+
+
+@pytest.fixture
+def slept(monkeypatch):
+    """Seconds passed to asyncio.sleep by the limiter (which does not actually sleep)."""
+    calls = []
+
+    async def fake_sleep(seconds):
+        calls.append(seconds)
+
+    monkeypatch.setattr(rate_limiter, "asyncio", SimpleNamespace(sleep=fake_sleep))
+    return calls
+
+
+def test_burst_then_paced(clock):
+    limiter = AsyncRateLimiter(rate=10, burst=3)
+    assert [limiter.reserve() for _ in range(3)] == [NO_WAIT] * 3
+    assert limiter.reserve() == pytest.approx(0.1)
+    assert limiter.reserve() == pytest.approx(0.2)
+
+
+def test_idle_time_refills_the_burst(clock):
+    limiter = AsyncRateLimiter(rate=10, burst=2)
+    limiter.reserve()
+    limiter.reserve()
+    assert limiter.reserve() > 0
+    clock.advance(1)
+    assert limiter.reserve() == NO_WAIT
+    assert limiter.reserve() == NO_WAIT
+
+
+def test_default_burst_is_one_second_of_rate():
+    assert AsyncRateLimiter(rate=25).burst == 25
+    assert AsyncRateLimiter(rate=0.5).burst == 1
+
+
+def test_zero_rate_means_unlimited():
+    limiter = AsyncRateLimiter(rate=0)
+    assert all(limiter.reserve() == 0.0 for _ in range(100))
+
+
+async def test_acquire_sleeps_and_reports_wait(slept):
+    limiter = AsyncRateLimiter(rate=4, burst=1)
+    assert await limiter.acquire() == 0.0
+    assert await limiter.acquire() == pytest.approx(0.25)
+    assert slept == [pytest.approx(0.25)]
+    assert limiter.total_wait == pytest.approx(0.25)
+
+
+async def test_high_priority_keeps_its_share_during_bulk(slept):
+    limiter = PriorityRateLimiter(rate=10, reserved_share=0.5, burst=10)
+    # The bulk lane runs at 5/s with a burst of 5
+    for _ in range(5):
+        assert await limiter.acquire(PRIORITY_BULK) == NO_WAIT
+    assert await limiter.acquire(PRIORITY_BULK) > 0
+    assert await limiter.acquire(PRIORITY_HIGH) == NO_WAIT
+    status = limiter.status()
+    assert status[PRIORITY_BULK]["calls"] == 6
+    assert status[PRIORITY_HIGH]["calls"] == 1
+    assert status[PRIORITY_HIGH]["avg_wait_ms"] == 0.0
+
+
+def test_reserved_share_is_clamped():
+    assert PriorityRateLimiter(rate=10, reserved_share=2).reserved_share == 0.9
+    assert PriorityRateLimiter(rate=10, reserved_share=-1).reserved_share == 0.0
@@ -0,0 +1,108 @@
+"""Error classification, backoff and run_with_retry."""
+import pytest
+from services.retry_policy import (
+    PERMANENT, RETRYABLE, RetryPolicy, classify_sms_bulk_result, classify_sms_result,
+    classify_whatsapp_result, run_with_retry
+)
+
+
+@pytest.mark.parametrize("result, expected", [
+    ({"success": True}, None),
+    ({"success": False, "network_error": True}, RETRYABLE),
+    ({"success": False, "circuit_open": True}, RETRYABLE),
+    ({"success": False, "status_code": 503}, RETRYABLE),
+    ({"success": False, "status_code": 400, "error_code": 131056}, RETRYABLE),
+    ({"success": False, "status_code": 400, "error_code": 100}, PERMANENT),
+    ({"success": False, "error": "No phone number provided"}, PERMANENT),
+])
+def test_classify_whatsapp_result(result, expected):
+    assert classify_whatsapp_result(result) == expected
+
+
+@pytest.mark.parametrize("result, expected", [
+    ({"success": True}, None),
+    ({"success": False, "code": "30"}, RETRYABLE),
+    ({"success": False, "code": 30}, RETRYABLE),
+    ({"success": False, "code": "21"}, PERMANENT),
+    ({"success": False, "status_code": 502}, RETRYABLE),
+    ({"success": False, "network_error": True, "not_sent": True}, RETRYABLE),
+    # A read timeout: the SMS may have been sent and charged
+    ({"success": False, "network_error": True, "not_sent": False}, PERMANENT),
+])
+def test_classify_sms_result(result, expected):
+    assert classify_sms_result(result) == expected
+
+
+@pytest.mark.parametrize("result, expected", [
+    ({"success": True}, None),
+    # Never reached LabsMobile: safe to repeat
+    ({"success": False, "network_error": True, "not_sent": True}, RETRYABLE),
+    ({"success": False, "circuit_open": True}, RETRYABLE),
+    ({"success": False, "status_code": 429}, RETRYABLE),
+    # The numbers may have been queued already
+    ({"success": False, "network_error": True, "not_sent": False}, PERMANENT),
+    ({"success": False, "status_code": 503}, PERMANENT),
+    ({"success": False, "code": "30"}, PERMANENT),
+])
+def test_classify_sms_bulk_result_retries_only_unaccepted_requests(result, expected):
+    assert classify_sms_bulk_result(result) == expected
+
+
+def test_should_retry_stops_at_max_attempts():
+    policy = RetryPolicy(max_attempts=3, base_delay=1, max_delay=10)
+    assert policy.should_retry(1, RETRYABLE)
+    assert policy.should_retry(2, RETRYABLE)
+    assert not policy.should_retry(3, RETRYABLE)
+    assert not policy.should_retry(1, PERMANENT)
+    assert not policy.should_retry(1, None)
+    assert RetryPolicy(max_attempts=0, base_delay=1, max_delay=10).max_attempts == 1
+
+
+def test_backoff_is_jittered_below_a_capped_ceiling():
+    policy = RetryPolicy(max_attempts=10, base_delay=0.5, max_delay=3)
+    for attempt, ceiling in [(1, 0.5), (2, 1), (3, 2), (4, 3), (8, 3)]:
+        delays = [policy.backoff(attempt) for _ in range(200)]
+        assert all(0 <= delay <= ceiling for delay in delays)
+
+
+def sequence(*results):
+    calls = []
+
+    async def send():
+        calls.append(len(calls) + 1)
+        return dict(results[min(len(calls), len(results)) - 1])
+
+    return send, calls
+
+
+NO_DELAY = RetryPolicy(max_attempts=3, base_delay=0, max_delay=0)
+
+
+async def test_run_with_retry_until_success():
+    send, calls = sequence({"success": False, "network_error": True}, {"success": True})
+    result = await run_with_retry(send, classify_whatsapp_result, NO_DELAY)
+    assert result["success"]
+    assert result["attempts"] == 2
+    assert calls == [1, 2]
+
+
+async def test_run_with_retry_gives_up_after_max_attempts():
+    send, calls = sequence({"success": False, "status_code": 503})
+    result = await run_with_retry(send, classify_whatsapp_result, NO_DELAY)
+    assert not result["success"]
+    assert result["attempts"] == 3
+    assert result["retryable"]
+
+
+async def test_run_with_retry_does_not_repeat_permanent_errors():
+    send, calls = sequence({"success": False, "status_code": 400, "error_code": 100})
+    result = await run_with_retry(send, classify_whatsapp_result, NO_DELAY)
+    assert calls == [1]
+    assert not result["retryable"]
+
+
+async def test_run_with_retry_returns_open_circuit_at_once():
+    send, calls = sequence({"success": False, "circuit_open": True})
+    result = await run_with_retry(send, classify_whatsapp_result, NO_DELAY)
+    assert calls == [1]
+    assert result["retryable"]
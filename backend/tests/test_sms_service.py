@@ -0,0 +1,85 @@
+"""LabsMobile sends: grouping and retries."""
+import httpx
+import pytest
+from services import retry_policy
+from services.retry_policy import RetryPolicy
+from services.sms_service import SMSService
+
+
+@pytest.fixture
+def service(monkeypatch):
+    monkeypatch.setattr(retry_policy, "get_retry_policy", lambda: RetryPolicy(3, 0, 0))
+    service = SMSService()
+    service.username, service.token, service.sender = "user", "token", "OWO"
+    return service
+
+
+def labsmobile(*outcomes):
+    """Fake SMSService._request answering with the given outcomes in order."""
+    requests = []
+
+    async def request(method, url, timeout, **kwargs):
+        outcome = outcomes[len(requests)]
+        requests.append(kwargs["json"])
+        if isinstance(outcome, Exception):
+            raise outcome
+        return httpx.Response(outcome[0], json=outcome[1], request=httpx.Request(method, url))
+
+    return request, requests
+
+
+OK = (200, {"code": "0", "subid": "s1", "credits": "2"})
+RECIPIENTS = [{"phone": "3000000001"}, {"phone": "3000000002"}]
+
+
+async def test_recipients_with_the_same_text_share_a_request(service):
+    service._request, requests = labsmobile(OK, OK)
+    result = await service.send_bulk(
+        RECIPIENTS + [{"phone": "3000000003", "message": "Hola Ana"}, {"phone": ""}], "Hola"
+    )
+    assert len(requests) == 2
+    assert sorted(len(r["recipient"]) for r in requests) == [1, 2]
+    assert result["sent"] == 3
+    assert result["failed_indexes"] == [3]
+
+
+@pytest.mark.parametrize("first", [
+    httpx.ConnectError("refused"),
+    (429, {"code": "35", "message": "Too many requests"}),
+])
+async def test_bulk_request_is_retried_when_not_accepted(service, first):
+    service._request, requests = labsmobile(first, OK)
+    result = await service.send_bulk(RECIPIENTS, "Hola")
+    assert len(requests) == 2
+    assert result["sent"] == 2
+
+
+@pytest.mark.parametrize("first", [
+    httpx.ReadTimeout("slow"),
+    (500, {"code": "500", "message": "Internal error"}),
+])
+async def test_ambiguous_bulk_failure_is_not_repeated(service, first):
+    service._request, requests = labsmobile(first, OK)
+    result = await service.send_bulk(RECIPIENTS, "Hola")
+    assert len(requests) == 1
+    assert result["sent"] == 0
+    assert result["failed_indexes"] == [0, 1]
+
+
+@pytest.mark.parametrize("first", [
+    httpx.ConnectError("refused"),
+    (503, {"code": "503", "message": "Unavailable"}),
+])
+async def test_single_send_is_retried_on_transient_errors(service, first):
+    service._request, requests = labsmobile(first, OK)
+    result = await service.send_single("3000000001", "Hola")
+    assert len(requests) == 2
+    assert result["success"]
+
+
+async def test_single_send_is_not_repeated_after_a_read_timeout(service):
+    service._request, requests = labsmobile(httpx.ReadTimeout("slow"), OK)
+    result = await service.send_single("3000000001", "Hola")
+    assert len(requests) == 1
+    assert not result["success"]
+    assert not result["retryable"]
@@ -0,0 +1,131 @@
+"""Write-behind status buffer on SQLite."""
+import pytest
+from sqlalchemy import select
+from models.idempotency import IdempotencyKey
+from models.message_log import MessageLog
+from services import status_buffer as status_buffer_module
+from services.idempotency_service import claim_recipients
+from services.status_buffer import StatusBuffer
+
+
+@pytest.fixture
+def buffer():
+    return StatusBuffer(flush_interval=60, max_pending=100, max_queued=100)
+
+
+@pytest.fixture
+async def batch(db):
+    """A WhatsApp batch of two pending recipients with their claims."""
+    for phone in ("+573000000001", "+573000000002"):
+        db.add(MessageLog(
+            recipient_name="Contact", recipient_phone=phone, message_content="Hola",
+            channel="whatsapp", status="pending", batch_id="batch-1"
+        ))
+    await db.commit()
+    await claim_recipients(db, "req-1", "whatsapp", ["573000000001", "573000000002"], batch_id="batch-1")
+    return "batch-1"
+
+
+async def log_statuses(db):
+    result = await db.execute(
+        select(MessageLog.recipient_phone, MessageLog.status, MessageLog.error_message)
+        .where(MessageLog.batch_id == "batch-1")
+        .order_by(MessageLog.recipient_phone)
+    )
+    return [tuple(row) for row in result]
+
+
+async def claim_statuses(db):
+    result = await db.execute(select(IdempotencyKey.recipient, IdempotencyKey.status))
+    return dict(result.all())
+
+
+@pytest.fixture
+def broken_database(monkeypatch):
+    """Make every flush fail until the returned callback is called."""
+    working = status_buffer_module.async_session
+
+    def unavailable():
+        raise ConnectionError("database unavailable")
+
+    monkeypatch.setattr(status_buffer_module, "async_session", unavailable)
+    return lambda: monkeypatch.setattr(status_buffer_module, "async_session", working)
+
+
+async def test_flush_writes_results_and_claims(db, buffer, batch):
+    await buffer.record_result(batch, "whatsapp", "+573000000001", "573000000001", True)
+    await buffer.record_result(batch, "whatsapp", "+573000000002", "573000000002", False, "Número inválido")
+    assert buffer.pending == 4
+    assert await buffer.flush() == 4
+    assert buffer.pending == 0
+    assert await log_statuses(db) == [
+        ("+573000000001", "sent", None),
+        ("+573000000002", "failed", "Número inválido"),
+    ]
+    assert await claim_statuses(db) == {"573000000001": "sent", "573000000002": "failed"}
+    assert await buffer.flush() == 0
+
+
+async def test_repeated_result_replaces_the_queued_one(db, buffer, batch):
+    await buffer.record_result(batch, "whatsapp", "+573000000001", None, False, "timeout")
+    await buffer.record_result(batch, "whatsapp", "+573000000001", None, True)
+    assert buffer.pending == 1
+    await buffer.flush()
+    assert (await log_statuses(db))[0] == ("+573000000001", "sent", None)
+
+
+async def test_logs_of_both_channels_are_inserted(db, buffer):
+    await buffer.add_log({
+        "recipient_name": "Ana", "recipient_phone": "+573000000001", "message_content": "Hola",
+        "channel": "whatsapp", "status": "sent", "batch_id": None
+    })
+    await buffer.add_log({
+        "recipient_name": "Beto", "recipient_phone": "+573000000002", "message_content": "Hola",
+        "channel": "sms", "status": "failed", "error_message": "Sin crédito", "attachments": []
+    })
+    await buffer.flush()
+    result = await db.execute(select(MessageLog.channel, MessageLog.status).order_by(MessageLog.id))
+    assert result.all() == [("whatsapp", "sent"), ("sms", "failed")]
+
+
+async def test_failed_flush_keeps_changes_and_newer_ones_win(db, buffer, batch, broken_database):
+    await buffer.record_result(batch, "whatsapp", "+573000000001", "573000000001", False, "timeout")
+    await buffer.record_result(batch, "whatsapp", "+573000000002", "573000000002", True)
+    with pytest.raises(ConnectionError):
+        await buffer.flush()
+    assert buffer.pending == 4
+
+    # A later callback for the same recipient arrives while the database is down
+    await buffer.record_result(batch, "whatsapp", "+573000000001", "573000000001", True)
+    assert buffer.pending == 4
+
+    broken_database()
+    assert await buffer.flush() == 4
+    assert [status for _, status, _ in await log_statuses(db)] == ["sent", "sent"]
+    assert await claim_statuses(db) == {"573000000001": "sent", "573000000002": "sent"}
+
+
+async def test_queue_is_bounded_while_the_database_is_down(db, broken_database):
+    buffer = StatusBuffer(flush_interval=60, max_pending=2, max_queued=3)
+    for i in range(3):
+        await buffer.add_log({"recipient_name": f"c{i}", "message_content": "Hola", "channel": "sms"})
+    # Past the cap the caller flushes itself and gets the database error
+    with pytest.raises(ConnectionError):
+        await buffer.add_log({"recipient_name": "c3", "message_content": "Hola", "channel": "sms"})
+    assert buffer.pending == 3
+
+    broken_database()
+    await buffer.add_log({"recipient_name": "c3", "message_content": "Hola", "channel": "sms"})
+    assert buffer.pending == 1
+    await buffer.flush()
+    result = await db.execute(select(MessageLog.recipient_name).order_by(MessageLog.id))
+    assert result.scalars().all() == ["c0", "c1", "c2", "c3"]
+
+
+async def test_stop_flushes_what_is_left(db, buffer):
+    buffer.start()
+    await buffer.add_log({"recipient_name": "Ana", "message_content": "Hola", "channel": "sms"})
+    await buffer.stop()
+    assert buffer.pending == 0
+    result = await db.execute(select(MessageLog.recipient_name))
+    assert result.scalars().all() == ["Ana"]
@@ -0,0 +1,93 @@
+"""TTLCache and TemplateCatalog."""
+import pytest
+from services import template_cache
+from services.template_cache import CompiledTemplate, TTLCache, TemplateCatalog
+
+
+@pytest.fixture(autouse=True)
+def fake_time(monkeypatch, clock):
+    monkeypatch.setattr(template_cache, "time", clock)
+
+
+def template(name, language="es_CO", status="APPROVED", template_id=None):
+    raw = {"id": template_id or f"{name}-{language}", "name": name, "language": language, "status": status}
+    return CompiledTemplate(raw=raw, parsed={}, body_variables=[], header_format=None)
+
+
+def test_ttl_cache_expires_entries(clock):
+    cache = TTLCache(ttl=60, negative_ttl=5)
+    cache.set("a", 1)
+    assert cache.get("a") == (True, 1)
+    clock.advance(60)
+    assert cache.get("a") == (False, None)
+    assert cache.stats() == {"entries": 0, "hits": 1, "misses": 1}
+
+
+def test_ttl_cache_negative_entries_use_their_own_ttl(clock):
+    cache = TTLCache(ttl=60, negative_ttl=5)
+    cache.set("missing", None)
+    assert cache.get("missing") == (True, None)
+    clock.advance(5)
+    assert cache.get("missing") == (False, None)
+
+
+def test_ttl_cache_zero_ttl_stores_nothing():
+    cache = TTLCache(ttl=60, negative_ttl=0)
+    cache.set("missing", None)
+    assert cache.get("missing") == (False, None)
+
+
+def test_ttl_cache_invalidate():
+    cache = TTLCache(ttl=60, negative_ttl=5)
+    cache.set(("template", "a"), 1)
+    cache.set(("template", "b"), 2)
+    cache.set(("other", "a"), 3)
+    assert cache.invalidate(lambda key: key[1] == "a") == 2
+    assert cache.get(("template", "b")) == (True, 2)
+    assert cache.invalidate() == 1
+
+
+def test_catalog_lookup_prefers_language():
+    catalog = TemplateCatalog()
+    catalog.replace([template("promo", "es_CO"), template("promo", "en_US")])
+    assert catalog.lookup("promo", "en_US").language == "en_US"
+    # Any language when the preferred one is missing
+    assert catalog.lookup("promo", "pt_BR").name == "promo"
+    assert catalog.lookup("unknown") is None
+    assert len(catalog) == 2
+
+
+def test_catalog_staleness(clock):
+    catalog = TemplateCatalog()
+    assert not catalog.loaded
+    assert catalog.is_stale(300)
+    catalog.replace([])
+    assert catalog.loaded
+    assert not catalog.is_stale(300)
+    clock.advance(300)
+    assert catalog.is_stale(300)
+
+
+def test_catalog_replace_drops_old_templates():
+    catalog = TemplateCatalog()
+    catalog.replace([template("old")])
+    catalog.replace([template("new")])
+    assert catalog.lookup("old") is None
+    assert set(catalog.by_id) == {"new-es_CO"}
+
+
+def test_catalog_upsert_and_remove():
+    catalog = TemplateCatalog()
+    catalog.replace([template("a")])
+    catalog.upsert(template("b", "en_US"))
+    assert catalog.lookup("b").language == "en_US"
+    catalog.remove("b")
+    assert catalog.lookup("b") is None
+    assert "b-en_US" not in catalog.by_id
+
+
+def test_catalog_list_filters_and_sorts():
+    catalog = TemplateCatalog()
+    catalog.replace([template("zeta"), template("alpha", status="PENDING"), template("beta")])
+    assert [t.name for t in catalog.list()] == ["alpha", "beta", "zeta"]
+    assert [t.name for t in catalog.list("APPROVED")] == ["beta", "zeta"]
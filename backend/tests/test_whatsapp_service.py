@@ -0,0 +1,117 @@
+"""WhatsApp service: template catalog sync and bulk send retries."""
+import httpx
+import pytest
+from config import get_settings
+from services import whatsapp_service as whatsapp_module
+from services.retry_policy import RetryPolicy
+from services.whatsapp_service import WhatsAppService
+
+
+@pytest.fixture
+def service(monkeypatch, clock):
+    monkeypatch.setattr(whatsapp_module, "time", clock)
+    service = WhatsAppService()
+    service.access_token = "token"
+    service.business_account_id = "waba"
+    return service
+
+
+def graph_response(status_code, **kwargs):
+    return httpx.Response(status_code, request=httpx.Request("GET", "https://graph.test"), **kwargs)
+
+
+async def test_failed_sync_is_not_repeated_on_every_lookup(service, clock):
+    calls = []
+
+    async def graph_request(method, url, **kwargs):
+        calls.append(kwargs.get("params", {}).get("name"))
+        return graph_response(502, text="<html>Bad gateway</html>")
+
+    service._graph_request = graph_request
+
+    first = await service.ensure_catalog()
+    assert not first["success"]
+    assert "HTTP 502" in first["error"]
+    second = await service.ensure_catalog()
+    assert not second["success"]
+    assert calls == [None]
+
+    clock.advance(service.settings.whatsapp_template_negative_cache_ttl)
+    await service.ensure_catalog()
+    assert calls == [None, None]
+
+
+async def test_sync_builds_catalog_from_every_page(service):
+    pages = {
+        None: {"data": [{"id": "1", "name": "a", "language": "es_CO", "components": []}],
+               "paging": {"next": "more", "cursors": {"after": "p2"}}},
+        "p2": {"data": [{"id": "2", "name": "b", "language": "es_CO", "components": []}], "paging": {}},
+    }
+
+    async def graph_request(method, url, **kwargs):
+        return graph_response(200, json=pages[kwargs["params"].get("after")])
+
+    service._graph_request = graph_request
+    result = await service.ensure_catalog()
+    assert result == {"success": True, "count": 2, "pages": 2}
+    assert service.catalog.lookup("b") is not None
+
+
+@pytest.fixture
+def bulk_service(monkeypatch):
+    """Service with two senders, a cached template and no retries of failed sends."""
+    monkeypatch.setattr(get_settings(), "whatsapp_phone_number_ids", "111,222")
+    service = WhatsAppService()
+    service.CIRCUIT_POLL_INTERVAL = 0.001
+    service.catalog.replace([service.compile_template(
+        {"id": "1", "name": "promo", "language": "es_CO", "components": [{"type": "BODY", "text": "Hola"}]}
+    )])
+    monkeypatch.setattr(whatsapp_module, "get_retry_policy", lambda: RetryPolicy(1, 0, 0))
+    return service
+
+
+CIRCUIT_OPEN = {"success": False, "error": "circuit open", "circuit_open": True, "retry_after": 0}
+
+
+async def test_open_circuit_rejections_do_not_use_attempts(bulk_service):
+    service = bulk_service
+    rejections = 0
+
+    async def dispatch(to_phone, **kwargs):
+        nonlocal rejections
+        if rejections < 6:
+            rejections += 1
+            return dict(CIRCUIT_OPEN)
+        return {"success": True, "message_id": f"wamid.{to_phone}"}
+
+    service.dispatch_template_message = dispatch
+    result = await service.send_bulk_template_messages(
+        [{"phone": f"300000000{i}"} for i in range(4)], "promo"
+    )
+    assert rejections == 6
+    assert result["sent"] == 4
+    assert [m["attempts"] for m in result["messages"]] == [1, 1, 1, 1]
+
+
+async def test_open_circuit_wait_is_bounded(bulk_service, monkeypatch):
+    service = bulk_service
+    monkeypatch.setattr(service.settings, "circuit_max_wait", 0.05)
+    calls = 0
+
+    async def dispatch(to_phone, **kwargs):
+        nonlocal calls
+        calls += 1
+        return dict(CIRCUIT_OPEN)
+
+    service.dispatch_template_message = dispatch
+    recipients = [{"phone": f"300000000{i}"} for i in range(4)]
+    result = await service.send_bulk_template_messages(recipients, "promo")
+    assert result["failed"] == 4
+    assert {m["error"] for m in result["messages"]} == {"circuit open"}
+    assert [m["attempts"] for m in result["messages"]] == [1, 1, 1, 1]
+
+    # The outage is still on: the next send fails at once
+    calls = 0
+    result = await service.send_bulk_template_messages(recipients, "promo")
+    assert result["failed"] == 4
+    assert calls == 4